@@ -8,6 +8,7 @@ class task(BaseModel):
     description: str = Field(..., description="Description of the task to be performed.")
     code_snippet: Optional[str] = Field(None, description="Code snippet to be analyzed. If no code is needed, it should be 'NO CODE'.")
     dependencies: Optional[str] = Field(default_factory=list, description="The dependencies. Only one tool can be specified:pythonExecutor, shellExecutor. If no dependency is needed it should be 'NO DEPENDENCY'.")
+    depends_on: List[str] = Field(default_factory=list, description="Ids of the earlier tasks whose outputs this task needs. Leave empty if the task can run on its own.")
     result: Optional[str] = Field(None, description="Result of the task after execution.")
     separator: str = Field(..., description="only return '|'")
 
@@ -17,7 +18,44 @@ class taskSpliterAIOutput(BaseModel):
 
 # Function to create task splitter output
 def create_task_splitter_output(tasks):
+    if isinstance(tasks, taskSpliterAIOutput):
+        return list(tasks.tasks)
     if isinstance(tasks, str):
         tasks = tasks.split('separator')
     return tasks
 
+# Function to build the dependency graph of a task list
+def build_task_graph(tasks):
+    """Returns, for each task, the indices of the earlier tasks it has to wait for.
+
+    Structured tasks use their `depends_on` ids; references to unknown or later tasks are
+    ignored, so the graph is always acyclic. Plain string tasks carry no dependency
+    information and keep running one after another, and so do all tasks when none of them
+    declares a dependency, since an omitted `depends_on` does not mean the steps are independent.
+    """
+    graph = []
+    index_by_id = {}
+    declared = any(isinstance(item, task) and item.depends_on for item in tasks)
+    for idx, item in enumerate(tasks):
+        if isinstance(item, task) and declared:
+            graph.append(sorted({index_by_id[dep] for dep in item.depends_on if dep in index_by_id}))
+            index_by_id[item.id] = idx
+        else:
+            graph.append([idx - 1] if idx > 0 else [])
+    return graph
+
+
+# Function to get the runnable code of a task
+def get_task_code(item):
+    """Returns the task's code snippet without markdown fences, or None if it has no code."""
+    if not isinstance(item, task) or not item.code_snippet:
+        return None
+    code = item.code_snippet.strip()
+    if code.startswith("```"):
+        code = code.split("\n", 1)[1] if "\n" in code else ""
+        if code.rstrip().endswith("```"):
+            code = code.rstrip()[:-3]
+    code = code.strip()
+    if not code or code.upper() == "NO CODE":
+        return None
+    return code
@@ -1,71 +1,120 @@
 import uuid
-from flask import Flask, render_template, request, session, send_file
+from flask import Flask, render_template, request, session, Response
 import os
-import io
-import zipfile
-from codeAI import CodeAIWorkflow
+import json
+from codeAI import CodeAIWorkflow, jobQueue, llmCache, statsIndexer, index_workspace_files
+from fileStats import load_stats, describe, SUPPORTED_FORMATS
+from workspaceManifest import get_manifest, detect_format
 from paperAI import PaperSummaryGenerator
+from workspaceManager import WorkspaceManager
+from zipStream import iter_zip, collect_files
+from chunkUpload import ChunkedUploadStore, UploadError
+from logStore import LogStore
+from workflowStorage import WorkflowStore
+from messageStore import MessageStore
+from metrics import REGISTRY
+from tools.shellChanged import is_allowed_command
+from llmClient import pool_stats
+from config import BACKGROUND_PROGRAMS, DATABASE_DIR, PROCESSING_SPACE_DIR, LOG_BUFFER_SIZE, LOG_SPILL, WORKFLOW_RETENTION_DAYS, MESSAGE_PAGE_SIZE
+from config import MESSAGE_HISTORY_LIMIT, MESSAGE_RETENTION_DAYS
 
 
 class DialogueManager:
-    def __init__(self, assistant):
+    def __init__(self, assistant, logs):
         self.assistant = assistant
+        self.logs = logs
 
     def process_user_input(self, user_input, conversation_history=""):
         response = None
         try:
-            # Create a new logs list for each request
-            request_logs = []
-            request_logs.append(f"User input {user_input} TO {self.assistant}\n")
-            response = self.assistant.run(request_logs, user_input)  # Changed from input to user_input
-            # Add any new logs to the global logs list
-            global logs
-            logs.extend(request_logs)
+            self.logs.append(f"User input {user_input} TO {self.assistant.name}")
+            response = self.assistant.run(self.logs, user_input)  # Changed from input to user_input
         except Exception as e:
             error_msg = f"处理过程中出错: {e}"
-            logs.append(error_msg)
+            self.logs.append(error_msg, level="ERROR")
             return error_msg
 
         return response
 
+    def stream_user_input(self, user_input):
+        """Yields ("log", record) and ("chunk", text) events while the assistant runs."""
+        cursor = self.logs.append(f"User input {user_input} TO {self.assistant.name}")["cursor"] - 1
+        store, session_id = self.logs.store, self.logs.session_id
+        try:
+            for res in self.assistant.run(self.logs, user_input, stream=True):
+                records, cursor = store.since(session_id, cursor)
+                for record in records:
+                    yield "log", record
+                text = res.content if hasattr(res, 'content') else str(res)
+                if text:
+                    yield "chunk", text
+        except Exception as e:
+            error_msg = f"处理过程中出错: {e}"
+            self.logs.append(error_msg, level="ERROR")
+            yield "chunk", error_msg
+        records, cursor = store.since(session_id, cursor)
+        for record in records:
+            yield "log", record
+
 app = Flask(__name__)
 convId = str(uuid.uuid4())  # Convert UUID to string here
-app.secret_key = convId  # Add this line after Flask initialization
-logs = ["系统初始化完成\n"]
+# 多进程部署时各 worker 必须共享同一个密钥，否则会话无法互通
+app.secret_key = os.environ.get("FLASK_SECRET_KEY") or convId
 
 # 构建文件路径
 current_dir = os.path.dirname(os.path.abspath(__file__))
 main_dir = os.path.dirname(current_dir)
-Codedb_file = os.path.join(main_dir, "Database", "CodeWorkflows.db")
-Paperdb_file = os.path.join(main_dir, "Database", "PaperWorkflows.db")
-processing_space_dir = os.path.join(main_dir, 'ProcessingSpace')
-WORKING_SPACE = os.path.join(processing_space_dir, convId)  
-app.config["WORKING_SPACE"] = WORKING_SPACE
-
-
-os.makedirs(WORKING_SPACE, exist_ok=True)
-os.chdir(WORKING_SPACE)
-if not os.path.exists(processing_space_dir):
-    os.makedirs(processing_space_dir)
-os.chdir(processing_space_dir)
-
-from phi.storage.workflow.sqlite import SqlWorkflowStorage
-paperai = PaperSummaryGenerator(
-    session_id=str(convId),
-    storage=SqlWorkflowStorage(
-        table_name=str(convId),
-        db_file=Paperdb_file,
-    ),
+Workflowdb_file = os.path.join(DATABASE_DIR, "Workflows.db")
+processing_space_dir = PROCESSING_SPACE_DIR
+
+# 每个浏览器会话拥有独立的工作目录，不再修改进程的 CWD
+workspaces = WorkspaceManager(processing_space_dir)
+uploads = ChunkedUploadStore()
+# 日志按会话保存在有界的环形缓冲区中，前端通过 /logs?since= 增量获取
+log_store = LogStore(
+    max_entries=LOG_BUFFER_SIZE,
+    spill_db=os.path.join(DATABASE_DIR, "Logs.db") if LOG_SPILL else None,
 )
-codeai = CodeAIWorkflow(
-    session_id=str(convId),
-    storage=SqlWorkflowStorage(
-        table_name=str(convId),
-        db_file=Codedb_file,
-    ),
+
+# 所有会话共用一张按 (workflow, session_id) 索引的表，不再每次启动新建一张表
+workflow_store = WorkflowStore(Workflowdb_file, retention_days=WORKFLOW_RETENTION_DAYS)
+# 对话历史保存在服务器端，cookie 中只保留会话 ID
+message_store = MessageStore(
+    os.path.join(DATABASE_DIR, "Messages.db"),
+    retention_days=MESSAGE_RETENTION_DAYS,
+    max_per_session=MESSAGE_HISTORY_LIMIT,
 )
-paperai_manager = DialogueManager(paperai)
-codeai_manager = DialogueManager(codeai)
+
+
+def create_session_managers(session_id, workspace):
+    paperai = PaperSummaryGenerator(
+        session_id=session_id,
+        storage=workflow_store.storage("paperai"),
+    )
+    codeai = CodeAIWorkflow(
+        session_id=session_id,
+        working_dir=str(workspace),
+        storage=workflow_store.storage("codeai"),
+    )
+    log_store.add(session_id, "系统初始化完成", stage="app")
+    return {
+        "paperai": DialogueManager(paperai, log_store.session_log(session_id, "paperai")),
+        "codeai": DialogueManager(codeai, log_store.session_log(session_id, "codeai")),
+    }
+
+
+def current_session_id():
+    if "workspace_id" not in session:
+        session["workspace_id"] = workspaces.new_session_id()
+    return session["workspace_id"]
+
+
+def current_workspace():
+    return workspaces.path(current_session_id())
+
+
+def current_managers():
+    return workspaces.get_state(current_session_id(), create_session_managers)
 
 
 
@@ -73,19 +122,16 @@ codeai_manager = DialogueManager(codeai)
 @app.route("/", methods=["GET", "POST"])
 def index():
     #lock here
-    if "messages" not in session:
-        session["messages"] = []
-    messages = session["messages"]
-    os.chdir(app.config["WORKING_SPACE"])
-    
+    # 旧版本把整段对话存在 cookie 中，这里顺便清掉
+    session.pop("messages", None)
+    managers = current_managers()
+
     if request.method == "POST":
         user_input = request.form.get("userInput")
         agent = request.form.get("agent")
         if user_input:
-            if agent == "paperai":
-                response = paperai_manager.process_user_input(user_input)
-            elif agent == "codeai":
-                response = codeai_manager.process_user_input(user_input)
+            if agent in managers:
+                response = managers[agent].process_user_input(user_input)
             else:
                 response = "未指定有效的 Agent。"
             
@@ -97,51 +143,242 @@ def index():
                 else:
                     reply = response.content if hasattr(response, 'content') else str(response)
                 
-                messages.append({"type": "user", "text": user_input})
-                messages.append({"type": "ai", "text": reply})
-                session["messages"] = messages
-    
-    return render_template("main.html", messages=messages, logs=logs) #unlock here
+                message_store.add_turn(current_session_id(), user_input, reply)
+
+    messages, has_more = message_store.page(current_session_id(), limit=MESSAGE_PAGE_SIZE)
 
+    # 只渲染最近的一段日志，更早的日志由前端按需通过 /logs 获取
+    logs = log_store.recent(current_session_id(), limit=100)
+    log_cursor = logs[-1]["cursor"] if logs else 0
+    return render_template("main.html", messages=messages, has_more=has_more, logs=logs, log_cursor=log_cursor) #unlock here
 
 
+@app.route("/stream", methods=["GET"])
+def stream():
+    """以 Server-Sent Events 的形式边生成边推送回复"""
+    user_input = request.args.get("userInput", "")
+    agent = request.args.get("agent")
+    managers = current_managers()
+    # 生成器在请求上下文之外运行，先取出会话 ID
+    session_id = current_session_id()
+
+    def sse(event, data):
+        payload = data if isinstance(data, dict) else {'text': data}
+        return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    def generate():
+        if not user_input or agent not in managers:
+            yield sse("chunk", "未指定有效的 Agent。")
+        else:
+            # 先发送一个注释行，让浏览器立即收到首字节
+            yield ": start\n\n"
+            reply = ""
+            try:
+                for event, text in managers[agent].stream_user_input(user_input):
+                    if event == "chunk":
+                        reply += text
+                    yield sse(event, text)
+            finally:
+                # 回复结束（或连接中断）后直接在服务器端保存本轮对话，无需前端回写
+                message_store.add_turn(session_id, user_input, reply)
+        yield sse("done", "")
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/messages", methods=["GET"])
+def get_messages():
+    """按游标分页返回对话历史：before 之前的最多 limit 条消息，按时间顺序排列"""
+    before = request.args.get("before", type=int)
+    limit = min(request.args.get("limit", MESSAGE_PAGE_SIZE, type=int), 200)
+    messages, has_more = message_store.page(current_session_id(), before=before, limit=limit)
+    return {"messages": messages, "before": messages[0]["id"] if messages else before, "has_more": has_more}, 200
+
+
+@app.route("/logs", methods=["GET"])
+def get_logs():
+    """返回当前会话中游标 since 之后的日志，以及下次请求使用的游标"""
+    since = request.args.get("since", 0, type=int)
+    limit = min(request.args.get("limit", 200, type=int), 1000)
+    records, cursor = log_store.since(current_session_id(), since, limit=limit)
+    return {"logs": records, "cursor": cursor}, 200
+
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    """规划类 Agent 响应缓存的条目数、大小与各 Agent 的命中/未命中次数"""
+    if llmCache is None:
+        return {"enabled": False}, 200
+    return {"enabled": True, **llmCache.stats()}, 200
+
+
+@app.route("/llm/pool", methods=["GET"])
+def llm_pool():
+    """共享 DeepSeek 连接池的上限、当前连接数，以及新建连接与复用长连接的请求数"""
+    return pool_stats(), 200
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus 格式的各阶段耗时直方图、重试次数、token 用量与工具退出状态（仅本进程）"""
+    return Response(REGISTRY.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 @app.route("/upload", methods=["POST"])
 def upload():
     logs = []
     uploaded_files = []
+    workspace = current_workspace()
 
     if "files" in request.files:
         uploaded_files_list = request.files.getlist("files")
         for file in uploaded_files_list:
             if file and file.filename:
                 filename = file.filename
-                file_save_path = os.path.join(str(app.config["WORKING_SPACE"]), filename)
+                file_save_path = os.path.join(str(workspace), os.path.basename(filename))
                 file.save(file_save_path)
                 uploaded_files.append(filename)
                 logs.append(f"文件 '{filename}' 已成功上传至 {file_save_path}")
+                log_store.add(current_session_id(), logs[-1], stage="upload")
+                index_workspace_files(str(workspace), file_save_path)
 
     return {"logs": logs, "uploaded_files": uploaded_files}, 200
 
+@app.route("/upload/init", methods=["POST"])
+def upload_init():
+    """创建分片上传，返回 upload_id 与分片大小"""
+    data = request.get_json(silent=True) or {}
+    try:
+        upload = uploads.create(
+            current_workspace(),
+            filename=data.get("filename"),
+            size=int(data.get("size", -1)),
+            chunk_size=data.get("chunk_size"),
+            sha256=data.get("sha256"),
+        )
+    except (UploadError, ValueError, TypeError) as e:
+        return {"error": str(e)}, 400
+    return upload, 201
+
+@app.route("/upload/<upload_id>", methods=["GET"])
+def upload_status(upload_id):
+    """查询已收到的分片，用于断点续传"""
+    try:
+        return uploads.status(current_workspace(), upload_id), 200
+    except UploadError as e:
+        return {"error": str(e)}, 404
+
+@app.route("/upload/<upload_id>/chunk/<int:index>", methods=["PUT"])
+def upload_chunk(upload_id, index):
+    try:
+        upload = uploads.write_chunk(
+            current_workspace(), upload_id, index, request.stream,
+            checksum=request.headers.get("X-Chunk-SHA256"),
+        )
+    except UploadError as e:
+        return {"error": str(e)}, 400
+    return {"index": index, "received": len(upload["received"]), "total_chunks": upload["total_chunks"]}, 200
+
+@app.route("/upload/<upload_id>/complete", methods=["POST"])
+def upload_complete(upload_id):
+    try:
+        data = request.get_json(silent=True) or {}
+        result = uploads.complete(current_workspace(), upload_id, sha256=data.get("sha256"))
+    except UploadError as e:
+        return {"error": str(e)}, 409
+    log_store.add(current_session_id(), f"文件 '{result['filename']}' 已成功上传至 {result['path']}", stage="upload")
+    index_workspace_files(str(current_workspace()), result["path"])
+    result["stats_pending"] = detect_format(result["filename"]) in SUPPORTED_FORMATS
+    return result, 200
+
+@app.route("/stats", methods=["GET"])
+def file_stats():
+    """返回工作目录中数据文件的统计信息（记录数、样本、contig 等），可用 ?path= 指定单个文件"""
+    session_id = current_session_id()
+    workspace = workspaces.path(session_id)
+    if request.args.get("path"):
+        try:
+            path = workspaces.resolve(session_id, request.args["path"])
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        stats = load_stats(str(path))
+        if stats is None:
+            # 统计失败的文件在修改之前不会重新计算，前端不必再轮询
+            if statsIndexer.failed(str(path)):
+                return {"error": "statistics could not be computed", "pending": False}, 422
+            return {"pending": statsIndexer.submit(str(path))}, 404
+        return {"path": request.args["path"], "summary": describe(stats), "stats": stats}, 200
+    files = {}
+    for entry in get_manifest(str(workspace)).refresh():
+        if detect_format(entry.path) in SUPPORTED_FORMATS:
+            stats = load_stats(str(workspace.joinpath(entry.path)))
+            files[entry.path] = describe(stats) if stats else None
+    return {"files": files}, 200
+
 @app.route("/download", methods=["GET"])
 def download():
-    """将 WORKING_SPACE 中的所有文件打包为 ZIP 并提供下载"""
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-        for root, _, files in os.walk(app.config["WORKING_SPACE"]):
-            for file in files:
-                file_path = os.path.join(root, file)
-                arcname = os.path.relpath(file_path, start=app.config["WORKING_SPACE"])
-                zip_file.write(file_path, arcname)
-    zip_buffer.seek(0)
-
-    return send_file(
-        zip_buffer,
-        as_attachment=True,
-        download_name="uploaded_files.zip",
+    """将当前会话工作目录中的文件边打包边下载，可用 ?files=a&files=b 只下载部分文件"""
+    session_id = current_session_id()
+    workspace = workspaces.path(session_id)
+    try:
+        selected = [str(workspaces.resolve(session_id, name)) for name in request.args.getlist("files")]
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    return Response(
+        iter_zip(collect_files(str(workspace), selected)),
         mimetype="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="uploaded_files.zip"'},
     )
 
+def session_job(job_id):
+    """只返回属于当前会话工作目录的任务"""
+    job = jobQueue.status(job_id)
+    if job is None or job["cwd"] != str(current_workspace()):
+        return None
+    return job
+
+@app.route("/jobs", methods=["GET", "POST"])
+def jobs():
+    """提交后台任务，或列出当前会话最近的任务"""
+    if request.method == "POST":
+        data = request.get_json(silent=True) or {}
+        command = data.get("command")
+        if not command:
+            return {"error": "missing command"}, 400
+        # 只接受调用 BACKGROUND_PROGRAMS 中程序的命令，不允许借此执行任意 shell 命令
+        if not is_allowed_command(command, BACKGROUND_PROGRAMS):
+            return {"error": f"only commands running {', '.join(BACKGROUND_PROGRAMS)} can be submitted"}, 403
+        job_id = jobQueue.submit(command, cwd=str(current_workspace()))
+        return {"job_id": job_id}, 202
+    limit = request.args.get("limit", 50, type=int)
+    return {"jobs": jobQueue.list_jobs(limit=limit, cwd=str(current_workspace()))}, 200
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = session_job(job_id)
+    if job is None:
+        return {"error": "job not found"}, 404
+    return job, 200
+
+@app.route("/jobs/<job_id>/cancel", methods=["POST"])
+def job_cancel(job_id):
+    if session_job(job_id) is None:
+        return {"error": "job not found"}, 404
+    # 任务在其他进程中运行时只能先登记取消请求，由所属进程稍后终止
+    result = jobQueue.cancel(job_id)
+    return {"cancelled": result == "cancelled", "pending": result == "pending"}, 200
+
+@app.route("/jobs/<job_id>/log", methods=["GET"])
+def job_log(job_id):
+    if session_job(job_id) is None:
+        return {"error": "job not found"}, 404
+    log = jobQueue.tail(job_id, lines=request.args.get("lines", 100, type=int))
+    return Response(log, mimetype="text/plain")
+
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=8080, debug=True)
+    app.run(host='0.0.0.0', port=8080, debug=True, threaded=True)
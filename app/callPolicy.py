@@ -0,0 +1,293 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, Optional
+
+import httpx
+import openai
+from phi.agent import Agent, RunResponse
+from phi.utils.log import logger
+
+from config import (LLM_DEADLINE, LLM_RETRIES, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX, LLM_HEDGE_PERCENTILE,
+                    LLM_BREAKER_FAILURES, LLM_BREAKER_RESET)
+from metrics import REGISTRY
+
+LLM_CALLS = REGISTRY.counter(
+    "infinity_llm_calls_total", "LLM call attempts by agent and outcome.", ("agent", "outcome"))
+
+_DEFAULT = object()
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the provider while the circuit breaker is open."""
+
+
+class CallTimeout(TimeoutError):
+    pass
+
+
+def is_retryable(error: Exception) -> bool:
+    """Timeouts, connection errors and 408/409/429/5xx answers are retried.
+
+    Other errors (4xx answers, response model validation, exceptions from tools or our own
+    code) are raised at once and do not count as provider failures.
+    """
+    if isinstance(error, (CallTimeout, openai.APITimeoutError, openai.APIConnectionError, httpx.TransportError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive provider failures and rejects calls for
+    `reset_timeout` seconds; then lets one trial call through, which closes or reopens it."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half-open" if self._trial else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if not self._trial and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._trial = True
+                return True
+            return False
+
+    def release(self) -> None:
+        """Gives back a half-open trial that ended without telling anything about the provider."""
+        with self._lock:
+            self._trial = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._trial:
+                    logger.warning(f"LLM circuit breaker opened after {self._failures} failures")
+                self._opened_at = time.monotonic()
+                self._trial = False
+
+
+def copy_agent(agent: Agent) -> Agent:
+    """Copy of `agent` with its own memory and model, for runs that may overlap or be abandoned.
+
+    Unlike `Agent.deep_copy`, tools are shared rather than deep-copied, since they hold the
+    process-wide kernel pool and job queue.
+    """
+    return agent.model_copy(update={"memory": agent.memory.deep_copy(), "model": agent.model.deep_copy()})
+
+
+class CallPolicy:
+    """Deadlines, jittered exponential backoff, hedging and circuit breaking around `Agent.run`.
+
+    Each attempt gets `deadline` seconds; retryable failures are retried up to `retries` times
+    after a full-jitter backoff of up to `backoff_base * 2**attempt` (at most `backoff_max`)
+    seconds. When `hedge_percentile` is set and an attempt is still running after that
+    percentile of the agent's recent latencies, a duplicate request is sent and the first
+    answer wins. All agents share one circuit breaker, since they share one provider.
+
+    Abandoned attempts keep running in the background until the HTTP client's own timeout
+    ends them; their results are discarded.
+    """
+
+    def __init__(self, deadline: Optional[float] = 180, retries: int = 2, backoff_base: float = 1.0,
+                 backoff_max: float = 20, hedge_percentile: Optional[float] = 95, hedge_min_samples: int = 20,
+                 breaker: Optional[CircuitBreaker] = None, max_workers: int = 32):
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker()
+        self._latencies: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-call")
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter delay before retry number `attempt` (1-based)."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _record_latency(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self._latencies.setdefault(name, deque(maxlen=200)).append(seconds)
+
+    def hedge_delay(self, name: str) -> Optional[float]:
+        if not self.hedge_percentile:
+            return None
+        with self._lock:
+            samples = sorted(self._latencies.get(name, ()))
+        if len(samples) < self.hedge_min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * self.hedge_percentile / 100))]
+
+    def _not_retried(self, name: str, error: Exception) -> None:
+        if isinstance(error, openai.APIStatusError):
+            # 服务端已经给出了明确的答复，不算作故障
+            self.breaker.record_success()
+        else:
+            # 校验失败、工具或本地代码的异常与服务商无关，只交还半开状态的试探名额
+            self.breaker.release()
+        LLM_CALLS.inc(agent=name, outcome="error")
+
+    def run(self, name: str, agent: Agent, message: str, hedge: bool = True, deadline=_DEFAULT,
+            retries: Optional[int] = None, side_effects: bool = False, **kwargs) -> RunResponse:
+        """Returns `agent.run(message, **kwargs)` under the policy; raises the last error when all attempts fail.
+
+        Pass `hedge=False` for agents whose tools must not run twice, and `deadline=None` for
+        agents whose runs include long tool executions. `side_effects=True` implies both and
+        also stops retrying once the agent has called a tool.
+        """
+        if side_effects:
+            hedge, deadline = False, None
+        deadline = self.deadline if deadline is _DEFAULT else deadline
+        retries = self.retries if retries is None else retries
+        last_error: Optional[Exception] = None
+        for attempt in range(retries + 1):
+            if attempt:
+                time.sleep(self.backoff(attempt))
+            if not self.breaker.allow():
+                LLM_CALLS.inc(agent=name, outcome="circuit_open")
+                raise CircuitOpenError(f"LLM provider unavailable, {name} call rejected by the circuit breaker")
+            try:
+                response = self._attempt(name, agent, message, hedge, deadline, kwargs)
+            except Exception as e:
+                if not is_retryable(e):
+                    self._not_retried(name, e)
+                    raise
+                self.breaker.record_failure()
+                last_error = e
+                LLM_CALLS.inc(agent=name, outcome="timeout" if isinstance(e, CallTimeout) else "retryable_error")
+                if side_effects and agent.model.function_call_stack:
+                    # 工具已经执行过，重试会把它们再执行一遍
+                    raise
+                logger.warning(f"{name} call failed (attempt {attempt + 1}/{retries + 1}): {e}")
+                continue
+            self.breaker.record_success()
+            LLM_CALLS.inc(agent=name, outcome="ok")
+            return response
+        raise last_error
+
+    def _attempt(self, name: str, agent: Agent, message: str, hedge: bool, deadline: Optional[float],
+                 kwargs: dict) -> RunResponse:
+        hedge_after = self.hedge_delay(name) if hedge else None
+        if deadline is None and hedge_after is None:
+            started = time.monotonic()
+            response = agent.run(message, **kwargs)
+            self._record_latency(name, time.monotonic() - started)
+            return response
+
+        def call(copy: Agent):
+            started = time.monotonic()
+            response = copy.run(message, **kwargs)
+            self._record_latency(name, time.monotonic() - started)
+            return copy, response
+
+        started = time.monotonic()
+        end = started + deadline if deadline is not None else None
+        running = {self._pool.submit(call, copy_agent(agent))}
+        hedged = False
+        last_error: Optional[BaseException] = None
+        while running:
+            timeout = None if end is None else max(0.0, end - time.monotonic())
+            if not hedged and hedge_after is not None:
+                until_hedge = max(0.0, started + hedge_after - time.monotonic())
+                timeout = until_hedge if timeout is None else min(timeout, until_hedge)
+            done, running = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    copy, response = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                # 采用先返回的结果，并把它的对话历史写回原 Agent
+                agent.memory = copy.memory
+                agent.run_response = copy.run_response
+                if hedged:
+                    LLM_CALLS.inc(agent=name, outcome="hedge_won" if future is not first else "hedge_lost")
+                return response
+            if done:
+                continue
+            if not hedged and hedge_after is not None and time.monotonic() - started >= hedge_after:
+                hedged = True
+                first = next(iter(running))
+                logger.info(f"{name} call slower than {hedge_after:.1f}s, sending a hedged request")
+                running.add(self._pool.submit(call, copy_agent(agent)))
+                continue
+            if end is not None and time.monotonic() >= end:
+                raise CallTimeout(f"{name} call did not finish within {deadline}s")
+        raise last_error
+
+    def stream(self, name: str, agent: Agent, message: str, retries: Optional[int] = None,
+               **kwargs) -> Iterator[RunResponse]:
+        """Yields `agent.run(message, stream=True)` chunks; retried only until the first chunk arrived.
+
+        Streams are bounded by the HTTP client's read timeout instead of a total deadline.
+        """
+        retries = self.retries if retries is None else retries
+        for attempt in range(retries + 1):
+            if attempt:
+                time.sleep(self.backoff(attempt))
+            if not self.breaker.allow():
+                LLM_CALLS.inc(agent=name, outcome="circuit_open")
+                raise CircuitOpenError(f"LLM provider unavailable, {name} call rejected by the circuit breaker")
+            started = False
+            finished = False
+            try:
+                for chunk in agent.run(message, stream=True, **kwargs):
+                    started = True
+                    yield chunk
+                finished = True
+            except Exception as e:
+                finished = True
+                if not is_retryable(e):
+                    self._not_retried(name, e)
+                    raise
+                self.breaker.record_failure()
+                LLM_CALLS.inc(agent=name, outcome="retryable_error")
+                if started or attempt == retries:
+                    raise
+                logger.warning(f"{name} stream failed before the first chunk (attempt {attempt + 1}/{retries + 1}): {e}")
+                continue
+            finally:
+                if not finished:
+                    # 客户端中途断开（GeneratorExit）时已经收到过内容，说明服务可用；
+                    # 必须记下结果，否则半开状态的试探名额不会归还，熔断器会一直拒绝调用
+                    self.breaker.record_success()
+                    LLM_CALLS.inc(agent=name, outcome="cancelled")
+            self.breaker.record_success()
+            LLM_CALLS.inc(agent=name, outcome="ok")
+            return
+
+
+# One policy for every DeepSeek call in this process, so the circuit breaker sees all of them
+llmPolicy = CallPolicy(
+    deadline=LLM_DEADLINE or None,
+    retries=LLM_RETRIES,
+    backoff_base=LLM_BACKOFF_BASE,
+    backoff_max=LLM_BACKOFF_MAX,
+    hedge_percentile=LLM_HEDGE_PERCENTILE or None,
+    breaker=CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET),
+)
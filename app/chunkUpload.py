@@ -0,0 +1,170 @@
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+UPLOAD_DIR = ".uploads"
+_UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class UploadError(Exception):
+    pass
+
+
+class ChunkedUploadStore:
+    """Resumable uploads made of fixed-size chunks, with the ledger kept on disk.
+
+    Each upload lives in `<workspace>/.uploads/<upload_id>/`: `meta.json` describes the file,
+    `data.part` is preallocated to the final size and every chunk is written at its own
+    offset, and `chunks/<index>` records the SHA-256 of each chunk that arrived. Chunks can
+    therefore be sent in parallel, by any worker process, and an interrupted upload resumes
+    by asking which chunks are still missing.
+    """
+
+    def __init__(self, default_chunk_size: int = 8 * 1024 * 1024, max_chunk_size: int = 64 * 1024 * 1024,
+                 max_age: float = 7 * 24 * 3600, max_size: int = 1024 ** 4):
+        self.default_chunk_size = default_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.max_age = max_age
+        self.max_size = max_size
+
+    def _dir(self, workspace: Path, upload_id: str) -> Path:
+        if not _UPLOAD_ID.match(upload_id or ""):
+            raise UploadError(f"Invalid upload id: {upload_id}")
+        return Path(workspace).joinpath(UPLOAD_DIR, upload_id)
+
+    def create(self, workspace: Path, filename: str, size: int, chunk_size: Optional[int] = None,
+               sha256: Optional[str] = None) -> dict:
+        filename = os.path.basename(filename or "")
+        if not filename or filename.startswith("."):
+            raise UploadError("Invalid file name")
+        if size < 0 or size > self.max_size:
+            raise UploadError(f"Invalid file size, uploads are limited to {self.max_size} bytes")
+        chunk_size = int(chunk_size or self.default_chunk_size)
+        if chunk_size <= 0:
+            raise UploadError("Invalid chunk size")
+        chunk_size = min(chunk_size, self.max_chunk_size)
+        self.cleanup(workspace)
+
+        upload_id = uuid.uuid4().hex
+        upload_dir = self._dir(workspace, upload_id)
+        upload_dir.joinpath("chunks").mkdir(parents=True)
+        with open(upload_dir.joinpath("data.part"), "wb") as f:
+            f.truncate(size)
+        meta = {
+            "upload_id": upload_id,
+            "filename": filename,
+            "size": size,
+            "chunk_size": chunk_size,
+            "total_chunks": max(1, math.ceil(size / chunk_size)),
+            "sha256": sha256.lower() if sha256 else None,
+            "created_at": time.time(),
+        }
+        upload_dir.joinpath("meta.json").write_text(json.dumps(meta))
+        return self.status(workspace, upload_id)
+
+    def status(self, workspace: Path, upload_id: str) -> dict:
+        upload_dir = self._dir(workspace, upload_id)
+        if not upload_dir.joinpath("meta.json").exists():
+            raise UploadError(f"Upload not found: {upload_id}")
+        meta = json.loads(upload_dir.joinpath("meta.json").read_text())
+        meta["received"] = sorted(int(name) for name in os.listdir(upload_dir.joinpath("chunks")) if name.isdigit())
+        return meta
+
+    def write_chunk(self, workspace: Path, upload_id: str, index: int, stream: BinaryIO,
+                    checksum: Optional[str] = None) -> dict:
+        """Writes chunk `index` read from `stream`, verifying its length and optional SHA-256."""
+        meta = self.status(workspace, upload_id)
+        if index < 0 or index >= meta["total_chunks"]:
+            raise UploadError(f"Chunk index out of range: {index}")
+        offset = index * meta["chunk_size"]
+        expected = min(meta["chunk_size"], meta["size"] - offset)
+
+        upload_dir = self._dir(workspace, upload_id)
+        digest = hashlib.sha256()
+        written = 0
+        with open(upload_dir.joinpath("data.part"), "r+b") as f:
+            f.seek(offset)
+            while written < expected:
+                data = stream.read(min(1024 * 1024, expected - written))
+                if not data:
+                    break
+                digest.update(data)
+                f.write(data)
+                written += len(data)
+        if written == expected and stream.read(1):
+            raise UploadError(f"Chunk {index} is larger than {expected} bytes")
+        if written != expected:
+            raise UploadError(f"Chunk {index} has {written} bytes, expected {expected}")
+        if checksum and digest.hexdigest() != checksum.lower():
+            raise UploadError(f"Checksum mismatch for chunk {index}")
+
+        # 写入完成后才记录该分片，保证账本中的分片都是完整的
+        marker = upload_dir.joinpath("chunks", str(index))
+        tmp_marker = marker.with_name(f".{index}.{uuid.uuid4().hex}")
+        tmp_marker.write_text(digest.hexdigest())
+        os.replace(tmp_marker, marker)
+        return self.status(workspace, upload_id)
+
+    def complete(self, workspace: Path, upload_id: str, sha256: Optional[str] = None) -> dict:
+        """Checks that every chunk arrived intact and the file checksum matches, then moves the file in place.
+
+        The file's SHA-256 is compared with `sha256`, or with the one given at creation. Each
+        chunk is also re-hashed and compared with the digest recorded when it arrived, so a
+        chunk overwritten or damaged on disk is caught even when no file checksum is known.
+        The whole-file digest is returned either way.
+        """
+        meta = self.status(workspace, upload_id)
+        missing = sorted(set(range(meta["total_chunks"])) - set(meta["received"]))
+        if missing:
+            raise UploadError(f"Missing chunks: {missing[:20]}")
+
+        upload_dir = self._dir(workspace, upload_id)
+        part_file = upload_dir.joinpath("data.part")
+        digest = hashlib.sha256()
+        damaged = []
+        with open(part_file, "rb") as f:
+            for index in range(meta["total_chunks"]):
+                chunk_digest = hashlib.sha256()
+                remaining = min(meta["chunk_size"], meta["size"] - index * meta["chunk_size"])
+                while remaining > 0:
+                    block = f.read(min(4 * 1024 * 1024, remaining))
+                    if not block:
+                        break
+                    digest.update(block)
+                    chunk_digest.update(block)
+                    remaining -= len(block)
+                if chunk_digest.hexdigest() != upload_dir.joinpath("chunks", str(index)).read_text().strip():
+                    damaged.append(index)
+        if damaged:
+            # 删除损坏分片的记录，客户端续传时会重新发送这些分片
+            for index in damaged:
+                upload_dir.joinpath("chunks", str(index)).unlink(missing_ok=True)
+            raise UploadError(f"Damaged chunks: {damaged[:20]}, upload them again")
+        expected = (sha256 or meta["sha256"] or "").lower()
+        if expected and digest.hexdigest() != expected:
+            raise UploadError("File checksum mismatch, upload it again")
+
+        target = Path(workspace).joinpath(meta["filename"])
+        os.replace(part_file, target)
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        return {"filename": meta["filename"], "path": str(target), "size": meta["size"], "sha256": digest.hexdigest()}
+
+    def cleanup(self, workspace: Path) -> None:
+        """Removes uploads that were abandoned for longer than `max_age` seconds."""
+        root = Path(workspace).joinpath(UPLOAD_DIR)
+        if not root.exists():
+            return
+        now = time.time()
+        for upload_dir in root.iterdir():
+            # 分片目录的修改时间即最后一次收到分片的时间
+            chunks_dir = upload_dir.joinpath("chunks")
+            last_activity = (chunks_dir if chunks_dir.exists() else upload_dir).stat().st_mtime
+            if now - last_activity > self.max_age:
+                shutil.rmtree(upload_dir, ignore_errors=True)
@@ -3,28 +3,78 @@ from phi.agent import Agent
 from phi.workflow import Workflow, RunResponse, RunEvent
 from phi.utils.log import logger
 from phi.model.openai.like import OpenAILike
-from phi.tools.shell import ShellTools
-from phi.tools.python import PythonTools
-from config import API_KEY
+from config import MAX_PARALLEL_TASKS, DIRECT_EXECUTION, DATABASE_DIR, BACKGROUND_PROGRAMS, JOB_WORKERS, JOB_LEASE
+from config import LLM_CACHE, LLM_CACHE_ENTRIES, LLM_CACHE_MAX_MB
+from config import PYTHON_KERNELS, KERNEL_PRELOAD, KERNEL_SPARES, MAX_KERNELS, KERNEL_IDLE_TIMEOUT, AUTO_INDEX, UI_HISTORY_TOKENS
 # from phi.tools.file import FileTools
 from tools.fileChanged import FileTools
 from tools.shellChanged import ShellTools
+from tools.pythonChanged import PythonTools
+from jobQueue import JobQueue
+from llmCache import LLMCache
+from metrics import span
+from callPolicy import llmPolicy, copy_agent
+from historyManager import BudgetedMemory
+from pythonKernel import KernelPool
+from workspaceManifest import get_manifest
+from fileStats import StatsIndexer, stats_summary
+from indexBuilder import IndexBuilder, index_summary
 from phi.utils.pprint import pprint_run_response
 import os
-from typing import Iterator
+import time
+from pathlib import Path
+from typing import Iterator, Optional
 import uuid
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from StructureOutput import *
-from phi.model.deepseek import DeepSeekChat
+from llmClient import deepseek_chat
 
 
-# Get the API key from environment variables OR set your API key here
-API = os.environ.get('DEEPSEEK_API_KEY') or API_KEY
 database_dir = "./../Database"
 user_session_id = str(uuid.uuid4())
 
+# 以下对象的后台线程都在第一次使用时才启动：debug 模式下 Werkzeug 的重载父进程也会导入本模块，
+# 它不处理请求，不应运行任务、预热解释器或重复建立索引
+
+# Background queue for long-running bioinformatics commands
+jobQueue = JobQueue(db_file=os.path.join(DATABASE_DIR, "Jobs.db"), max_workers=JOB_WORKERS, lease=JOB_LEASE)
+
+# Warm per-session Python interpreters, so imports and loaded data survive between tasks
+kernelPool = KernelPool(
+    preload=KERNEL_PRELOAD,
+    spare=KERNEL_SPARES,
+    max_kernels=MAX_KERNELS,
+    idle_timeout=KERNEL_IDLE_TIMEOUT,
+) if PYTHON_KERNELS else None
+
+# Sidecar statistics (record counts, samples, contigs) computed once per data file
+statsIndexer = StatsIndexer()
+
+# Missing genome indexes are built once in the background instead of inside every plan
+indexBuilder = IndexBuilder() if AUTO_INDEX else None
+
+
+def index_workspace_files(root: str, path: Optional[str] = None) -> None:
+    """Queues statistics and index builds for `path`, or for every file below `root`."""
+    if path is not None:
+        statsIndexer.submit(path)
+        if indexBuilder is not None:
+            indexBuilder.submit(path)
+        return
+    statsIndexer.index_workspace(root)
+    if indexBuilder is not None:
+        indexBuilder.index_workspace(root)
+
+# Opt-in response cache for the planning agents, shared by all sessions
+llmCache = LLMCache(
+    db_file=os.path.join(DATABASE_DIR, "LLMCache.db"),
+    max_entries=LLM_CACHE_ENTRIES,
+    max_bytes=LLM_CACHE_MAX_MB * 1024 * 1024,
+) if LLM_CACHE else None
+
 # User Interface Communicator Agent
 userInterfaceCommunicator = Agent(
-    model=DeepSeekChat(api_key=API),
+    model=deepseek_chat(),
     description="An AI assistant that converts user requests into the execute task list.",
     instruction=[
         "The following tools and libraries are available in the environment: raxml-ng, modeltest, mafft, CPSTools, vcftools, gatk, biopython, pandas, numpy, scipy, matplotlib, seaborn, scikit-learn, HTSeq, PyVCF, pysam, samtools, bwa, snpeff, wget, curl, bzip2, ca-certificates, libglib2.0-0, libx11-6, libsm6, libxi6, python3.10.",
@@ -33,13 +83,14 @@ userInterfaceCommunicator = Agent(
         "Don't check the tools and libraries, all the tools and libraries are available in the environment.",
     ],
     add_history_to_messages=True,
+    memory=BudgetedMemory(token_budget=UI_HISTORY_TOKENS),
     markdown=True,
     arbitrary_types_allowed=True
 )
 
 # Task Splitter Agent
 taskSpliter = Agent(
-    model=DeepSeekChat(api_key=API),
+    model=deepseek_chat(),
     description="An AI assistant that converts user requests into executable tasks.",
     instruction=[
         "For each task analyze and decide whether it needs Python (data processing, analysis, visualization, save the python file to local) or Shell (command line tools, file operations) execution.",
@@ -47,43 +98,48 @@ taskSpliter = Agent(
         "The following tools and libraries are available in the environment: raxml-ng, modeltest, mafft, CPSTools, vcftools, gatk, phidata, biopython, pandas, numpy, scipy, matplotlib, seaborn, scikit-learn, HTSeq, PyVCF, pysam, samtools, bwa, snpeff, wget, curl, bzip2, ca-certificates, libglib2.0-0, libx11-6, libxext6, libsm6, libxi6, python3.10.",
         "Don't check the tools and libraries, all the tools and libraries are available in the environment.",
         "if the task is no task, return 'NO TASK' in your reply.",
+        "Fill depends_on with the ids of the earlier tasks whose outputs a task needs, so that independent tasks can run in parallel.",
     ],
     add_history_to_messages=False,
     arbitrary_types_allowed=True,
     response_model=taskSpliterAIOutput
 )
 
-# Python Executor Agent
-pythonExcutor = Agent(
-    tools=[PythonTools(), FileTools()],
-    model=DeepSeekChat(api_key=API),
-    description="Executes Python-based tasks with focus on data processing, analysis and visualization",
-    instruction=[
-        "Focus on generating clean, efficient Python code.",
-        "Always include proper error handling and input validation.",
-        "Prefer pandas for data manipulation, matplotlib/seaborn for visualization.",
-        "Use biopython for sequence analysis tasks.",
-        "Return detailed execution results and any generated file paths."
-    ],
-    add_history_to_messages=False,
-)
+# Python Executor Agent, with tools bound to the session workspace
+def create_python_executor(base_dir: Optional[str] = None) -> Agent:
+    return Agent(
+        tools=[PythonTools(base_dir=base_dir, kernel_pool=kernelPool), FileTools(base_dir=Path(base_dir) if base_dir else None)],
+        model=deepseek_chat(),
+        description="Executes Python-based tasks with focus on data processing, analysis and visualization",
+        instruction=[
+            "Focus on generating clean, efficient Python code.",
+            "Always include proper error handling and input validation.",
+            "Prefer pandas for data manipulation, matplotlib/seaborn for visualization.",
+            "Use biopython for sequence analysis tasks.",
+            "Return detailed execution results and any generated file paths.",
+            "Variables and loaded data are kept between runs in this session, so reuse them instead of reading files again.",
+        ],
+        add_history_to_messages=False,
+    )
 
-# Shell Executor Agent
-shellExcutor = Agent(
-    tools=[ShellTools()],
-    model=DeepSeekChat(api_key=API),
-    description="Executes shell commands for tools with proper error handling",
-    instruction=[
-        "You are a shell command execution specialist.",
-        "Generate proper command lines for the tools you have.",
-        "Always validate input files existence before execution.",
-        "Include error handling and status checks.",
-        "Use appropriate flags and parameters for each tool.",
-        "Return command output and generated file paths.",
-        "Commands should be provided as single, complete strings within a list, e.g., [\"command\"], rather than split into separate elements like [\"software\", \"parameters1\"].",
-    ],
-    add_history_to_messages=False
-)
+# Shell Executor Agent, with tools bound to the session workspace
+def create_shell_executor(base_dir: Optional[str] = None) -> Agent:
+    return Agent(
+        tools=[ShellTools(base_dir=base_dir, job_queue=jobQueue, background_programs=BACKGROUND_PROGRAMS)],
+        model=deepseek_chat(),
+        description="Executes shell commands for tools with proper error handling",
+        instruction=[
+            "You are a shell command execution specialist.",
+            "Generate proper command lines for the tools you have.",
+            "Always validate input files existence before execution.",
+            "Include error handling and status checks.",
+            "Use appropriate flags and parameters for each tool.",
+            "Return command output and generated file paths.",
+            "Commands should be provided as single, complete strings within a list, e.g., [\"command\"], rather than split into separate elements like [\"software\", \"parameters1\"].",
+            "Long-running tools are submitted to a background job queue; when a command returns a job id, report the job id instead of waiting for results.",
+        ],
+        add_history_to_messages=False
+    )
 
 
 
@@ -91,34 +147,131 @@ shellExcutor = Agent(
 
 class CodeAIWorkflow(Workflow):
 
-    user_interface: Agent = Field(default_factory=lambda: userInterfaceCommunicator)
-    task_splitter: Agent = Field(default_factory=lambda: taskSpliter)
-    pythonExcutor: Agent = Field(default_factory=lambda: pythonExcutor)
-    shellExcutor: Agent = Field(default_factory=lambda: shellExcutor)
+    # Workspace the tasks run in; None means the process working directory
+    working_dir: Optional[str] = None
+
+    # Each workflow gets its own agents so sessions never share history or run state
+    user_interface: Agent = Field(default_factory=lambda: userInterfaceCommunicator.deep_copy())
+    task_splitter: Agent = Field(default_factory=lambda: taskSpliter.deep_copy())
+    pythonExcutor: Optional[Agent] = None
+    shellExcutor: Optional[Agent] = None
+
+    def model_post_init(self, __context) -> None:
+        if self.pythonExcutor is None:
+            self.pythonExcutor = create_python_executor(self.working_dir)
+        if self.shellExcutor is None:
+            self.shellExcutor = create_shell_executor(self.working_dir)
+        super().model_post_init(__context)
+
+    def _run_planner(self, name: str, agent: Agent, message: str) -> RunResponse:
+        if llmCache is None:
+            return llmPolicy.run(name, agent, message)
+        return llmCache.run(name, agent, message, runner=lambda agent, message: llmPolicy.run(name, agent, message))
+
+    def _execute_task(self, task):
+        """Runs one task and returns (result, status), exporting its duration as a stage span."""
+        with span("codeai", "python_task" if 'pythonExecutor' in str(task) else "shell_task") as stage:
+            result, status = self._run_task(task, stage)
+            stage.status = status.lower().replace(" ", "_")
+            return result, status
+
+    def _run_task(self, task, stage):
+        """Runs one task and returns (result, status).
 
-    def run(self, logs: list, user_input: str) -> Iterator[RunResponse]:
+        Tasks that already carry a code snippet are run directly with the executor's tool;
+        the executor agent is only asked when there is no snippet or the direct run failed.
+        """
+        task_text = str(task)
+        is_python = 'pythonExecutor' in task_text
+        executor = self.pythonExcutor if is_python else self.shellExcutor
+
+        code = get_task_code(task) if DIRECT_EXECUTION else None
+        if code:
+            try:
+                if is_python:
+                    tool = next(t for t in executor.tools if isinstance(t, PythonTools))
+                    output = tool.save_to_file_and_run(f"task_{task.id}.py", code)
+                else:
+                    tool = next(t for t in executor.tools if isinstance(t, ShellTools))
+                    output = tool.run_shell_command([code])
+                if output.startswith("Submitted background job"):
+                    return f"Output (direct): {output}", "Submitted"
+                if not output.startswith("Error"):
+                    return f"Output (direct): {output}", "Success"
+                logger.warning(f"Direct execution of task {task.id} failed, falling back to agent")
+                stage.retries += 1
+                task_text += f"\nDirect execution of the code snippet failed with:\n{output}\nFix the problem and run the task again."
+            except Exception as e:
+                logger.warning(f"Direct execution of task {task.id} failed: {e}")
+                stage.retries += 1
+
+        # Agents keep per-run state, so concurrent tasks must not share one instance
+        executor = copy_agent(executor)
+        try:
+            # Executors run tools with side effects: no hedged duplicates, no deadline on tool time,
+            # and no retry once a tool has run
+            response = llmPolicy.run("executor", executor, task_text, retries=1, side_effects=True)
+            stage.add_tokens(response)
+            # 工具把命令交给了后台任务队列时，输出要等任务结束才会出现，依赖它的任务不能当作已完成
+            submitted = [
+                str(message.content) for message in (response.messages or [])
+                if message.role == "tool" and str(message.content).startswith("Submitted background job")
+            ] if response else []
+            if submitted:
+                return f"Output: {response.content}\n" + "\n".join(submitted), "Submitted"
+            if response and response.content:
+                return f"Output: {response.content}", "Success"
+            return "", "No output"
+        except Exception as e:
+            return f"Error: {str(e)}", "Failed"
+
+    def run(self, logs: list, user_input: str, stream: bool = False) -> Iterator[RunResponse]:
+        """Plans and executes the tasks for `user_input`.
+
+        When `stream` is True, a progress chunk is yielded as soon as each stage and
+        each task finishes, before the final execution summary.
+        """
         logger.info(f"Processing request: {user_input}")
         logs.append(f"Processing request: {user_input}")
         
-        # Get current directory contents
-        list_current_dir = os.listdir('.')
+        # Get workspace contents as a compact, size-bounded summary, plus precomputed file statistics
+        manifest = get_manifest(self.working_dir or '.')
+        list_current_dir = manifest.summary()
+        files = manifest.refresh()
+        file_stats = stats_summary(manifest.root, files)
+        if file_stats:
+            list_current_dir += f"\nFile statistics:\n{file_stats}"
+        indexes = index_summary(indexBuilder, manifest.root, files)
+        if indexes:
+            list_current_dir += f"\nIndexes already built or being built in the background (do not rebuild them):\n{indexes}"
 
         # Step 1: UI Communication with retries
         ui_response = None
         num_tries = 0
-        while ui_response is None and num_tries < 3:
-            try:
-                num_tries += 1
-                ui_response = self.user_interface.run(
-                    f"Current directory files:\n{str(list_current_dir)}\nUser input:\n{user_input}"
-                )
-                if not ui_response or not ui_response.content:
-                    logger.warning("Invalid UI response, retrying...")
-                    logs.append(f"Invalid UI response, retrying...")
-                    ui_response = None
-            except Exception as e:
-                logger.warning(f"UI communication error: {e}")
-                logs.append(f"UI communication error: {e}")
+        with span("codeai", "ui_communicator") as stage:
+            while ui_response is None and num_tries < 3:
+                try:
+                    if num_tries:
+                        time.sleep(llmPolicy.backoff(num_tries))
+                    num_tries += 1
+                    ui_response = self._run_planner(
+                        "userInterfaceCommunicator",
+                        self.user_interface,
+                        f"Current directory files:\n{list_current_dir}\nUser input:\n{user_input}",
+                    )
+                    stage.add_tokens(ui_response)
+                    if not ui_response or not ui_response.content:
+                        logger.warning("Invalid UI response, retrying...")
+                        logs.append(f"Invalid UI response, retrying...")
+                        ui_response = None
+                except Exception as e:
+                    # The call policy has already retried provider errors, so give up here
+                    logger.warning(f"UI communication error: {e}")
+                    logs.append(f"UI communication error: {e}")
+                    break
+            stage.retries = num_tries - 1
+            if ui_response is None:
+                stage.status = "failed"
 
         if not ui_response:
             yield RunResponse(
@@ -128,9 +281,16 @@ class CodeAIWorkflow(Workflow):
             )
             return
 
+        # 进度只写入日志；流式模式下产出一个空响应，让日志立即推送到前端
+        logs.append("Planning tasks...")
+        if stream:
+            yield RunResponse(run_id=self.run_id)
+
         # Step 2: Task Splitting
         try:
-            task_splitter_response = self.task_splitter.run(ui_response.content)
+            with span("codeai", "task_splitter") as stage:
+                task_splitter_response = self._run_planner("taskSpliter", self.task_splitter, ui_response.content)
+                stage.add_tokens(task_splitter_response)
             if "NO TASK" in task_splitter_response.content:
                 logger.info("No tasks to execute as per task splitter response.")
                 logs.append(f"No tasks to execute as per task splitter response.")
@@ -140,7 +300,7 @@ class CodeAIWorkflow(Workflow):
                     content="No tasks to execute"
                 )
                 return
-            tasks_list = create_task_splitter_output(str(task_splitter_response.content))
+            tasks_list = create_task_splitter_output(task_splitter_response.content)
             if not tasks_list:
                 yield RunResponse(
                     run_id=self.run_id,
@@ -164,30 +324,64 @@ class CodeAIWorkflow(Workflow):
         execution_summary = []
 
         # Remove the last task if it is a separator
-        if tasks_list and '=\'|\'' in tasks_list[-1]:
+        if tasks_list and isinstance(tasks_list[-1], str) and '=\'|\'' in tasks_list[-1]:
             tasks_list.pop()
 
-        for idx, task in enumerate(tasks_list, 1):
-            task_type = "Python" if 'pythonExecutor' in task else "Shell"
-            executor = self.pythonExcutor if 'pythonExecutor' in task else self.shellExcutor
-            
-            execution_summary.append(f"\n--- Task {idx} ({task_type}) ---")
-            execution_summary.append(f"Command: {task}")
-            
-            try:
-                response = executor.run(task)
-                if response and response.content:
-                    result = f"Output: {response.content}"
-                    if task_type == "Python":
-                        python_results.append(result)
+        logs.append(f"Executing {len(tasks_list)} tasks...")
+        if stream:
+            yield RunResponse(run_id=self.run_id)
+
+        # Independent tasks run concurrently; results are still reported in task order
+        task_graph = build_task_graph(tasks_list)
+        task_texts = [str(task) for task in tasks_list]
+        outcomes = {}
+        running = {}
+        pending = set(range(len(tasks_list)))
+        with ThreadPoolExecutor(max_workers=MAX_PARALLEL_TASKS) as pool:
+            while pending or running:
+                for idx in sorted(pending):
+                    deps = task_graph[idx]
+                    if any(dep not in outcomes for dep in deps):
+                        continue
+                    pending.discard(idx)
+                    failed_deps = [dep + 1 for dep in deps if outcomes[dep][1] != "Success"]
+                    if failed_deps:
+                        outcomes[idx] = (f"Skipped: depends on failed or unfinished task(s) {failed_deps}", "Skipped")
+                        logs.append(f"Task {idx + 1}/{len(tasks_list)} skipped, dependencies failed: {failed_deps}")
+                        if stream:
+                            yield RunResponse(run_id=self.run_id)
                     else:
-                        shell_results.append(result)
-                    execution_summary.append(result)
-                    execution_summary.append("Status: Success")
-            except Exception as e:
-                error_msg = f"Error: {str(e)}"
-                execution_summary.append(error_msg)
-                execution_summary.append("Status: Failed")
+                        running[pool.submit(self._execute_task, tasks_list[idx])] = idx
+                if not running:
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    idx = running.pop(future)
+                    outcomes[idx] = future.result()
+                    task_type = "Python" if 'pythonExecutor' in task_texts[idx] else "Shell"
+                    logs.append(f"Task {idx + 1}/{len(tasks_list)} ({task_type}) finished: {outcomes[idx][1]}")
+                    if stream:
+                        yield RunResponse(run_id=self.run_id)
+
+        # Index the data files the tasks produced while the summary is returned
+        index_workspace_files(self.working_dir or '.')
+
+        for idx, task_text in enumerate(task_texts):
+            task_type = "Python" if 'pythonExecutor' in task_text else "Shell"
+            result, status = outcomes[idx]
+
+            execution_summary.append(f"\n--- Task {idx + 1} ({task_type}) ---")
+            execution_summary.append(f"Command: {task_text}")
+            if status == "Success":
+                if task_type == "Python":
+                    python_results.append(result)
+                else:
+                    shell_results.append(result)
+            if result:
+                execution_summary.append(result)
+            if status != "No output":
+                execution_summary.append(f"Status: {status}")
 
         # Prepare final output
         final_output = [
@@ -3,3 +3,95 @@ import uuid
 
 # API Key 配置
 API_KEY = os.environ.get("DEEPSEEK_API_KEY", "your API key here")
+# DeepSeek 接口地址，可指向任意 OpenAI 兼容服务（例如 benchmarks 中的本地模拟服务）
+DEEPSEEK_BASE_URL = os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
+
+# 并行执行任务的最大线程数
+MAX_PARALLEL_TASKS = int(os.environ.get("MAX_PARALLEL_TASKS", 4))
+
+# 任务自带代码时直接执行，失败后才交给执行 Agent
+DIRECT_EXECUTION = os.environ.get("DIRECT_EXECUTION", "1") == "1"
+
+# 数据库目录，app.py 中的各数据库也放在这里
+DATABASE_DIR = os.environ.get("DATABASE_DIR") or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Database"
+)
+# 各会话工作目录的根目录
+PROCESSING_SPACE_DIR = os.environ.get("PROCESSING_SPACE_DIR") or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ProcessingSpace"
+)
+
+# 调用这些耗时程序的 shell 命令交给后台任务队列执行
+BACKGROUND_PROGRAMS = os.environ.get("BACKGROUND_PROGRAMS", "raxml-ng,gatk,bwa,modeltest-ng,snpEff").split(",")
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+# 任务所属进程超过这么多秒没有续约心跳，即视为已退出，任务标记为 interrupted
+JOB_LEASE = float(os.environ.get("JOB_LEASE", 60))
+
+# 每个会话在内存中保留的日志条数；LOG_SPILL=1 时更早的日志落盘到 SQLite，否则直接丢弃
+LOG_BUFFER_SIZE = int(os.environ.get("LOG_BUFFER_SIZE", 500))
+LOG_SPILL = os.environ.get("LOG_SPILL", "1") == "1"
+
+# 论文摘要缓存：所有会话共享，按归一化后的主题查找
+SUMMARY_CACHE_TTL = float(os.environ.get("SUMMARY_CACHE_TTL", 7 * 24 * 3600))
+SUMMARY_CACHE_SIZE = int(os.environ.get("SUMMARY_CACHE_SIZE", 1000))
+
+# 规划类 Agent（userInterfaceCommunicator、taskSpliter）的响应缓存，默认关闭
+LLM_CACHE = os.environ.get("LLM_CACHE", "0") == "1"
+LLM_CACHE_ENTRIES = int(os.environ.get("LLM_CACHE_ENTRIES", 2000))
+LLM_CACHE_MAX_MB = int(os.environ.get("LLM_CACHE_MAX_MB", 256))
+
+# 文献检索：arXiv 与 PubMed 并发查询，地址可替换为镜像或本地桩服务
+ARXIV_API_URL = os.environ.get("ARXIV_API_URL", "http://export.arxiv.org/api/query")
+PUBMED_API_URL = os.environ.get("PUBMED_API_URL", "https://eutils.ncbi.nlm.nih.gov/entrez/eutils")
+SEARCH_TIMEOUT = float(os.environ.get("SEARCH_TIMEOUT", 20))
+SEARCH_MAX_PARALLEL = int(os.environ.get("SEARCH_MAX_PARALLEL", 4))
+
+# 论文摘要：先并发为每篇论文生成短摘要（map），再合并为最终摘要（reduce）
+PAPER_COUNT = int(os.environ.get("PAPER_COUNT", 5))
+SUMMARY_MAP_REDUCE = os.environ.get("SUMMARY_MAP_REDUCE", "1") == "1"
+SUMMARY_WORKERS = int(os.environ.get("SUMMARY_WORKERS", 8))
+PAPER_SUMMARY_TOKENS = int(os.environ.get("PAPER_SUMMARY_TOKENS", 300))
+
+# Python 任务在每个会话常驻的解释器中运行，预先导入常用库，空闲超时后回收
+PYTHON_KERNELS = os.environ.get("PYTHON_KERNELS", "1") == "1"
+KERNEL_PRELOAD = os.environ.get("KERNEL_PRELOAD", "numpy,pandas,matplotlib,matplotlib.pyplot,Bio,Bio.SeqIO,sklearn").split(",")
+KERNEL_SPARES = int(os.environ.get("KERNEL_SPARES", 1))
+MAX_KERNELS = int(os.environ.get("MAX_KERNELS", 16))
+KERNEL_IDLE_TIMEOUT = float(os.environ.get("KERNEL_IDLE_TIMEOUT", 1800))
+
+# 自动为工作目录中的参考序列、BAM、VCF 建立索引（faidx、bwa、.bai、tabix），低优先级后台执行
+AUTO_INDEX = os.environ.get("AUTO_INDEX", "1") == "1"
+
+# 工作流会话统一存放在 Workflows.db 的一张表中，超过保留期未更新的会话会被清理
+WORKFLOW_RETENTION_DAYS = float(os.environ.get("WORKFLOW_RETENTION_DAYS", 90))
+
+# 对话历史保存在服务器端，页面首次只渲染最近的这么多条，更早的消息滚动时再分页获取
+MESSAGE_PAGE_SIZE = int(os.environ.get("MESSAGE_PAGE_SIZE", 20))
+# 每个会话最多保留的消息条数，以及消息的保留天数，超出的部分会被删除
+MESSAGE_HISTORY_LIMIT = int(os.environ.get("MESSAGE_HISTORY_LIMIT", 1000))
+MESSAGE_RETENTION_DAYS = float(os.environ.get("MESSAGE_RETENTION_DAYS", 90))
+
+# DeepSeek 调用策略：单次 HTTP 请求超时、整次调用时限、带抖动的指数退避重试、
+# 超过近期延迟分位数时发送对冲请求（设为 0 关闭），以及连续失败后快速失败的熔断器
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", 60))
+LLM_DEADLINE = float(os.environ.get("LLM_DEADLINE", 180))
+LLM_RETRIES = int(os.environ.get("LLM_RETRIES", 2))
+LLM_BACKOFF_BASE = float(os.environ.get("LLM_BACKOFF_BASE", 1))
+LLM_BACKOFF_MAX = float(os.environ.get("LLM_BACKOFF_MAX", 20))
+LLM_HEDGE_PERCENTILE = float(os.environ.get("LLM_HEDGE_PERCENTILE", 95))
+LLM_BREAKER_FAILURES = int(os.environ.get("LLM_BREAKER_FAILURES", 5))
+LLM_BREAKER_RESET = float(os.environ.get("LLM_BREAKER_RESET", 30))
+
+# 所有 DeepSeek Agent 共用一个 HTTP 连接池（保持长连接，省去每次调用的 TCP/TLS 握手）；
+# LLM_HTTP2=1 时启用 HTTP/2 多路复用（需要安装 h2），未安装时回退到 HTTP/1.1
+LLM_HTTP2 = os.environ.get("LLM_HTTP2", "0") == "1"
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", 32))
+LLM_MAX_KEEPALIVE = int(os.environ.get("LLM_MAX_KEEPALIVE", 16))
+LLM_KEEPALIVE_EXPIRY = float(os.environ.get("LLM_KEEPALIVE_EXPIRY", 120))
+
+# 带历史的 Agent（需求沟通、文献检索）发送给模型的历史上限（估算 token 数）：最近几轮原样保留，
+# 更早的轮次合并为滚动摘要，工具调用的原始输出不再回传；HISTORY_SUMMARIES=0 时直接丢弃早期轮次
+UI_HISTORY_TOKENS = int(os.environ.get("UI_HISTORY_TOKENS", 6000))
+SEARCHER_HISTORY_TOKENS = int(os.environ.get("SEARCHER_HISTORY_TOKENS", 2000))
+HISTORY_SUMMARIES = os.environ.get("HISTORY_SUMMARIES", "1") == "1"
+HISTORY_SUMMARY_TOKENS = int(os.environ.get("HISTORY_SUMMARY_TOKENS", 400))
@@ -0,0 +1,311 @@
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from array import array
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+
+from phi.utils.log import logger
+
+from workspaceManifest import FileEntry, detect_format, get_manifest
+
+STATS_SUFFIX = ".stats.json"
+SUPPORTED_FORMATS = {"fasta", "fasta.gz", "fasta.bgz", "fastq", "fastq.gz", "vcf", "vcf.gz", "vcf.bgz", "bam"}
+# 记录名称等列表最多保存的条数
+MAX_LISTED = 50
+MAX_N50_RECORDS = 1_000_000
+# 最多记住这么多个统计失败的文件
+MAX_FAILED = 1024
+
+
+def stats_path(path: str) -> str:
+    return path + STATS_SUFFIX
+
+
+def _open_text(path: str):
+    with open(path, "rb") as f:
+        compressed = f.read(2) == b"\x1f\x8b"
+    return gzip.open(path, "rb") if compressed else open(path, "rb")
+
+
+def _length_stats(lengths_total: int, count: int, shortest: Optional[int], longest: int) -> dict:
+    return {
+        "total_length": lengths_total,
+        "min_length": shortest or 0,
+        "max_length": longest,
+        "mean_length": round(lengths_total / count, 1) if count else 0,
+    }
+
+
+def fasta_stats(path: str) -> dict:
+    records, total, shortest, longest, current = 0, 0, None, 0, None
+    names = []
+    # 只在序列数不多时保留全部长度用于计算 N50，避免在百万条 reads 上占用大量内存
+    lengths = array("Q")
+
+    def close_record():
+        nonlocal total, shortest, longest
+        total += current
+        shortest = current if shortest is None else min(shortest, current)
+        longest = max(longest, current)
+        if len(lengths) < MAX_N50_RECORDS:
+            lengths.append(current)
+
+    with _open_text(path) as f:
+        for line in f:
+            if line.startswith(b">"):
+                if current is not None:
+                    close_record()
+                records += 1
+                current = 0
+                if len(names) < MAX_LISTED:
+                    header = line[1:].split(maxsplit=1)
+                    names.append(header[0].decode("utf-8", errors="replace") if header else "")
+            elif current is not None:
+                current += len(line.rstrip())
+    if current is not None:
+        close_record()
+    stats = {"records": records, "names": names, **_length_stats(total, records, shortest, longest)}
+    if lengths and records <= MAX_N50_RECORDS:
+        # N50：按长度从大到小累加，达到总长一半时的序列长度
+        accumulated = 0
+        for length in sorted(lengths, reverse=True):
+            accumulated += length
+            if accumulated * 2 >= total:
+                stats["n50"] = length
+                break
+    return stats
+
+
+def fastq_stats(path: str) -> dict:
+    reads, total, shortest, longest = 0, 0, None, 0
+    with _open_text(path) as f:
+        for line_no, line in enumerate(f):
+            if line_no % 4 == 1:
+                length = len(line.rstrip())
+                reads += 1
+                total += length
+                shortest = length if shortest is None else min(shortest, length)
+                longest = max(longest, length)
+    return {"reads": reads, **_length_stats(total, reads, shortest, longest)}
+
+
+def vcf_stats(path: str) -> dict:
+    contigs, samples, per_contig = [], [], {}
+    records = 0
+    with _open_text(path) as f:
+        for line in f:
+            if line.startswith(b"##contig=<"):
+                fields = dict(
+                    item.split("=", 1) for item in line.decode("utf-8", errors="replace").strip()[10:-1].split(",") if "=" in item
+                )
+                contigs.append(fields.get("ID"))
+            elif line.startswith(b"#CHROM"):
+                samples = line.decode("utf-8", errors="replace").rstrip("\r\n").split("\t")[9:]
+            elif not line.startswith(b"#") and line.strip():
+                records += 1
+                chrom = line.split(b"\t", 1)[0].decode("utf-8", errors="replace")
+                per_contig[chrom] = per_contig.get(chrom, 0) + 1
+    return {
+        "records": records,
+        "samples": samples[:MAX_LISTED],
+        "sample_count": len(samples),
+        "contigs": (contigs or list(per_contig))[:MAX_LISTED],
+        "contig_count": len(contigs or per_contig),
+        "records_per_contig": dict(sorted(per_contig.items(), key=lambda item: -item[1])[:MAX_LISTED]),
+    }
+
+
+def bam_stats(path: str) -> dict:
+    try:
+        import pysam
+    except ImportError:
+        return {"error": "pysam is not installed"}
+    with pysam.AlignmentFile(path, "rb") as bam:
+        header = bam.header.to_dict()
+        stats = {
+            "contigs": list(bam.references[:MAX_LISTED]),
+            "contig_count": len(bam.references),
+            "samples": sorted({rg.get("SM") for rg in header.get("RG", []) if rg.get("SM")}),
+            "sort_order": header.get("HD", {}).get("SO"),
+        }
+        if bam.has_index():
+            stats["mapped"] = bam.mapped
+            stats["unmapped"] = bam.unmapped
+    return stats
+
+
+def compute_stats(path: str) -> Optional[dict]:
+    file_format = detect_format(os.path.basename(path))
+    if file_format not in SUPPORTED_FORMATS:
+        return None
+    kind = file_format.split(".")[0]
+    stat = os.stat(path)
+    started = time.time()
+    stats = {"fasta": fasta_stats, "fastq": fastq_stats, "vcf": vcf_stats, "bam": bam_stats}[kind](path)
+    stats.update({
+        "format": file_format,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "seconds": round(time.time() - started, 3),
+    })
+    return stats
+
+
+def load_stats(path: str) -> Optional[dict]:
+    """Returns the sidecar statistics of `path` if they are still valid for the file on disk."""
+    try:
+        with open(stats_path(path), encoding="utf-8") as f:
+            stats = json.load(f)
+        stat = os.stat(path)
+    except (OSError, ValueError):
+        return None
+    if stats.get("size") != stat.st_size or stats.get("mtime") != stat.st_mtime:
+        return None
+    return stats
+
+
+def write_stats(path: str) -> Optional[dict]:
+    stats = compute_stats(path)
+    if stats is None:
+        return None
+    tmp_path = f"{stats_path(path)}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(stats, f, ensure_ascii=False)
+    os.replace(tmp_path, stats_path(path))
+    return stats
+
+
+def describe(stats: dict) -> str:
+    """One line for prompts and the UI, e.g. `vcf.gz: 1200 records, 3 samples (A, B, C), 25 contigs`."""
+    if "error" in stats:
+        return f"{stats['format']}: {stats['error']}"
+    parts = []
+    if "records" in stats:
+        parts.append(f"{stats['records']} records")
+    if "reads" in stats:
+        parts.append(f"{stats['reads']} reads")
+    if stats.get("total_length"):
+        parts.append(f"length {stats['min_length']}-{stats['max_length']} (mean {stats['mean_length']})")
+    if "sample_count" in stats or stats.get("samples"):
+        samples = stats.get("samples", [])
+        count = stats.get("sample_count", len(samples))
+        shown = ", ".join(samples[:5]) + (", ..." if count > 5 else "")
+        parts.append(f"{count} samples ({shown})" if samples else f"{count} samples")
+    if "contig_count" in stats:
+        parts.append(f"{stats['contig_count']} contigs")
+    if "mapped" in stats:
+        parts.append(f"{stats['mapped']} mapped / {stats['unmapped']} unmapped reads")
+    return f"{stats['format']}: " + ", ".join(parts)
+
+
+def stats_summary(root: str, files: Iterable[FileEntry], budget: int = 1500) -> str:
+    """Lines `path: description` for the files below `root` that have valid statistics."""
+    lines, used = [], 0
+    for entry in files:
+        if detect_format(entry.path) not in SUPPORTED_FORMATS:
+            continue
+        stats = load_stats(os.path.join(root, entry.path))
+        if stats is None:
+            continue
+        line = f"{entry.path}: {describe(stats)}"
+        if used + len(line) + 1 > budget:
+            lines.append("...")
+            break
+        lines.append(line)
+        used += len(line) + 1
+    return "\n".join(lines)
+
+
+class StatsIndexer:
+    """Computes sidecar statistics on a background thread, one file at a time.
+
+    Files are queued at most once; files whose sidecar is still valid are skipped. A file
+    whose statistics could not be computed (e.g. a corrupt BAM) is not queued again until its
+    size or modification time changes.
+    """
+
+    def __init__(self):
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._queued = set()
+        self._failed: "OrderedDict[str, Tuple[float, int]]" = OrderedDict()  # path -> (mtime, size) that failed
+        self._lock = threading.Lock()
+        self._started = False
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._worker, name="stats-indexer", daemon=True).start()
+
+    def submit(self, path: str) -> bool:
+        path = os.path.abspath(path)
+        if detect_format(os.path.basename(path)) not in SUPPORTED_FORMATS or load_stats(path) is not None:
+            return False
+        with self._lock:
+            if path in self._queued or self._failed_now(path):
+                return False
+            self._queued.add(path)
+        self._start()
+        self._queue.put(path)
+        return True
+
+    def failed(self, path: str) -> bool:
+        """True if computing the statistics of `path` failed and the file has not changed since."""
+        with self._lock:
+            return self._failed_now(os.path.abspath(path))
+
+    def _failed_now(self, path: str) -> bool:
+        signature = self._failed.get(path)
+        if signature is None:
+            return False
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return signature == (stat.st_mtime, stat.st_size)
+
+    def index_workspace(self, root: str) -> List[str]:
+        """Queues every supported file below `root` that has no valid statistics yet."""
+        submitted = []
+        for entry in get_manifest(root).refresh():
+            path = os.path.join(root, entry.path)
+            if self.submit(path):
+                submitted.append(path)
+        return submitted
+
+    def _worker(self) -> None:
+        while True:
+            path = self._queue.get()
+            try:
+                self._index(path)
+            finally:
+                with self._lock:
+                    self._queued.discard(path)
+
+    def _index(self, path: str) -> None:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        if load_stats(path) is not None:
+            return
+        try:
+            stats = write_stats(path)
+        except Exception as e:
+            logger.warning(f"Could not compute statistics of {path}: {e}")
+            stats = None
+        if stats is not None:
+            logger.info(f"Indexed {path} in {stats['seconds']}s")
+            return
+        # 记住失败时文件的状态，文件改变之前不再重新扫描
+        with self._lock:
+            self._failed[path] = (stat.st_mtime, stat.st_size)
+            self._failed.move_to_end(path)
+            while len(self._failed) > MAX_FAILED:
+                self._failed.popitem(last=False)
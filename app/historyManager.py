@@ -0,0 +1,197 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from phi.agent import Agent
+from phi.memory.agent import AgentMemory, AgentRun
+from phi.model.message import Message
+from phi.utils.log import logger
+
+from config import HISTORY_SUMMARIES, HISTORY_SUMMARY_TOKENS
+from callPolicy import llmPolicy
+from llmClient import deepseek_chat
+from metrics import span
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count: about four ASCII characters per token, one per other character (e.g. CJK)."""
+    ascii_chars = sum(1 for char in text if char < "\x80")
+    return (ascii_chars + 3) // 4 + len(text) - ascii_chars
+
+
+def clip(text: str, max_tokens: int) -> str:
+    """Cuts `text` to about `max_tokens` tokens and notes how much was left out."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    used, end = 0.0, 0
+    for end, char in enumerate(text):
+        used += 0.25 if char < "\x80" else 1
+        if used > max_tokens:
+            break
+    return f"{text[:end]}\n[... {len(text) - end} characters omitted]"
+
+
+def _turn(run: AgentRun, skip_role: Optional[str], max_tokens: int) -> List[Message]:
+    """The user and assistant text of one run; tool calls and raw tool output are dropped."""
+    if run.response is None or not run.response.messages:
+        return []
+    messages = []
+    for message in run.response.messages:
+        if message.role not in ("user", "assistant") or message.role == skip_role or not message.content:
+            continue
+        content = message.get_content_string()
+        messages.append(Message(role=message.role, content=clip(content, max_tokens)))
+    return messages
+
+
+def _tokens(messages: List[Message]) -> int:
+    return sum(estimate_tokens(str(message.content)) for message in messages)
+
+
+def _transcript(turns: List[List[Message]]) -> str:
+    return "\n".join(f"{message.role}: {message.content}" for turn in turns for message in turn)
+
+
+class BudgetedMemory(AgentMemory):
+    """Agent memory whose history for the model stays within `token_budget` estimated tokens.
+
+    The most recent turns (at most the agent's `num_history_responses`) are sent verbatim as
+    long as they fit; older turns are folded into `rolling_summary`. A single message never
+    takes more than a quarter of the budget.
+    """
+
+    token_budget: int = 6000
+    # Summary of runs[:summarized_runs], extended as more turns leave the verbatim window
+    rolling_summary: Optional[str] = None
+    summarized_runs: int = 0
+    # End of the range whose summary is being generated in the background
+    pending_runs: int = 0
+
+    def get_messages_from_last_n_runs(self, last_n: Optional[int] = None,
+                                      skip_role: Optional[str] = None) -> List[Message]:
+        return historyManager.history(self, last_n, skip_role)
+
+
+class HistoryManager:
+    """Builds budgeted histories and folds old turns into rolling summaries.
+
+    Summaries are generated in the background, so no turn waits for one: until a summary is
+    ready, the turns it covers are represented by a short excerpt of each user request, and
+    the next turn picks it up. Summaries are cached by the hash of the previous summary and
+    the folded turns, so agent copies (concurrent attempts, hedged requests) share them.
+    With summaries disabled, the excerpts are kept instead.
+    """
+
+    def __init__(self, summaries: bool = True, summary_tokens: int = 400, cache_entries: int = 256):
+        self.summaries = summaries
+        self.summary_tokens = summary_tokens
+        self.cache_entries = cache_entries
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._running = set()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="history-summary")
+        self.summarizer = Agent(
+            model=deepseek_chat(max_tokens=summary_tokens * 2),
+            instructions=[
+                "Summarize the conversation you are given so it can stand in for it in later turns.",
+                "Keep the user's goals, file names, parameters, decisions and results; leave out command output and file listings.",
+                f"Merge it with the earlier summary if there is one and stay under {summary_tokens // 2} words.",
+            ],
+        )
+
+    def history(self, memory: BudgetedMemory, last_n: Optional[int] = None,
+                skip_role: Optional[str] = None) -> List[Message]:
+        runs = memory.runs
+        if memory.summarized_runs > len(runs) or memory.pending_runs > len(runs):
+            # 会话被重置或重新加载，摘要不再对应当前的历史
+            memory.rolling_summary, memory.summarized_runs, memory.pending_runs = None, 0, 0
+
+        message_tokens = max(1, memory.token_budget // 4)
+        if memory.pending_runs > memory.summarized_runs:
+            pending = [_turn(run, skip_role, message_tokens) for run in runs[memory.summarized_runs:memory.pending_runs]]
+            summary = self._cached(self._key(memory.rolling_summary, pending))
+            if summary is not None:
+                memory.rolling_summary, memory.summarized_runs = summary, memory.pending_runs
+
+        # 预留摘要的位置，剩下的预算从最新的一轮开始往前填
+        available = max(0, memory.token_budget - self.summary_tokens)
+        first = len(runs)
+        recent: List[Message] = []
+        while first > memory.summarized_runs and (last_n is None or len(runs) - first < last_n):
+            turn = _turn(runs[first - 1], skip_role, message_tokens)
+            cost = _tokens(turn)
+            if cost > available:
+                break
+            available -= cost
+            recent = turn + recent
+            first -= 1
+
+        summary = memory.rolling_summary
+        if first > memory.summarized_runs:
+            older = [_turn(run, skip_role, message_tokens) for run in runs[memory.summarized_runs:first]]
+            summary = self._excerpt(memory.rolling_summary, older)
+            if not self.summaries:
+                memory.rolling_summary, memory.summarized_runs = summary, first
+            elif memory.pending_runs != first:
+                memory.pending_runs = first
+                self._submit(memory.rolling_summary, older)
+
+        if not summary:
+            return recent
+        return [
+            Message(role="user", content=f"Summary of our earlier conversation:\n{summary}"),
+            Message(role="assistant", content="Noted."),
+        ] + recent
+
+    @staticmethod
+    def _key(summary: Optional[str], turns: List[List[Message]]) -> str:
+        transcript = _transcript(turns)
+        return hashlib.sha256(f"{summary}\0{transcript}".encode("utf-8")).hexdigest()
+
+    def _cached(self, key: str) -> Optional[str]:
+        with self._lock:
+            if key not in self._cache:
+                return None
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+    def _excerpt(self, summary: Optional[str], turns: List[List[Message]]) -> str:
+        lines = [line for line in (summary or "").splitlines() if line]
+        lines += [f"- {str(message.content)[:200]}" for turn in turns for message in turn if message.role == "user"]
+        # 超出摘要长度时先丢弃最早的条目
+        while len(lines) > 1 and estimate_tokens("\n".join(lines)) > self.summary_tokens:
+            lines.pop(0)
+        return clip("\n".join(lines), self.summary_tokens)
+
+    def _submit(self, summary: Optional[str], turns: List[List[Message]]) -> None:
+        key = self._key(summary, turns)
+        with self._lock:
+            if key in self._cache or key in self._running:
+                return
+            self._running.add(key)
+        self._pool.submit(self._fold, key, summary, turns)
+
+    def _fold(self, key: str, summary: Optional[str], turns: List[List[Message]]) -> None:
+        transcript = _transcript(turns)
+        prompt = f"Earlier summary:\n{summary}\n\nNew turns:\n{transcript}" if summary else transcript
+        # 摘要 Agent 被多个会话共用，每次调用使用独立副本
+        agent = self.summarizer.deep_copy()
+        folded = None
+        try:
+            with span("history", "summarize") as stage:
+                response = llmPolicy.run("history_summarizer", agent, prompt)
+                stage.add_tokens(response)
+            if response and response.content:
+                folded = clip(str(response.content), self.summary_tokens)
+        except Exception as e:
+            logger.warning(f"Could not summarize conversation history: {e}")
+        with self._lock:
+            self._running.discard(key)
+            self._cache[key] = folded or self._excerpt(summary, turns)
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+
+
+historyManager = HistoryManager(summaries=HISTORY_SUMMARIES, summary_tokens=HISTORY_SUMMARY_TOKENS)
@@ -0,0 +1,211 @@
+import glob
+import gzip
+import os
+import queue
+import shlex
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+from phi.utils.log import logger
+
+from tools.shellChanged import run_command_streaming
+from workspaceManifest import FileEntry, detect_format, get_manifest
+
+
+class IndexRule(NamedTuple):
+    name: str
+    formats: Tuple[str, ...]
+    program: str
+    outputs: Tuple[str, ...]  # suffixes appended to the input path
+    # Builds into `{tmp}` (a prefix next to the input) when the tool allows it, so readers never see half-written indexes
+    command: str
+    min_bytes: int = 0
+    # Only for nucleotide references, not protein FASTA or sequencing reads
+    reference_only: bool = False
+
+
+RULES = [
+    IndexRule("faidx", ("fasta", "fasta.bgz"), "samtools", (".fai",), "samtools faidx {input} --fai-idx {tmp}.fai"),
+    IndexRule("bwa", ("fasta", "fasta.gz"), "bwa", (".amb", ".ann", ".bwt", ".pac", ".sa"),
+              "bwa index -p {tmp} {input}", min_bytes=1024 * 1024, reference_only=True),
+    IndexRule("bai", ("bam",), "samtools", (".bai",), "samtools index {input} {tmp}.bai"),
+    IndexRule("tabix", ("vcf.gz", "vcf.bgz"), "tabix", (".tbi",), "tabix -f -p vcf {input}"),
+]
+
+
+NUCLEOTIDES = set("ACGTUNRYKMSWBDHV-.acgtunrykmswbdhv")
+PROTEIN_SUFFIXES = (".faa", ".faa.gz", ".pep", ".pep.gz", ".aa", ".aa.gz")
+# 抽样中记录的平均长度低于此值时视为测序 reads 而不是参考序列
+MIN_REFERENCE_RECORD = 1000
+MAX_FAILED = 1024
+
+
+@lru_cache(maxsize=1024)
+def _looks_like_reference(path: str, mtime: float, size: int, sample_bytes: int = 64 * 1024) -> bool:
+    opener = gzip.open if path.endswith(".gz") else open
+    try:
+        with opener(path, "rb") as f:
+            sample = f.read(sample_bytes).decode("ascii", errors="replace")
+    except (OSError, EOFError):
+        return False
+    lines = sample.splitlines()[:-1] or sample.splitlines()  # 最后一行可能被截断
+    records = sum(1 for line in lines if line.startswith(">"))
+    sequence = "".join(line.strip() for line in lines if not line.startswith(">"))
+    if not sequence or sum(1 for char in sequence if char in NUCLEOTIDES) < 0.9 * len(sequence):
+        return False
+    return records <= 1 or len(sequence) / records >= MIN_REFERENCE_RECORD
+
+
+def is_nucleotide_reference(path: str) -> bool:
+    """True when the first records of a FASTA file are long nucleotide sequences."""
+    if path.lower().endswith(PROTEIN_SUFFIXES):
+        return False
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    return _looks_like_reference(path, stat.st_mtime, stat.st_size)
+
+
+def _low_priority(command: str) -> str:
+    prefix = []
+    if shutil.which("nice"):
+        prefix += ["nice", "-n", "19"]
+    if shutil.which("ionice"):
+        prefix += ["ionice", "-c", "3"]
+    return f"{shlex.join(prefix)} {command}" if prefix else command
+
+
+def index_is_current(path: str, rule: IndexRule) -> bool:
+    try:
+        source_mtime = os.stat(path).st_mtime
+        return all(os.stat(path + suffix).st_mtime >= source_mtime for suffix in rule.outputs)
+    except OSError:
+        return False
+
+
+class IndexBuilder:
+    """Builds missing or outdated genome indexes (faidx, bwa, .bai, tabix) on a low-priority thread.
+
+    Commands run under `nice`/`ionice` one at a time. A build that failed is not retried until
+    the input file changes. Tools that are not installed are skipped.
+    """
+
+    def __init__(self, rules: Iterable[IndexRule] = RULES, timeout: float = 6 * 3600):
+        self.rules = [rule for rule in rules if shutil.which(rule.program)]
+        self.timeout = timeout
+        self._queue: "queue.Queue[Tuple[str, IndexRule]]" = queue.Queue()
+        self._queued = set()
+        self._failed: "OrderedDict[Tuple[str, str], float]" = OrderedDict()  # (path, rule) -> input mtime that failed
+        self._lock = threading.Lock()
+        self._started = False
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._worker, name="index-builder", daemon=True).start()
+
+    def rules_for(self, path: str) -> List[IndexRule]:
+        file_format = detect_format(os.path.basename(path))
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return []
+        return [
+            rule for rule in self.rules
+            if file_format in rule.formats and size >= rule.min_bytes
+            and (not rule.reference_only or is_nucleotide_reference(path))
+        ]
+
+    def submit(self, path: str) -> List[str]:
+        """Queues the indexes of `path` that are missing or older than the file; returns their names."""
+        path = os.path.abspath(path)
+        submitted = []
+        for rule in self.rules_for(path):
+            if index_is_current(path, rule):
+                continue
+            with self._lock:
+                if (path, rule.name) in self._queued or self._failed.get((path, rule.name)) == os.path.getmtime(path):
+                    continue
+                self._queued.add((path, rule.name))
+            self._start()
+            self._queue.put((path, rule))
+            submitted.append(rule.name)
+        return submitted
+
+    def index_workspace(self, root: str) -> None:
+        for entry in get_manifest(root).refresh():
+            self.submit(os.path.join(root, entry.path))
+
+    def pending(self, path: str) -> List[str]:
+        path = os.path.abspath(path)
+        with self._lock:
+            return [name for queued_path, name in self._queued if queued_path == path]
+
+    def _build(self, path: str, rule: IndexRule) -> None:
+        mtime = os.path.getmtime(path)
+        directory = os.path.dirname(path)
+        tmp = os.path.join(directory, f".{os.path.basename(path)}.{uuid.uuid4().hex[:8]}")
+        command = rule.command.format(input=shlex.quote(path), tmp=shlex.quote(tmp))
+        log_file = os.path.join(directory, ".shell_logs", f"index-{rule.name}-{time.strftime('%Y%m%d-%H%M%S')}.log")
+        logger.info(f"Building {rule.name} index of {path}")
+        result = run_command_streaming(_low_priority(command), cwd=directory, log_file=log_file, timeout=self.timeout)
+        try:
+            if result["returncode"] != 0 or result["killed"]:
+                with self._lock:
+                    self._failed[(path, rule.name)] = mtime
+                    self._failed.move_to_end((path, rule.name))
+                    while len(self._failed) > MAX_FAILED:
+                        self._failed.popitem(last=False)
+                logger.warning(f"Building {rule.name} index of {path} failed, see {log_file}")
+                return
+            if "{tmp}" in rule.command:
+                for suffix in rule.outputs:
+                    os.replace(tmp + suffix, path + suffix)
+            logger.info(f"Built {rule.name} index of {path}")
+        finally:
+            for leftover in glob.glob(glob.escape(tmp) + "*"):
+                os.remove(leftover)
+
+    def _worker(self) -> None:
+        while True:
+            path, rule = self._queue.get()
+            try:
+                if os.path.exists(path) and not index_is_current(path, rule):
+                    self._build(path, rule)
+            except Exception as e:
+                logger.warning(f"Could not build {rule.name} index of {path}: {e}")
+            finally:
+                with self._lock:
+                    self._queued.discard((path, rule.name))
+
+
+def index_summary(builder: Optional[IndexBuilder], root: str, files: Iterable[FileEntry], budget: int = 1000) -> str:
+    """Lines like `ref.fa: faidx, bwa (building)` for the prompt, so plans do not rebuild indexes."""
+    lines, used = [], 0
+    for entry in files:
+        path = os.path.join(root, entry.path)
+        rules = builder.rules_for(path) if builder else [rule for rule in RULES if entry.format in rule.formats]
+        pending = builder.pending(path) if builder else []
+        states = []
+        for rule in rules:
+            if rule.name in pending:
+                states.append(f"{rule.name} (building)")
+            elif index_is_current(path, rule):
+                states.append(rule.name)
+        if not states:
+            continue
+        line = f"{entry.path}: {', '.join(states)}"
+        if used + len(line) + 1 > budget:
+            lines.append("...")
+            break
+        lines.append(line)
+        used += len(line) + 1
+    return "\n".join(lines)
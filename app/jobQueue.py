@@ -0,0 +1,276 @@
+import os
+import signal
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Optional
+
+from phi.utils.log import logger
+
+from metrics import record_tool
+from tools.shellChanged import command_programs, run_command_streaming
+
+
+class JobQueue:
+    """A local queue that runs long shell commands outside the request thread.
+
+    Jobs are stored in SQLite, so queued jobs survive a restart and several processes can
+    share one queue. Each running job records the queue that owns it, and the owner renews
+    the job's heartbeat every `poll_interval` seconds; a job whose heartbeat is older than
+    `lease` seconds lost its owner and is marked as interrupted. Cancelling a job that runs
+    in another process only flags it, and the owner kills it on its next heartbeat. The
+    output of each job goes to a log file that can be tailed while it runs. The worker
+    threads start on first use, so jobs queued before a restart resume with the first call.
+    """
+
+    def __init__(self, db_file: str, max_workers: int = 2, poll_interval: float = 2.0, lease: float = 60.0):
+        self.db_file = db_file
+        self.poll_interval = poll_interval
+        self.lease = lease
+        # 进程号可能在重启后复用，加上随机后缀区分不同的队列实例
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._processes = {}
+        self._cancelled = set()
+        self._lock = threading.Lock()
+        self._started = False
+        self._wakeup = threading.Event()
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_file)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    command TEXT NOT NULL,
+                    cwd TEXT,
+                    status TEXT NOT NULL,
+                    returncode INTEGER,
+                    log_file TEXT,
+                    error TEXT,
+                    created_at REAL,
+                    started_at REAL,
+                    finished_at REAL,
+                    owner TEXT,
+                    heartbeat REAL,
+                    cancel_requested INTEGER DEFAULT 0
+                )"""
+            )
+            # 旧版本创建的表缺少后加的列
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for name, kind in (("owner", "TEXT"), ("heartbeat", "REAL"), ("cancel_requested", "INTEGER DEFAULT 0")):
+                if name not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {kind}")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+        self.max_workers = max_workers
+
+    def start(self) -> None:
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True).start()
+        for i in range(self.max_workers):
+            threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True).start()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def submit(self, command: str, cwd: Optional[str] = None) -> str:
+        """Queues `command` to run in `cwd` and returns the job id."""
+        self.start()
+        job_id = uuid.uuid4().hex[:12]
+        log_dir = Path(cwd or os.getcwd()).joinpath(".jobs")
+        log_file = str(log_dir.joinpath(f"{job_id}.log"))
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, command, cwd, status, log_file, created_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+                (job_id, command, cwd, log_file, time.time()),
+            )
+        logger.info(f"Queued job {job_id}: {command}")
+        self._wakeup.set()
+        return job_id
+
+    def status(self, job_id: str) -> Optional[dict]:
+        self.start()
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def list_jobs(self, limit: int = 50, cwd: Optional[str] = None) -> List[dict]:
+        """Returns the most recent jobs, optionally only those run in `cwd`."""
+        self.start()
+        with self._connect() as conn:
+            if cwd is None:
+                rows = conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+            else:
+                rows = conn.execute(
+                    "SELECT * FROM jobs WHERE cwd = ? ORDER BY created_at DESC LIMIT ?", (cwd, limit)
+                ).fetchall()
+        return [dict(row) for row in rows]
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """Cancels a queued job or kills a running one.
+
+        Returns "cancelled" once the job is stopped, "pending" while the kill is still to
+        happen (the job runs in another process or has not started its command yet), and
+        None if the job already ended.
+        """
+        self.start()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id),
+            )
+            if cursor.rowcount:
+                return "cancelled"
+            cursor = conn.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,)
+            )
+            if not cursor.rowcount:
+                return None
+            owner = conn.execute("SELECT owner FROM jobs WHERE id = ?", (job_id,)).fetchone()["owner"]
+        # 其他进程中的任务由其所属队列在下一次心跳时终止
+        if owner != self.owner:
+            return "pending"
+        return "cancelled" if self._kill(job_id) else "pending"
+
+    def _kill(self, job_id: str) -> bool:
+        """Kills the local process of a job; False if its command has not started yet."""
+        with self._lock:
+            self._cancelled.add(job_id)
+            process = self._processes.get(job_id)
+        # 进程尚未启动时，由 register 在启动后立即终止
+        if process is None:
+            return False
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        return True
+
+    def tail(self, job_id: str, lines: int = 100) -> Optional[str]:
+        """Returns the last `lines` lines of the job log without reading the whole file."""
+        job = self.status(job_id)
+        if job is None:
+            return None
+        if not job["log_file"] or not os.path.exists(job["log_file"]):
+            return ""
+        with open(job["log_file"], "rb") as f:
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+            block = 65536
+            data = b""
+            while end > 0 and data.count(b"\n") <= lines:
+                start = max(0, end - block)
+                f.seek(start)
+                data = f.read(end - start) + data
+                end = start
+        return "\n".join(data.decode("utf-8", errors="replace").splitlines()[-lines:])
+
+    def _claim_next(self) -> Optional[dict]:
+        with self._connect() as conn:
+            while True:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    return None
+                now = time.time()
+                cursor = conn.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ?, owner = ?, heartbeat = ? "
+                    "WHERE id = ? AND status = 'queued'",
+                    (now, self.owner, now, row["id"]),
+                )
+                conn.commit()
+                # 另一个 worker 可能已抢先领取
+                if cursor.rowcount:
+                    return dict(row)
+
+    def _worker(self):
+        while True:
+            job = self._claim_next()
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._run(job)
+
+    def _heartbeat(self):
+        while True:
+            now = time.time()
+            try:
+                with self._connect() as conn:
+                    conn.execute(
+                        "UPDATE jobs SET heartbeat = ? WHERE owner = ? AND status = 'running'", (now, self.owner)
+                    )
+                    requested = [row["id"] for row in conn.execute(
+                        "SELECT id FROM jobs WHERE owner = ? AND status = 'running' AND cancel_requested = 1",
+                        (self.owner,),
+                    )]
+                    # 所属进程已退出（心跳过期）的任务无法再被接管
+                    conn.execute(
+                        "UPDATE jobs SET status = 'interrupted', finished_at = ? "
+                        "WHERE status = 'running' AND (heartbeat IS NULL OR heartbeat < ?)",
+                        (now, now - self.lease),
+                    )
+                for job_id in requested:
+                    self._kill(job_id)
+            except sqlite3.Error as e:
+                logger.warning(f"Job heartbeat failed: {e}")
+            time.sleep(self.poll_interval)
+
+    def _run(self, job: dict):
+        job_id = job["id"]
+
+        def register(process):
+            with self._lock:
+                self._processes[job_id] = process
+                cancelled = job_id in self._cancelled
+            if cancelled:
+                os.killpg(process.pid, signal.SIGKILL)
+
+        logger.info(f"Starting job {job_id}: {job['command']}")
+        status, returncode, error = "failed", None, None
+        started = time.monotonic()
+        try:
+            result = run_command_streaming(
+                job["command"],
+                cwd=job["cwd"],
+                log_file=job["log_file"],
+                tail=20,
+                on_start=register,
+            )
+            returncode = result["returncode"]
+            if job_id in self._cancelled:
+                status = "cancelled"
+            elif returncode == 0:
+                status = "succeeded"
+            else:
+                error = result["stderr"]
+        except Exception as e:
+            logger.error(f"Job {job_id} failed to start: {e}")
+            error = str(e)
+        finally:
+            with self._lock:
+                self._processes.pop(job_id, None)
+                self._cancelled.discard(job_id)
+
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, returncode = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, returncode, error, time.time(), job_id),
+            )
+        programs = command_programs(job["command"])
+        record_tool("job", programs[0] if programs else "sh", time.monotonic() - started,
+                    "cancelled" if status == "cancelled" else returncode if returncode is not None else "error")
+        logger.info(f"Job {job_id} {status}")
+
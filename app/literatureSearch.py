@@ -0,0 +1,189 @@
+import re
+import time
+import unicodedata
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import httpx
+from phi.utils.log import logger
+from pydantic import BaseModel
+
+from config import ARXIV_API_URL, PUBMED_API_URL, SEARCH_TIMEOUT, SEARCH_MAX_PARALLEL
+from metrics import span
+
+_ATOM = {"atom": "http://www.w3.org/2005/Atom", "arxiv": "http://arxiv.org/schemas/atom"}
+
+
+class Paper(BaseModel):
+    title: str
+    url: str
+    summary: Optional[str] = None
+    sources: List[str] = []
+    doi: Optional[str] = None
+    arxiv_id: Optional[str] = None
+    pmid: Optional[str] = None
+    year: Optional[int] = None
+    score: float = 0.0
+
+
+# 从用户的整句请求中提取检索词时去掉的虚词和请求用语，如 "Could you summarize recent work on ..."
+QUERY_STOP_WORDS = {
+    "a", "about", "an", "and", "any", "are", "article", "articles", "as", "at", "be", "been", "by",
+    "can", "could", "do", "does", "find", "for", "from", "give", "has", "have", "how", "i", "in",
+    "into", "is", "it", "latest", "literature", "look", "me", "new", "of", "on", "or", "paper",
+    "papers", "please", "recent", "research", "review", "search", "show", "some", "studies",
+    "study", "summarize", "summary", "tell", "that", "the", "there", "this", "to", "up", "want",
+    "what", "which", "with", "work", "would", "you",
+}
+MAX_QUERY_TERMS = 6
+
+
+def normalize_title(title: str) -> str:
+    text = unicodedata.normalize("NFKC", title or "").lower()
+    return " ".join(re.findall(r"\w+", text))
+
+
+def query_terms(query: str) -> List[str]:
+    """Keywords of a user request, in order and without duplicates or request phrasing."""
+    terms = []
+    for term in normalize_title(query).split():
+        if term not in QUERY_STOP_WORDS and term not in terms:
+            terms.append(term)
+    # 全是虚词时退回到原来的词
+    return terms[:MAX_QUERY_TERMS] or normalize_title(query).split()[:MAX_QUERY_TERMS]
+
+
+def search_arxiv(query: str, max_results: int, client: httpx.Client) -> List[Paper]:
+    response = client.get(
+        ARXIV_API_URL,
+        params={"search_query": " AND ".join(f"all:{term}" for term in query_terms(query)), "start": 0, "max_results": max_results, "sortBy": "relevance"},
+    )
+    response.raise_for_status()
+    papers = []
+    for entry in ET.fromstring(response.content).findall("atom:entry", _ATOM):
+        url = (entry.findtext("atom:id", "", _ATOM) or "").strip()
+        published = entry.findtext("atom:published", "", _ATOM) or ""
+        doi = entry.findtext("arxiv:doi", None, _ATOM)
+        papers.append(Paper(
+            title=" ".join((entry.findtext("atom:title", "", _ATOM) or "").split()),
+            url=url,
+            summary=" ".join((entry.findtext("atom:summary", "", _ATOM) or "").split()) or None,
+            sources=["arxiv"],
+            doi=doi.strip().lower() if doi else None,
+            # http://arxiv.org/abs/2101.00001v2 -> 2101.00001
+            arxiv_id=re.sub(r"v\d+$", "", url.rsplit("/abs/", 1)[-1]) if "/abs/" in url else None,
+            year=int(published[:4]) if published[:4].isdigit() else None,
+        ))
+    return papers
+
+
+def search_pubmed(query: str, max_results: int, client: httpx.Client) -> List[Paper]:
+    response = client.get(
+        f"{PUBMED_API_URL}/esearch.fcgi",
+        params={"db": "pubmed", "term": " ".join(query_terms(query)), "retmax": max_results, "retmode": "json", "sort": "relevance"},
+    )
+    response.raise_for_status()
+    ids = response.json().get("esearchresult", {}).get("idlist", [])
+    if not ids:
+        return []
+    response = client.get(
+        f"{PUBMED_API_URL}/efetch.fcgi",
+        params={"db": "pubmed", "id": ",".join(ids), "retmode": "xml"},
+    )
+    response.raise_for_status()
+    papers = []
+    for article in ET.fromstring(response.content).iter("PubmedArticle"):
+        pmid = article.findtext(".//MedlineCitation/PMID")
+        title_node = article.find(".//ArticleTitle")
+        title = "".join(title_node.itertext()) if title_node is not None else ""
+        abstract = " ".join("".join(part.itertext()) for part in article.findall(".//Abstract/AbstractText"))
+        doi = None
+        for article_id in article.findall(".//ArticleIdList/ArticleId"):
+            if article_id.get("IdType") == "doi" and article_id.text:
+                doi = article_id.text.strip().lower()
+        year = article.findtext(".//PubDate/Year") or ""
+        papers.append(Paper(
+            title=" ".join(title.split()),
+            url=f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/",
+            summary=" ".join(abstract.split()) or None,
+            sources=["pubmed"],
+            doi=doi,
+            pmid=pmid,
+            year=int(year) if year.isdigit() else None,
+        ))
+    return papers
+
+
+SOURCES: Dict[str, Callable[[str, int, httpx.Client], List[Paper]]] = {
+    "arxiv": search_arxiv,
+    "pubmed": search_pubmed,
+}
+
+
+def merge_papers(papers: List[Paper]) -> List[Paper]:
+    """Removes duplicates by DOI, arXiv id or normalized title, merging what each copy knows."""
+    merged: List[Paper] = []
+    index: Dict[str, Paper] = {}
+    for paper in papers:
+        keys = [f"doi:{paper.doi}" if paper.doi else None,
+                f"arxiv:{paper.arxiv_id}" if paper.arxiv_id else None,
+                f"title:{normalize_title(paper.title)}" if normalize_title(paper.title) else None]
+        keys = [key for key in keys if key]
+        existing = next((index[key] for key in keys if key in index), None)
+        if existing is None:
+            existing = paper.model_copy(deep=True)
+            merged.append(existing)
+        else:
+            existing.sources = sorted(set(existing.sources) | set(paper.sources))
+            for field in ("summary", "doi", "arxiv_id", "pmid", "year"):
+                if getattr(existing, field) is None:
+                    setattr(existing, field, getattr(paper, field))
+            if paper.summary and len(paper.summary) > len(existing.summary or ""):
+                existing.summary = paper.summary
+        for key in keys:
+            index[key] = existing
+    return merged
+
+
+def rank_papers(query: str, papers: List[Paper]) -> List[Paper]:
+    """Orders papers by query-term overlap, with a small boost for recent and multi-source papers."""
+    terms = set(query_terms(query))
+    current_year = time.localtime().tm_year
+    for paper in papers:
+        title_terms = set(normalize_title(paper.title).split())
+        summary_terms = set(normalize_title(paper.summary or "").split())
+        overlap = (2 * len(terms & title_terms) + len(terms & summary_terms)) / (3 * len(terms) or 1)
+        recency = max(0, 10 - (current_year - paper.year)) / 100 if paper.year else 0
+        paper.score = round(overlap + 0.1 * (len(paper.sources) - 1) + recency, 4)
+    return sorted(papers, key=lambda paper: paper.score, reverse=True)
+
+
+def search_literature(query: str, max_results: int = 10, limit: int = 5,
+                      sources: Optional[List[str]] = None, logs: Optional[list] = None) -> List[Paper]:
+    """Queries every source concurrently and returns the `limit` best deduplicated papers.
+
+    A source that fails or times out is skipped, so one slow service never fails the search.
+    """
+    sources = sources or list(SOURCES)
+    results: List[Paper] = []
+
+    def search_source(name: str) -> List[Paper]:
+        with span("paperai", f"search_{name}"):
+            return SOURCES[name](query, max_results, client)
+
+    with httpx.Client(timeout=SEARCH_TIMEOUT, follow_redirects=True) as client:
+        with ThreadPoolExecutor(max_workers=min(SEARCH_MAX_PARALLEL, len(sources))) as pool:
+            futures = {name: pool.submit(search_source, name) for name in sources}
+            for name, future in futures.items():
+                try:
+                    papers = future.result()
+                    logger.info(f"{name} returned {len(papers)} papers")
+                    if logs is not None:
+                        logs.append(f"{name} returned {len(papers)} papers")
+                    results.extend(papers)
+                except Exception as e:
+                    logger.warning(f"{name} search failed: {e}")
+                    if logs is not None:
+                        logs.append(f"{name} search failed: {e}")
+    return rank_papers(query, merge_papers(results))[:limit]
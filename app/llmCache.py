@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from phi.agent import Agent, RunResponse
+from phi.memory.agent import AgentRun
+from phi.model.message import Message
+from phi.utils.log import logger
+from pydantic import BaseModel
+
+
+class LLMCache:
+    """Disk-backed cache of agent responses, addressed by the hash of everything the model sees.
+
+    The key covers the model id and endpoint, the agent's description, instructions and
+    response model, the prompt and, for agents that send history, the messages of the runs
+    that would be included. Entries are evicted least recently used first once the cache
+    holds more than `max_entries` entries or `max_bytes` bytes of content.
+    """
+
+    def __init__(self, db_file: str, max_entries: int = 2000, max_bytes: int = 256 * 1024 * 1024):
+        self.db_file = db_file
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._stats = {}
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_file)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    agent TEXT,
+                    content TEXT NOT NULL,
+                    size INTEGER,
+                    created_at REAL,
+                    accessed_at REAL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def key(agent: Agent, message: str) -> str:
+        history = []
+        if agent.add_history_to_messages:
+            for m in agent.memory.get_messages_from_last_n_runs(last_n=agent.num_history_responses, skip_role="system"):
+                history.append([m.role, str(m.content)])
+        payload = {
+            "model": [agent.model.id, getattr(agent.model, "base_url", None), agent.model.temperature],
+            "description": agent.description,
+            "instructions": agent.instructions,
+            "response_model": agent.response_model.model_json_schema() if agent.response_model else None,
+            "history": history,
+            "message": message,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def _count(self, name: str, field: str) -> None:
+        with self._lock:
+            counters = self._stats.setdefault(name, {"hits": 0, "misses": 0})
+            counters[field] += 1
+
+    def get(self, key: str):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT content FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def put(self, key: str, name: str, content) -> None:
+        data = json.dumps(content, ensure_ascii=False)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, name, data, len(data.encode("utf-8")), now, now),
+            )
+            conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                # 从最久未使用的条目开始删除，直到总大小回到上限以内
+                rows = conn.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall()
+                stale = []
+                for old_key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    stale.append((old_key,))
+                    total -= size
+                conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def run(self, name: str, agent: Agent, message: str,
+            runner: Optional[Callable[[Agent, str], RunResponse]] = None) -> RunResponse:
+        """Returns `agent.run(message)`, answered from the cache when the same input was seen before.
+
+        On a miss the agent is called through `runner(agent, message)` when given.
+        """
+        key = self.key(agent, message)
+        cached = None
+        try:
+            cached = self.get(key)
+            if cached is not None and agent.response_model is not None:
+                cached = agent.response_model.model_validate(cached)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable cache entry for {name}: {e}")
+            cached = None
+
+        if cached is not None:
+            self._count(name, "hits")
+            text = cached.model_dump_json() if isinstance(cached, BaseModel) else str(cached)
+            response = RunResponse(
+                content=cached,
+                messages=[Message(role="user", content=message), Message(role="assistant", content=text)],
+            )
+            # 命中时也记入历史，后续带历史的调用与未命中时看到的上下文一致
+            agent.memory.add_run(AgentRun(message=Message(role="user", content=message), response=response))
+            return response
+
+        self._count(name, "misses")
+        response = runner(agent, message) if runner is not None else agent.run(message)
+        if response is not None and response.content:
+            content = response.content.model_dump() if isinstance(response.content, BaseModel) else response.content
+            try:
+                self.put(key, name, content)
+            except (TypeError, sqlite3.Error) as e:
+                logger.warning(f"Could not cache response of {name}: {e}")
+        return response
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        with self._lock:
+            agents = {name: dict(counters) for name, counters in self._stats.items()}
+        return {"entries": entries, "bytes": size, "agents": agents}
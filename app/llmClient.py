@@ -0,0 +1,133 @@
+import os
+import threading
+from typing import Optional
+
+import httpx
+from phi.model.deepseek import DeepSeekChat
+from phi.utils.log import logger
+
+from config import (API_KEY, DEEPSEEK_BASE_URL, LLM_TIMEOUT, LLM_HTTP2, LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE,
+                    LLM_KEEPALIVE_EXPIRY)
+from metrics import REGISTRY
+
+# Get the API key from environment variables OR set your API key here
+API = os.environ.get('DEEPSEEK_API_KEY') or API_KEY
+
+LLM_HTTP_REQUESTS = REGISTRY.counter(
+    "infinity_llm_http_requests_total", "HTTP requests sent to the LLM provider.")
+LLM_HTTP_CONNECTS = REGISTRY.counter(
+    "infinity_llm_http_connections_opened_total", "New TCP connections (and TLS handshakes) to the LLM provider.",
+    ("kind",))
+
+
+class PooledTransport(httpx.HTTPTransport):
+    """HTTP transport that counts requests, new TCP connections and TLS handshakes.
+
+    Counting uses httpcore's trace hook, so a request served over a kept-alive connection
+    shows up as a request without a connect.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connects = 0
+        self.tls_handshakes = 0
+
+    def _count(self, field: str) -> None:
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        outer = request.extensions.get("trace")
+
+        def trace(event: str, info: dict) -> None:
+            if event == "connection.connect_tcp.complete":
+                self._count("connects")
+                LLM_HTTP_CONNECTS.inc(kind="tcp")
+            elif event == "connection.start_tls.complete":
+                self._count("tls_handshakes")
+                LLM_HTTP_CONNECTS.inc(kind="tls")
+            if outer is not None:
+                outer(event, info)
+
+        request.extensions["trace"] = trace
+        self._count("requests")
+        LLM_HTTP_REQUESTS.inc()
+        return super().handle_request(request)
+
+    def pool_state(self) -> dict:
+        connections = list(self._pool.connections)
+        idle = sum(1 for connection in connections if connection.is_idle())
+        return {"connections": len(connections), "idle": idle, "active": len(connections) - idle}
+
+
+class SharedHTTPClient(httpx.Client):
+    http2 = False
+
+    # Agents are deep-copied per task and per call attempt; the copies must keep using this pool
+    def __deepcopy__(self, memo) -> "SharedHTTPClient":
+        return self
+
+
+def _create_client() -> SharedHTTPClient:
+    limits = httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+    )
+    http2 = LLM_HTTP2
+    if http2:
+        # httpx only notices a missing h2 package on the first request
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("LLM_HTTP2 is set but the h2 package is not installed, using HTTP/1.1")
+            http2 = False
+    transport = PooledTransport(limits=limits, http2=http2)
+    client = SharedHTTPClient(transport=transport, timeout=httpx.Timeout(LLM_TIMEOUT), follow_redirects=True)
+    client.http2 = http2
+    return client
+
+
+# 进程内所有 DeepSeek 调用共用的 HTTP 客户端
+httpClient = _create_client()
+
+
+def deepseek_chat(**kwargs) -> DeepSeekChat:
+    """Returns a DeepSeekChat that sends its requests through the shared connection pool.
+
+    Retries are left to callPolicy, so the OpenAI client's own retries are disabled.
+    """
+    params = dict(api_key=API, base_url=DEEPSEEK_BASE_URL, timeout=LLM_TIMEOUT, max_retries=0)
+    params.update(kwargs)
+    return DeepSeekChat(http_client=httpClient, **params)
+
+
+def pool_stats(client: Optional[SharedHTTPClient] = None) -> dict:
+    """Pool limits, current connections and how many requests reused a kept-alive connection."""
+    client = client or httpClient
+    transport: PooledTransport = client._transport
+    with transport._lock:
+        requests, connects, handshakes = transport.requests, transport.connects, transport.tls_handshakes
+    return {
+        "http2": client.http2,
+        "max_connections": LLM_MAX_CONNECTIONS,
+        "max_keepalive_connections": LLM_MAX_KEEPALIVE,
+        "keepalive_expiry": LLM_KEEPALIVE_EXPIRY,
+        **transport.pool_state(),
+        "requests": requests,
+        "connections_opened": connects,
+        "tls_handshakes": handshakes,
+        "reused": max(0, requests - connects),
+    }
+
+
+def _collect_pool(gauge) -> None:
+    for state, value in httpClient._transport.pool_state().items():
+        gauge.set(value, state=state)
+
+
+LLM_HTTP_POOL = REGISTRY.gauge(
+    "infinity_llm_http_pool_connections", "Connections in the shared LLM HTTP pool by state.", ("state",),
+    collect=_collect_pool)
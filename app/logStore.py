@@ -0,0 +1,160 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+
+class LogStore:
+    """Per-session, bounded log buffers with structured records and cursor-based reads.
+
+    Every record gets a process-wide increasing `cursor`, so clients fetch only what they have
+    not seen with `since(session_id, cursor)`. Each session keeps at most `max_entries` records
+    in memory; older ones are dropped or, when `spill_db` is set, moved to SQLite in batches
+    and still served by `since`.
+    """
+
+    def __init__(self, max_entries: int = 500, max_sessions: int = 1024, spill_db: Optional[str] = None,
+                 spill_batch: int = 100):
+        self.max_entries = max_entries
+        self.max_sessions = max_sessions
+        self.spill_db = spill_db
+        self.spill_batch = spill_batch
+        self._buffers: "OrderedDict[str, deque]" = OrderedDict()
+        self._pending_spill: List[tuple] = []
+        # 每个内存中的会话已落盘记录的最大游标，since() 据此判断是否需要查询数据库
+        self._spilled: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._cursor = 0
+
+        if spill_db is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(spill_db)), exist_ok=True)
+            with self._connect() as conn:
+                conn.execute(
+                    """CREATE TABLE IF NOT EXISTS logs (
+                        cursor INTEGER PRIMARY KEY,
+                        session_id TEXT NOT NULL,
+                        ts REAL,
+                        stage TEXT,
+                        level TEXT,
+                        message TEXT
+                    )"""
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_logs_session ON logs (session_id, cursor)")
+                # 游标在重启后继续递增，避免与已落盘的记录冲突
+                self._cursor = conn.execute("SELECT COALESCE(MAX(cursor), 0) FROM logs").fetchone()[0]
+        self._start_cursor = self._cursor
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.spill_db, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def add(self, session_id: str, message: str, stage: str = "app", level: str = "INFO") -> dict:
+        with self._lock:
+            self._cursor += 1
+            record = {
+                "cursor": self._cursor,
+                "ts": time.time(),
+                "stage": stage,
+                "level": level,
+                "message": str(message).rstrip("\n"),
+            }
+            buffer = self._buffers.get(session_id)
+            if buffer is None:
+                buffer = self._buffers[session_id] = deque(maxlen=self.max_entries)
+                # 上次运行时落盘的记录可能属于同一会话
+                self._spilled[session_id] = self._start_cursor
+                while len(self._buffers) > self.max_sessions:
+                    evicted_id, evicted = self._buffers.popitem(last=False)
+                    self._queue_spill(evicted_id, list(evicted))
+                    self._spilled.pop(evicted_id, None)
+            else:
+                self._buffers.move_to_end(session_id)
+            if len(buffer) == buffer.maxlen:
+                self._queue_spill(session_id, [buffer[0]])
+                self._spilled[session_id] = buffer[0]["cursor"]
+            buffer.append(record)
+            spill = self._take_spill(force=False)
+        self._write_spill(spill)
+        return record
+
+    def since(self, session_id: str, cursor: int = 0, limit: int = 200) -> Tuple[List[dict], int]:
+        """Returns up to `limit` records newer than `cursor` and the cursor to ask with next time."""
+        with self._lock:
+            if cursor >= self._cursor:
+                return [], cursor
+            buffer = self._buffers.get(session_id)
+            records = [r for r in buffer or () if r["cursor"] > cursor]
+            # 只有当该会话有比 cursor 更新的记录已经落盘（或会话已被移出内存）时才需要查数据库
+            from_db = self.spill_db is not None and (buffer is None or self._spilled.get(session_id, 0) > cursor)
+            upper = records[0]["cursor"] if records else self._cursor + 1
+            spill = self._take_spill(force=True) if from_db else []
+        self._write_spill(spill)
+
+        if from_db:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    "SELECT cursor, ts, stage, level, message FROM logs "
+                    "WHERE session_id = ? AND cursor > ? AND cursor < ? ORDER BY cursor LIMIT ?",
+                    (session_id, cursor, upper, limit),
+                ).fetchall()
+            older = [dict(zip(("cursor", "ts", "stage", "level", "message"), row)) for row in rows]
+            records = older + records
+
+        records = records[:limit]
+        next_cursor = records[-1]["cursor"] if records else cursor
+        return records, next_cursor
+
+    def recent(self, session_id: str, limit: int = 100) -> List[dict]:
+        with self._lock:
+            return list(self._buffers.get(session_id, ()))[-limit:]
+
+    def session_log(self, session_id: str, stage: str) -> "SessionLog":
+        return SessionLog(self, session_id, stage)
+
+    def _queue_spill(self, session_id: str, records: List[dict]) -> None:
+        if self.spill_db is not None:
+            self._pending_spill.extend(
+                (r["cursor"], session_id, r["ts"], r["stage"], r["level"], r["message"]) for r in records
+            )
+
+    def _take_spill(self, force: bool) -> List[tuple]:
+        if not self._pending_spill or (not force and len(self._pending_spill) < self.spill_batch):
+            return []
+        spill, self._pending_spill = self._pending_spill, []
+        return spill
+
+    def _write_spill(self, rows: List[tuple]) -> None:
+        if rows:
+            with self._connect() as conn:
+                conn.executemany("INSERT OR REPLACE INTO logs VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+
+class SessionLog:
+    """The `logs` object handed to workflows: `append` records a structured entry for one session.
+
+    Workflows only ever call `logs.append(message)`, so this replaces the plain list they used
+    to get without touching their code.
+    """
+
+    def __init__(self, store: LogStore, session_id: str, stage: str):
+        self.store = store
+        self.session_id = session_id
+        self.stage = stage
+
+    def append(self, message, level: Optional[str] = None, stage: Optional[str] = None) -> dict:
+        if level is None:
+            lowered = str(message).lower()
+            level = "ERROR" if ("error" in lowered or "出错" in lowered) else "WARNING" if "retry" in lowered else "INFO"
+        return self.store.add(self.session_id, message, stage=stage or self.stage, level=level)
+
+    def extend(self, messages) -> None:
+        for message in messages:
+            self.append(message)
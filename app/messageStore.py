@@ -0,0 +1,104 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+from phi.utils.log import logger
+
+_FIELDS = ("id", "type", "text", "ts")
+
+
+class MessageStore:
+    """Server-side conversation history, read newest-first in pages.
+
+    Every message gets an increasing `id`; `page(session_id, before)` returns the `limit`
+    messages older than `before` in display order, so the page only loads the latest turns
+    and fetches older ones when the user scrolls up. Each session keeps at most
+    `max_per_session` messages, and messages older than `retention_days` are deleted at most
+    once per `maintenance_interval` seconds while new turns are stored.
+    """
+
+    def __init__(self, db_file: str, retention_days: Optional[float] = 90, max_per_session: Optional[int] = 1000,
+                 maintenance_interval: float = 3600):
+        self.db_file = db_file
+        self.retention_days = retention_days
+        self.max_per_session = max_per_session
+        self.maintenance_interval = maintenance_interval
+        self._last_maintenance = 0.0
+        self._maintenance_lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_file)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    text TEXT,
+                    ts REAL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_ts ON messages (ts)")
+
+    @contextmanager
+    def _connect(self):
+        # sqlite3 连接作为上下文管理器只提交或回滚事务，不会关闭连接
+        conn = sqlite3.connect(self.db_file, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def add_turn(self, session_id: str, user_text: str, ai_text: str) -> List[dict]:
+        """Stores one user message and its reply in a single transaction."""
+        now = time.time()
+        records = []
+        with self._connect() as conn:
+            for message_type, text in (("user", user_text), ("ai", ai_text)):
+                cursor = conn.execute(
+                    "INSERT INTO messages (session_id, type, text, ts) VALUES (?, ?, ?, ?)",
+                    (session_id, message_type, text, now),
+                )
+                records.append({"id": cursor.lastrowid, "type": message_type, "text": text, "ts": now})
+            if self.max_per_session:
+                conn.execute(
+                    "DELETE FROM messages WHERE session_id = ? AND id < "
+                    "(SELECT id FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                    (session_id, session_id, self.max_per_session - 1),
+                )
+        if now - self._last_maintenance > self.maintenance_interval:
+            self.maintain()
+        return records
+
+    def maintain(self) -> int:
+        """Deletes messages older than the retention period; returns how many were removed."""
+        with self._maintenance_lock:
+            self._last_maintenance = time.time()
+            if not self.retention_days:
+                return 0
+            cutoff = time.time() - self.retention_days * 86400
+            with self._connect() as conn:
+                removed = conn.execute("DELETE FROM messages WHERE ts < ?", (cutoff,)).rowcount
+        if removed:
+            logger.info(f"Removed {removed} messages older than {self.retention_days} days")
+        return removed
+
+    def page(self, session_id: str, before: Optional[int] = None, limit: int = 20) -> Tuple[List[dict], bool]:
+        """Returns up to `limit` messages older than `before` (oldest first) and whether older ones exist."""
+        query = "SELECT id, type, text, ts FROM messages WHERE session_id = ?"
+        params: list = [session_id]
+        if before is not None:
+            query += " AND id < ?"
+            params.append(before)
+        with self._connect() as conn:
+            rows = conn.execute(query + " ORDER BY id DESC LIMIT ?", params + [limit + 1]).fetchall()
+        has_more = len(rows) > limit
+        return [dict(zip(_FIELDS, row)) for row in reversed(rows[:limit])], has_more
+
+    def delete(self, session_id: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
@@ -0,0 +1,232 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Sequence, Tuple
+
+from phi.utils.log import logger
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900, 3600)
+# 每个指标最多保留的标签组合数，超出后新的组合计入 "other"，避免命令名等标签无限增长
+MAX_SERIES = 500
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        if key not in self._series and len(self._series) >= MAX_SERIES:
+            return tuple("other" for _ in self.labelnames)
+        return key
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series = sorted(self._series.items())
+            lines.extend(self._render_series(key, value) for key, value in series)
+        return "\n".join(lines)
+
+    def _render_series(self, key, value) -> str:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        with self._lock:
+            key = self._key(labels)
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._series.get(tuple(str(labels.get(name, "")) for name in self.labelnames), 0)
+
+    def _render_series(self, key, value) -> str:
+        return f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Gauge(_Metric):
+    """A value that goes up and down; `collect(gauge)`, when given, refreshes it before each render."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 collect: Optional[Callable[["Gauge"], None]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._collect = collect
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._series[self._key(labels)] = value
+
+    def render(self) -> str:
+        if self._collect is not None:
+            try:
+                self._collect(self)
+            except Exception as e:
+                logger.warning(f"Could not collect {self.name}: {e}")
+        return super().render()
+
+    def _render_series(self, key, value) -> str:
+        return f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        with self._lock:
+            key = self._key(labels)
+            series = self._series.get(key)
+            if series is None:
+                # 每个桶单独计数，输出时再累加成 Prometheus 要求的累积值
+                series = self._series[key] = {"buckets": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            series["buckets"][bisect.bisect_left(self.buckets, value)] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def _render_series(self, key, value) -> str:
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), value["buckets"]):
+            cumulative += count
+            le = 'le="{}"'.format("+Inf" if bound == float("inf") else repr(float(bound)))
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {value['sum']}")
+        lines.append(f"{self.name}_count{labels} {value['count']}")
+        return "\n".join(lines)
+
+
+class Registry:
+    """The metrics of this process, rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              collect: Optional[Callable[[Gauge], None]] = None) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames, collect))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "infinity_stage_duration_seconds", "Duration of workflow stages.", ("workflow", "stage", "status"))
+STAGE_RETRIES = REGISTRY.counter(
+    "infinity_stage_retries_total", "Retries made inside workflow stages.", ("workflow", "stage"))
+LLM_TOKENS = REGISTRY.counter(
+    "infinity_llm_tokens_total", "Prompt and completion tokens used by each stage.", ("workflow", "stage", "kind"))
+TOOL_SECONDS = REGISTRY.histogram(
+    "infinity_tool_duration_seconds", "Duration of tool subprocesses and kernel runs.", ("tool", "program"))
+TOOL_EXITS = REGISTRY.counter(
+    "infinity_tool_exits_total", "Tool runs by exit status.", ("tool", "program", "exit_status"))
+
+
+def token_counts(metrics: Optional[dict]) -> Tuple[int, int]:
+    """Sums the prompt and completion tokens in a phi RunResponse's `metrics`."""
+    if not metrics:
+        return 0, 0
+
+    def total(name: str) -> int:
+        value = metrics.get(name) or 0
+        return int(sum(value) if isinstance(value, (list, tuple)) else value)
+
+    return total("input_tokens") or total("prompt_tokens"), total("output_tokens") or total("completion_tokens")
+
+
+class Span:
+    """Timing and attributes of one stage; `status` becomes "error" when the stage raises.
+
+    Stages set `status` themselves for outcomes that are not exceptions, e.g. "failed".
+    """
+
+    def __init__(self, workflow: str, stage: str):
+        self.workflow = workflow
+        self.stage = stage
+        self.status = "ok"
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    def add_tokens(self, response) -> None:
+        """Adds the token usage of a phi RunResponse (or Agent.run_response) to the span."""
+        prompt, completion = token_counts(getattr(response, "metrics", None))
+        self.prompt_tokens += prompt
+        self.completion_tokens += completion
+
+
+@contextmanager
+def span(workflow: str, stage: str) -> Iterator[Span]:
+    """Times a workflow stage and exports its duration, retries and token usage."""
+    current = Span(workflow, stage)
+    try:
+        yield current
+    except GeneratorExit:
+        # 流式响应被客户端中途断开
+        current.status = "cancelled"
+        raise
+    except BaseException:
+        current.status = "error"
+        raise
+    finally:
+        current.seconds = time.perf_counter() - current.started
+        STAGE_SECONDS.observe(current.seconds, workflow=workflow, stage=stage, status=current.status)
+        if current.retries:
+            STAGE_RETRIES.inc(current.retries, workflow=workflow, stage=stage)
+        if current.prompt_tokens:
+            LLM_TOKENS.inc(current.prompt_tokens, workflow=workflow, stage=stage, kind="prompt")
+        if current.completion_tokens:
+            LLM_TOKENS.inc(current.completion_tokens, workflow=workflow, stage=stage, kind="completion")
+        logger.debug(
+            f"{workflow}.{stage} {current.status} in {current.seconds:.3f}s, retries {current.retries}, "
+            f"tokens {current.prompt_tokens}/{current.completion_tokens}"
+        )
+
+
+def record_tool(tool: str, program: str, seconds: float, exit_status) -> None:
+    """Exports one tool run; `exit_status` is the return code or why the run was stopped."""
+    TOOL_SECONDS.observe(seconds, tool=tool, program=program)
+    TOOL_EXITS.inc(tool=tool, program=program, exit_status=exit_status)
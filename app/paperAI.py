@@ -5,14 +5,25 @@ from phi.utils.log import logger
 from phi.model.openai.like import OpenAILike
 from phi.tools.pubmed import PubmedTools
 from phi.tools.arxiv_toolkit import ArxivToolkit
-from config import API_KEY
-from phi.model.deepseek import DeepSeekChat
+from config import DATABASE_DIR, SUMMARY_CACHE_TTL, SUMMARY_CACHE_SIZE
+from config import PAPER_COUNT, SUMMARY_MAP_REDUCE, SUMMARY_WORKERS, PAPER_SUMMARY_TOKENS, SEARCHER_HISTORY_TOKENS
+from summaryCache import SummaryCache
+from literatureSearch import search_literature
+from metrics import span
+from callPolicy import llmPolicy, copy_agent
+from historyManager import BudgetedMemory
+from llmClient import deepseek_chat
 import os
-from typing import Optional, Dict, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Iterator, List
 from pydantic import BaseModel, Field
 
-# Get the API key from environment variables OR set your API key here
-API = os.environ.get('DEEPSEEK_API_KEY') or API_KEY
+
+summaryCache = SummaryCache(
+    db_file=os.path.join(DATABASE_DIR, "Summaries.db"),
+    ttl=SUMMARY_CACHE_TTL,
+    max_entries=SUMMARY_CACHE_SIZE,
+)
 
 class NewsArticle(BaseModel):
     title: str = Field(..., description="Title of the article.")
@@ -33,17 +44,18 @@ class ScrapedArticle(BaseModel):
 
 class PaperSummaryGenerator(Workflow):
     searcher: Agent = Agent(
-        model=DeepSeekChat(api_key=API),
+        model=deepseek_chat(),
         tools=[ArxivToolkit()],
         instructions=[
             "Given a topic, search for 10 articles and return the 5 most relevant articles.",
         ],
         add_history_to_messages=True,
+        memory=BudgetedMemory(token_budget=SEARCHER_HISTORY_TOKENS),
         response_model=SearchResults,
     )
 
     summarizer: Agent = Agent(
-        model=DeepSeekChat(api_key=API),
+        model=deepseek_chat(),
         instructions=[
             "Given a url, scrape the article and return the title, url, and markdown formatted content.",
             "If the content is not available or does not make sense, return None as the content.",
@@ -51,66 +63,133 @@ class PaperSummaryGenerator(Workflow):
         # response_model=ScrapedArticle,
     )
 
-    def run(self, logs: list, topic: str, use_cache: bool = True) -> Iterator[RunResponse]:
+    # Map step of the map-reduce summary: one short summary per paper, capped by max_tokens
+    paper_summarizer: Agent = Agent(
+        model=deepseek_chat(max_tokens=PAPER_SUMMARY_TOKENS),
+        instructions=[
+            "Given the title, url and abstract of one paper, summarize its question, method and main findings.",
+            f"Keep the summary under {PAPER_SUMMARY_TOKENS // 2} words and keep the title and url.",
+        ],
+    )
+
+    # Reduce step: merges the per-paper summaries into one review
+    review_writer: Agent = Agent(
+        model=deepseek_chat(),
+        instructions=[
+            "Given a topic and short summaries of several papers on it, combine them into one review in markdown.",
+            "Start with a level-two heading, group related findings and point out where the papers agree or disagree.",
+            "Cite every paper you use by its title and url, and do not add findings that are not in the summaries.",
+        ],
+    )
+
+    def _summarize_paper(self, paper: str) -> str:
+        # Input beyond the budget adds latency without changing a short summary (~4 chars per token)
+        paper = paper[: PAPER_SUMMARY_TOKENS * 16]
+        # Agents keep per-run state, so concurrent papers must not share one instance
+        agent = copy_agent(self.paper_summarizer)
+        with span("paperai", "paper_summary") as stage:
+            try:
+                response = llmPolicy.run("paper_summarizer", agent, paper)
+                stage.add_tokens(response)
+                if response and response.content:
+                    return str(response.content)
+            except Exception as e:
+                logger.warning(f"Paper summary failed, using the abstract instead: {e}")
+            stage.status = "failed"
+            return paper[: PAPER_SUMMARY_TOKENS * 4]
+
+    def _map_papers(self, logs: list, papers: List[str]) -> List[str]:
+        """Summarizes each paper concurrently; results keep the ranking order."""
+        with span("paperai", "map"), ThreadPoolExecutor(max_workers=max(1, min(SUMMARY_WORKERS, len(papers)))) as pool:
+            summaries = list(pool.map(self._summarize_paper, papers))
+        logs.append(f"Summarized {len(summaries)} papers")
+        return summaries
+
+    def run(self, logs: list, topic: str, use_cache: bool = True, stream: bool = False) -> Iterator[RunResponse]:
+        """Searches papers on `topic` and summarizes them.
+
+        When `stream` is True, summarizer tokens are yielded as they arrive instead of
+        a single response holding the whole summary.
+        """
         try:
             logger.info(f"Generating a summary on: {topic}")
             logs.append(f"Generating a summary on: {topic}")
 
             # Check cache
-            if use_cache and "summaries" in self.session_state:
+            if use_cache:
                 logger.info("Checking if cached summary exists")
                 logs.append("Checking if cached summary exists")
-                for cached_summary in self.session_state["summaries"]:
-                    if cached_summary["topic"] == topic:
-                        logger.info("Found cached summary")
-                        logs.append("Found cached summary")
-                        yield RunResponse(content=cached_summary["summary"])
-                        return
-
-            # Step 1: Search and validate results
+                cached_summary = summaryCache.get(topic)
+                if cached_summary is not None:
+                    logger.info("Found cached summary")
+                    logs.append("Found cached summary")
+                    yield RunResponse(content=cached_summary)
+                    return
+
+            # Step 1: Search arXiv and PubMed concurrently, deduplicate and rank
             all_papers = []
-            for i in range(1):
-                response = self.searcher.run(topic)
-                if response and response.content:
-                    # Format the articles data
-                    articles_text = []
+            with span("paperai", "search") as stage:
+                papers = search_literature(topic, max_results=max(15, PAPER_COUNT * 2), limit=PAPER_COUNT, logs=logs)
+                if not papers:
+                    stage.status = "empty"
+            for paper in papers:
+                all_papers.append(
+                    f"Title: {paper.title}\nURL: {paper.url}\nSources: {', '.join(paper.sources)}\nSummary: {paper.summary}\n"
+                )
+            logger.info(f"Search returned {len(all_papers)} papers")
+
+            # Fall back to the searcher agent when both services returned nothing
+            if not all_papers:
+                with span("paperai", "search_agent") as stage:
+                    # The searcher calls arXiv tools; a hedged duplicate would only repeat them
+                    response = llmPolicy.run("searcher", self.searcher, topic, hedge=False)
+                    stage.add_tokens(response)
+                if response and response.content and not isinstance(response.content, str):
                     for article in response.content.articles:
-                        article_info = f"Title: {article.title}\nURL: {article.url}\nSummary: {article.summary}\n"
-                        articles_text.append(article_info)
-                    all_papers.extend(articles_text)
-                    logger.info(f"Search {i+1} completed successfully")
+                        all_papers.append(f"Title: {article.title}\nURL: {article.url}\nSummary: {article.summary}\n")
                 else:
-                    logger.warning(f"Search {i+1} returned no results")
+                    logger.warning("Searcher agent returned no results")
 
             if not all_papers:
                 yield RunResponse(content="No papers found for the given topic.")
                 return
 
-            # Combine results
+            # Combine results; in map-reduce mode the review writer only sees the short per-paper summaries
+            agent_name, agent = "summarizer", self.summarizer
+            if SUMMARY_MAP_REDUCE and len(all_papers) > 1:
+                # 进度写入日志而不是回复内容，空响应让流式调用方及时推送日志
+                logs.append(f"Summarizing {len(all_papers)} papers...")
+                if stream:
+                    yield RunResponse()
+                all_papers = self._map_papers(logs, all_papers)
+                agent_name, agent = "review_writer", self.review_writer
+                all_papers = [f"Topic: {topic}"] + all_papers
             combined_input = "\n\n".join(all_papers)
 
             # Step 2: Generate summary with validation
             final_summary = ''
-            for response in self.summarizer.run(combined_input, stream=True):
-                i=0
-                if response and i==1:
-                    logger.info("Summary generated successfully")
-                    i+=1
-                    
-                if response and response.content:
-                    final_summary += response.content
-
+            with span("paperai", "summarize") as stage:
+                for response in llmPolicy.stream(agent_name, agent, combined_input):
+                    if response and response.content:
+                        if not final_summary:
+                            logger.info("Summary generation started")
+                            logs.append("Summary generation started")
+                        final_summary += response.content
+                        if stream:
+                            yield RunResponse(content=response.content)
+                stage.add_tokens(agent.run_response)
+                if not final_summary:
+                    stage.status = "empty"
 
             if not final_summary:
                 yield RunResponse(content="Failed to generate summary.")
                 return
 
             # Cache valid results
-            if "summaries" not in self.session_state:
-                self.session_state["summaries"] = []
-            self.session_state["summaries"].append({"topic": topic, "summary": final_summary})
+            summaryCache.put(topic, final_summary)
 
-            yield RunResponse(content=final_summary)
+            if not stream:
+                yield RunResponse(content=final_summary)
 
         except Exception as e:
             logger.error(f"Error generating summary: {str(e)}")
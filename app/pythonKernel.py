@@ -0,0 +1,242 @@
+import atexit
+import json
+import os
+import select
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+
+from phi.utils.log import logger
+
+# 常驻解释器：预先导入常用库，之后在同一个命名空间中依次执行脚本
+# 请求与结果通过单独的管道传递，stdout/stderr 在每次执行时重定向到该次的日志文件
+_KERNEL = r"""
+import importlib, json, os, sys, traceback
+commands = os.fdopen(int(sys.argv[1]), "r", encoding="utf-8")
+results = os.fdopen(int(sys.argv[2]), "w", encoding="utf-8")
+os.environ.setdefault("MPLBACKEND", "Agg")
+for name in sys.argv[3].split(","):
+    if name:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            pass
+namespace = {"__name__": "__main__", "__builtins__": __builtins__}
+results.write(json.dumps({"ready": True}) + "\n")
+results.flush()
+for line in commands:
+    request = json.loads(line)
+    reply = {"ok": True}
+    with open(request["log"], "ab", buffering=0) as log:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+        try:
+            os.chdir(request["cwd"])
+            if request["cwd"] not in sys.path:
+                sys.path.insert(0, request["cwd"])
+            namespace["__file__"] = request["file"]
+            with open(request["file"], encoding="utf-8") as f:
+                code = compile(f.read(), request["file"], "exec")
+            exec(code, namespace)
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                reply = {"ok": False, "error": f"SystemExit: {e.code}"}
+        except BaseException:
+            error_type, error, tb = sys.exc_info()
+            reply = {"ok": False, "error": "".join(traceback.format_exception(error_type, error, tb.tb_next))}
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+    variable = request.get("variable")
+    if variable:
+        reply["variable"] = repr(namespace[variable]) if variable in namespace else None
+    results.write(json.dumps(reply) + "\n")
+    results.flush()
+"""
+
+
+class KernelError(Exception):
+    pass
+
+
+class Kernel:
+    """One warm interpreter process; `lock` serializes the scripts sent to it."""
+
+    def __init__(self, preload: Iterable[str]):
+        command_read, command_write = os.pipe()
+        result_read, result_write = os.pipe()
+        self.process = subprocess.Popen(
+            [sys.executable, "-c", _KERNEL, str(command_read), str(result_write), ",".join(preload)],
+            pass_fds=(command_read, result_write),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        os.close(command_read)
+        os.close(result_write)
+        self._commands = os.fdopen(command_write, "w", encoding="utf-8")
+        self._results = result_read
+        self._buffer = b""
+        self.ready = False
+        self.lock = threading.Lock()
+        self.last_used = time.time()
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def _read_reply(self, timeout: Optional[float], log_file: Optional[str] = None,
+                    max_output_bytes: Optional[int] = None) -> dict:
+        deadline = time.monotonic() + timeout if timeout else None
+        while b"\n" not in self._buffer:
+            if deadline is not None and time.monotonic() > deadline:
+                self.kill()
+                raise KernelError("killed (timeout), the kernel state was lost")
+            if max_output_bytes and log_file and os.path.exists(log_file) and os.path.getsize(log_file) > max_output_bytes:
+                self.kill()
+                raise KernelError("killed (output limit), the kernel state was lost")
+            readable, _, _ = select.select([self._results], [], [], 1.0)
+            if readable:
+                data = os.read(self._results, 65536)
+                if not data:
+                    self.kill()
+                    raise KernelError("the kernel exited, its state was lost")
+                self._buffer += data
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return json.loads(line)
+
+    def execute(self, file: str, cwd: str, log_file: str, variable: Optional[str] = None,
+                timeout: Optional[float] = None, max_output_bytes: Optional[int] = None) -> dict:
+        """Runs `file` in the kernel namespace; the caller must hold `lock`."""
+        if not self.ready:
+            self._read_reply(timeout=300)
+            self.ready = True
+        try:
+            self._commands.write(json.dumps({"file": file, "cwd": cwd, "log": log_file, "variable": variable}) + "\n")
+            self._commands.flush()
+        except (BrokenPipeError, OSError, ValueError):
+            self.kill()
+            raise KernelError("the kernel exited, its state was lost")
+        try:
+            return self._read_reply(timeout, log_file=log_file, max_output_bytes=max_output_bytes)
+        finally:
+            self.last_used = time.time()
+
+    def kill(self) -> None:
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        self.process.wait()
+        for close in (self._commands.close, lambda: os.close(self._results)):
+            try:
+                close()
+            except OSError:
+                pass
+
+
+class KernelPool:
+    """Warm Python kernels, one per session key, plus `spare` pre-started ones for new sessions.
+
+    A session keeps its kernel, and therefore its variables and loaded tables, between tasks.
+    Kernels idle for longer than `idle_timeout` seconds are stopped, and beyond `max_kernels`
+    the least recently used session loses its kernel. Spare kernels are only started once the
+    pool is first used.
+    """
+
+    def __init__(self, preload: List[str], spare: int = 1, max_kernels: int = 16, idle_timeout: float = 1800):
+        self.preload = [name for name in preload if name]
+        self.spare = spare
+        self.max_kernels = max_kernels
+        self.idle_timeout = idle_timeout
+        self._kernels: "OrderedDict[str, Kernel]" = OrderedDict()
+        self._spares: List[Kernel] = []
+        self._lock = threading.Lock()
+        self._started = False
+        atexit.register(self.shutdown)
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._reaper, name="kernel-reaper", daemon=True).start()
+
+    def _take(self, key: str) -> Kernel:
+        self._start()
+        with self._lock:
+            kernel = self._kernels.get(key)
+            if kernel is not None and kernel.alive():
+                self._kernels.move_to_end(key)
+                kernel.last_used = time.time()
+                return kernel
+            kernel = None
+            while self._spares and kernel is None:
+                candidate = self._spares.pop()
+                kernel = candidate if candidate.alive() else None
+            if kernel is None:
+                kernel = Kernel(self.preload)
+            self._kernels[key] = kernel
+            evicted = []
+            while len(self._kernels) > self.max_kernels:
+                evicted.append(self._kernels.popitem(last=False)[1])
+        for old in evicted:
+            old.kill()
+        return kernel
+
+    def run(self, key: str, file: str, cwd: str, log_file: str, variable: Optional[str] = None,
+            timeout: Optional[float] = None, max_output_bytes: Optional[int] = None) -> dict:
+        """Runs `file` in the kernel of session `key`; scripts of one session run one at a time."""
+        kernel = self._take(key)
+        with kernel.lock:
+            try:
+                return kernel.execute(file, cwd, log_file, variable, timeout, max_output_bytes)
+            except KernelError:
+                with self._lock:
+                    if self._kernels.get(key) is kernel:
+                        del self._kernels[key]
+                raise
+
+    def reset(self, key: str) -> bool:
+        with self._lock:
+            kernel = self._kernels.pop(key, None)
+        if kernel is None:
+            return False
+        kernel.kill()
+        return True
+
+    def _reaper(self) -> None:
+        while True:
+            try:
+                now = time.time()
+                with self._lock:
+                    idle = [key for key, kernel in self._kernels.items()
+                            if not kernel.lock.locked() and now - kernel.last_used > self.idle_timeout]
+                    stale = [self._kernels.pop(key) for key in idle]
+                    self._spares = [kernel for kernel in self._spares if kernel.alive()]
+                    missing = self.spare - len(self._spares)
+                for kernel in stale:
+                    kernel.kill()
+                if stale:
+                    logger.info(f"Stopped {len(stale)} idle Python kernels")
+                for _ in range(max(0, missing)):
+                    kernel = Kernel(self.preload)
+                    with self._lock:
+                        self._spares.append(kernel)
+            except Exception as e:
+                logger.error(f"Kernel reaper error: {e}")
+            time.sleep(min(60, self.idle_timeout))
+
+    def shutdown(self) -> None:
+        with self._lock:
+            kernels = list(self._kernels.values()) + self._spares
+            self._kernels.clear()
+            self._spares = []
+        for kernel in kernels:
+            kernel.kill()
@@ -1,63 +1,152 @@
-//上传文件
+//上传文件：分片上传，支持断点续传、并行上传与分片校验
+const CHUNK_SIZE = 8 * 1024 * 1024;
+const PARALLEL_CHUNKS = 4;
+// 浏览器只能一次性计算整个文件的 SHA-256，超过这个大小时由服务端逐分片复核
+const WHOLE_FILE_HASH_LIMIT = 256 * 1024 * 1024;
+
+async function sha256Hex(blob) {
+  // crypto.subtle 只在 https 或 localhost 下可用，其他情况跳过分片校验
+  if (!(window.crypto && crypto.subtle)) {
+    return null;
+  }
+  const digest = await crypto.subtle.digest("SHA-256", await blob.arrayBuffer());
+  return Array.from(new Uint8Array(digest))
+    .map((b) => b.toString(16).padStart(2, "0"))
+    .join("");
+}
+
+async function uploadFileChunked(file, onProgress) {
+  // 以文件名、大小和修改时间识别同一文件，用于断点续传
+  const key = `upload:${file.name}:${file.size}:${file.lastModified}`;
+  let upload = null;
+  const savedId = localStorage.getItem(key);
+  if (savedId) {
+    const response = await fetch(`/upload/${savedId}`);
+    if (response.ok) {
+      upload = await response.json();
+    }
+  }
+  if (!upload) {
+    const response = await fetch("/upload/init", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ filename: file.name, size: file.size, chunk_size: CHUNK_SIZE }),
+    });
+    upload = await response.json();
+    if (!response.ok) {
+      throw new Error(upload.error);
+    }
+    localStorage.setItem(key, upload.upload_id);
+  }
+
+  // 与分片上传同时计算整个文件的校验和，完成时交给服务端比对
+  const fileChecksum = file.size <= WHOLE_FILE_HASH_LIMIT ? sha256Hex(file) : Promise.resolve(null);
+
+  const received = new Set(upload.received);
+  const queue = [];
+  for (let index = 0; index < upload.total_chunks; index++) {
+    if (!received.has(index)) {
+      queue.push(index);
+    }
+  }
+  let done = received.size;
+  onProgress(done, upload.total_chunks);
+
+  async function worker() {
+    while (queue.length) {
+      const index = queue.shift();
+      const start = index * upload.chunk_size;
+      const blob = file.slice(start, Math.min(file.size, start + upload.chunk_size));
+      const checksum = await sha256Hex(blob);
+      for (let attempt = 1; ; attempt++) {
+        try {
+          const response = await fetch(`/upload/${upload.upload_id}/chunk/${index}`, {
+            method: "PUT",
+            headers: checksum ? { "X-Chunk-SHA256": checksum } : {},
+            body: blob,
+          });
+          if (response.ok) {
+            break;
+          }
+          throw new Error(response.statusText);
+        } catch (error) {
+          if (attempt >= 3) {
+            throw error;
+          }
+          await new Promise((resolve) => setTimeout(resolve, 1000 * attempt));
+        }
+      }
+      done++;
+      onProgress(done, upload.total_chunks);
+    }
+  }
+  await Promise.all(Array.from({ length: PARALLEL_CHUNKS }, worker));
+
+  const sha256 = await fileChecksum;
+  const response = await fetch(`/upload/${upload.upload_id}/complete`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(sha256 ? { sha256: sha256 } : {}),
+  });
+  const result = await response.json();
+  if (!response.ok) {
+    if (response.status === 409) {
+      localStorage.removeItem(key);
+    }
+    throw new Error(result.error);
+  }
+  localStorage.removeItem(key);
+  return result;
+}
+
+// 上传后由服务端在后台统计文件内容（记录数、样本、contig 等），完成后显示在文件名旁
+async function showFileStats(filename, listItem, attempt = 1) {
+  const response = await fetch(`/stats?path=${encodeURIComponent(filename)}`);
+  if (response.ok) {
+    const data = await response.json();
+    listItem.textContent = `${filename} — ${data.summary}`;
+  } else if (response.status === 404 && attempt < 20) {
+    setTimeout(() => showFileStats(filename, listItem, attempt + 1), 3000 * attempt);
+  }
+}
+
     document.getElementById("fileInput").addEventListener("change", async function (event) {
       const fileList = document.getElementById("fileList");
-      const files = event.target.files;
+      const files = Array.from(event.target.files);
 
-      const formData = new FormData();
       for (const file of files) {
-        formData.append("files", file);
-
         const listItem = document.createElement("li");
         listItem.textContent = file.name;
         fileList.appendChild(listItem);
-      }
-
-      try {
-        const response = await fetch("/upload", {
-          method: "POST",
-          body: formData,
-        });
 
-        if (response.ok) {
-          const result = await response.json();
+        try {
+          const result = await uploadFileChunked(file, (done, total) => {
+            listItem.textContent = `${file.name} (${Math.floor((done / total) * 100)}%)`;
+          });
+          listItem.textContent = file.name;
           console.log("文件上传成功:", result);
-
-          if (result.logs) {
-            result.logs.forEach((log) => {
-              const logItem = document.createElement("li");
-              logItem.textContent = log;
-              document.querySelector(".log-list").appendChild(logItem);
-            });
+          if (result.stats_pending) {
+            showFileStats(result.filename || file.name, listItem);
           }
-        } else {
-          console.error("文件上传失败", response.statusText);
+
+          fetchLogs();
+        } catch (error) {
+          listItem.textContent = `${file.name} (上传失败，重新选择该文件可继续上传)`;
+          console.error("文件上传发生错误", error);
         }
-      } catch (error) {
-        console.error("文件上传发生错误", error);
       }
+      event.target.value = "";
     });
 
-        // 下载所有文件
-    document.getElementById("downloadAllButton").addEventListener("click", async function () {
-      try {
-        const response = await fetch("/download", { method: "GET" });
-        if (response.ok) {
-          const blob = await response.blob();
-          const url = window.URL.createObjectURL(blob);
-          const a = document.createElement("a");
-          a.style.display = "none";
-          a.href = url;
-          a.download = "files.zip"; // 打包为 ZIP 文件
-          document.body.appendChild(a);
-          a.click();
-          window.URL.revokeObjectURL(url);
-          console.log("文件下载成功");
-        } else {
-          console.error("文件下载失败", response.statusText);
-        }
-      } catch (error) {
-        console.error("文件下载发生错误", error);
-      }
+        // 下载所有文件（直接交给浏览器下载，服务端边打包边发送，不在内存中缓存整个压缩包）
+    document.getElementById("downloadAllButton").addEventListener("click", function () {
+      const a = document.createElement("a");
+      a.style.display = "none";
+      a.href = "/download";
+      a.download = "files.zip"; // 打包为 ZIP 文件
+      document.body.appendChild(a);
+      a.click();
+      document.body.removeChild(a);
     });
 
   document.addEventListener("DOMContentLoaded", () => {
@@ -80,26 +169,182 @@ document.addEventListener("DOMContentLoaded", () => {
     gfm: true,
   });
 
-  // Render all markdown content
+  // Render the markdown content that came with the page; new messages are rendered when they are added
   renderMarkdown();
-  
-  // Re-render markdown when messages are updated
-  const observer = new MutationObserver(function(mutations) {
-    renderMarkdown();
-  });
-  
-  const messageArea = document.getElementById('messageArea');
-  if (messageArea) {
-    observer.observe(messageArea, { childList: true, subtree: true });
-  }
 });
 
-// Function to render markdown in all .markdown-content elements
+// Function to render markdown in all .markdown-content elements that have not been rendered yet
 function renderMarkdown() {
-  const markdownElements = document.querySelectorAll('.markdown-content');
+  const markdownElements = document.querySelectorAll('.markdown-content:not([data-rendered])');
   markdownElements.forEach(element => {
     const originalText = element.textContent || element.innerText;
-    const renderedHTML = marked(originalText);
-    element.innerHTML = renderedHTML;
+    setMarkdown(element, originalText);
+  });
+}
+
+function setMarkdown(element, text) {
+  element.innerHTML = marked(text);
+  element.dataset.rendered = "true";
+}
+// 对话历史保存在服务器端，页面只渲染最近一页，滚动到顶部时按游标加载更早的消息
+let messageBefore = null;
+let hasOlderMessages = false;
+let loadingOlderMessages = false;
+
+function createMessage(type, text) {
+  const message = document.createElement("div");
+  message.className = `message ${type}`;
+  const bubble = document.createElement("div");
+  if (type === "ai") {
+    bubble.className = "bubble markdown-content";
+    setMarkdown(bubble, text);
+  } else {
+    bubble.className = "bubble";
+    bubble.textContent = text;
+  }
+  message.appendChild(bubble);
+  return message;
+}
+
+async function loadOlderMessages() {
+  if (!hasOlderMessages || loadingOlderMessages) {
+    return;
+  }
+  loadingOlderMessages = true;
+  const messageArea = document.getElementById("messageArea");
+  try {
+    const response = await fetch(`/messages?before=${messageBefore}`);
+    if (response.ok) {
+      const data = await response.json();
+      // 插入到顶部后保持当前可见位置不跳动
+      const previousHeight = messageArea.scrollHeight;
+      const fragment = document.createDocumentFragment();
+      data.messages.forEach((message) => fragment.appendChild(createMessage(message.type, message.text)));
+      messageArea.insertBefore(fragment, messageArea.firstChild);
+      messageArea.scrollTop += messageArea.scrollHeight - previousHeight;
+      messageBefore = data.before;
+      hasOlderMessages = data.has_more;
+    }
+  } catch (error) {
+    console.error("加载历史消息失败", error);
+  } finally {
+    loadingOlderMessages = false;
+  }
+}
+
+document.addEventListener("DOMContentLoaded", () => {
+  const messageArea = document.getElementById("messageArea");
+  if (messageArea) {
+    messageBefore = messageArea.dataset.before || null;
+    hasOlderMessages = messageArea.dataset.hasMore === "true" && messageBefore !== null;
+    messageArea.scrollTop = messageArea.scrollHeight;
+    messageArea.addEventListener("scroll", () => {
+      if (messageArea.scrollTop < 50) {
+        loadOlderMessages();
+      }
+    });
+  }
+});
+
+// 通过 /stream (Server-Sent Events) 发送消息，边生成边显示回复
+function appendMessage(type, text) {
+  const messageArea = document.getElementById("messageArea");
+  const message = document.createElement("div");
+  message.className = `message ${type}`;
+  const bubble = document.createElement("div");
+  bubble.className = "bubble";
+  bubble.textContent = text;
+  message.appendChild(bubble);
+  messageArea.appendChild(message);
+  messageArea.scrollTop = messageArea.scrollHeight;
+  return bubble;
+}
+
+// 日志带有递增的游标，SSE 推送与 /logs 轮询可能收到同一条，按游标去重
+const LOG_POLL_INTERVAL = 5000;
+const MAX_RENDERED_LOGS = 500;
+let logCursor = 0;
+
+function appendLog(record) {
+  if (record.cursor <= logCursor) {
+    return;
+  }
+  logCursor = record.cursor;
+  const logList = document.querySelector(".log-list");
+  const logItem = document.createElement("li");
+  logItem.className = `log-${record.level.toLowerCase()}`;
+  logItem.title = record.stage;
+  logItem.textContent = record.message;
+  logList.appendChild(logItem);
+  while (logList.children.length > MAX_RENDERED_LOGS) {
+    logList.removeChild(logList.firstElementChild);
+  }
+}
+
+async function fetchLogs() {
+  try {
+    const response = await fetch(`/logs?since=${logCursor}`);
+    if (response.ok) {
+      const data = await response.json();
+      data.logs.forEach(appendLog);
+    }
+  } catch (error) {
+    console.error("获取日志失败", error);
+  }
+}
+
+document.addEventListener("DOMContentLoaded", () => {
+  const logList = document.querySelector(".log-list");
+  if (logList) {
+    logCursor = parseInt(logList.dataset.cursor || "0", 10);
+    setInterval(() => {
+      if (!document.hidden) {
+        fetchLogs();
+      }
+    }, LOG_POLL_INTERVAL);
+  }
+});
+
+const chatForm = document.getElementById("chatForm");
+if (chatForm && window.EventSource) {
+  chatForm.addEventListener("submit", function (event) {
+    event.preventDefault();
+    const input = document.getElementById("userInput");
+    const agent = chatForm.querySelector("select[name=agent]").value;
+    const userText = input.value.trim();
+    if (!userText) {
+      return;
+    }
+    input.value = "";
+    appendMessage("user", userText);
+    const bubble = appendMessage("ai", "...");
+    const sendButton = chatForm.querySelector(".send-button");
+    sendButton.disabled = true;
+
+    let reply = "";
+    const params = new URLSearchParams({ agent: agent, userInput: userText });
+    const source = new EventSource(`/stream?${params.toString()}`);
+
+    source.addEventListener("chunk", (e) => {
+      reply += JSON.parse(e.data).text;
+      bubble.textContent = reply;
+    });
+    source.addEventListener("log", (e) => {
+      appendLog(JSON.parse(e.data));
+    });
+    source.addEventListener("done", () => {
+      source.close();
+      sendButton.disabled = false;
+      bubble.classList.add("markdown-content");
+      setMarkdown(bubble, reply);
+    });
+    source.onerror = () => {
+      // 连接中断时不自动重连，避免重复触发一次完整的 Agent 运行
+      source.close();
+      sendButton.disabled = false;
+      if (!reply) {
+        bubble.textContent = "连接中断，请重试。";
+      }
+    };
   });
-}
\ No newline at end of file
+}
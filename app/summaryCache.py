@@ -0,0 +1,93 @@
+import hashlib
+import os
+import re
+import sqlite3
+import time
+import unicodedata
+from contextlib import contextmanager
+from typing import Optional
+
+# 归一化时忽略的英文停用词，使 "The CRISPR screens" 与 "crispr screens" 等价
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "by", "for", "from", "in", "into", "is", "of", "on", "or",
+    "the", "to", "with", "about",
+}
+
+
+def normalize_topic(topic: str) -> str:
+    """Folds case, punctuation, whitespace and stop words; word order and plurals are kept."""
+    text = unicodedata.normalize("NFKC", topic or "").lower()
+    tokens = [token for token in re.findall(r"\w+", text) if token not in STOP_WORDS]
+    if not tokens:
+        # 全是停用词时退回到只折叠大小写和空白
+        return " ".join(text.split())
+    return " ".join(tokens)
+
+
+def topic_key(topic: str) -> str:
+    return hashlib.sha256(normalize_topic(topic).encode("utf-8")).hexdigest()
+
+
+class SummaryCache:
+    """Paper summaries shared by all sessions, keyed by the hash of the normalized topic.
+
+    Entries expire `ttl` seconds after they were written; beyond `max_entries` the least
+    recently read entries are evicted.
+    """
+
+    def __init__(self, db_file: str, ttl: float = 7 * 24 * 3600, max_entries: int = 1000):
+        self.db_file = db_file
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_file)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS summaries (
+                    key TEXT PRIMARY KEY,
+                    topic TEXT,
+                    normalized_topic TEXT,
+                    summary TEXT NOT NULL,
+                    created_at REAL,
+                    accessed_at REAL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_summaries_accessed ON summaries (accessed_at)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, topic: str) -> Optional[str]:
+        key = topic_key(topic)
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT summary, created_at FROM summaries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            summary, created_at = row
+            if now - created_at > self.ttl:
+                conn.execute("DELETE FROM summaries WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE summaries SET accessed_at = ? WHERE key = ?", (now, key))
+        return summary
+
+    def put(self, topic: str, summary: str) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?, ?, ?)",
+                (topic_key(topic), topic, normalize_topic(topic), summary, now, now),
+            )
+            conn.execute("DELETE FROM summaries WHERE created_at < ?", (now - self.ttl,))
+            conn.execute(
+                "DELETE FROM summaries WHERE key IN ("
+                "SELECT key FROM summaries ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
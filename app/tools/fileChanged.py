@@ -1,10 +1,92 @@
+import gzip
 import json
+import mmap
+import re
+import threading
+from collections import OrderedDict
+from itertools import islice
 from pathlib import Path
-from typing import Optional, List
+from typing import Optional, Tuple
 
 from phi.tools import Toolkit
 from phi.utils.log import logger
 
+from workspaceManifest import get_manifest
+
+# read_file 单次返回内容的上限，避免把整个大文件塞进 LLM 的上下文
+MAX_READ_BYTES = 64 * 1024
+# 行偏移索引每隔多少行记录一次字节偏移
+LINE_INDEX_STRIDE = 1000
+
+
+class LineIndex:
+    """Sparse line-offset index of a file: the byte offset of every `stride`-th line.
+
+    The index is extended lazily as far as requests need it, so jumping to line N costs at most
+    one scan of `stride` lines once that region of the file has been visited.
+    """
+
+    def __init__(self, stride: int = LINE_INDEX_STRIDE):
+        self.stride = stride
+        self.offsets = [0]  # offsets[k] is where line k * stride + 1 starts
+        self.complete = False
+
+    def seek_line(self, mm: mmap.mmap, line: int) -> Optional[int]:
+        """Returns the byte offset where 1-based `line` starts, or None past the end of the file."""
+        target = (line - 1) // self.stride
+        while len(self.offsets) <= target and not self.complete:
+            position = self.offsets[-1]
+            for _ in range(self.stride):
+                position = mm.find(b"\n", position)
+                if position == -1:
+                    break
+                position += 1
+            if position == -1 or position >= len(mm):
+                self.complete = True
+            else:
+                self.offsets.append(position)
+        if target >= len(self.offsets):
+            return None
+        position = self.offsets[target]
+        for _ in range((line - 1) % self.stride):
+            position = mm.find(b"\n", position)
+            if position == -1:
+                return None
+            position += 1
+        return position if position < len(mm) else None
+
+
+_line_indexes: "OrderedDict[Tuple[str, int, int], LineIndex]" = OrderedDict()
+_line_indexes_lock = threading.Lock()
+
+
+def _line_index(path: Path) -> LineIndex:
+    stat = path.stat()
+    key = (str(path), stat.st_mtime_ns, stat.st_size)
+    with _line_indexes_lock:
+        index = _line_indexes.get(key)
+        if index is None:
+            index = _line_indexes[key] = LineIndex()
+            while len(_line_indexes) > 64:
+                _line_indexes.popitem(last=False)
+        _line_indexes.move_to_end(key)
+        return index
+
+
+def _count_newlines(mm: mmap.mmap, begin: int, end: int, window: int = 1024 * 1024) -> int:
+    """Counts the newlines in mm[begin:end] one window at a time, so memory use stays bounded."""
+    total = 0
+    for position in range(begin, end, window):
+        total += mm[position:min(end, position + window)].count(b"\n")
+    return total
+
+
+def _cap(text: str, max_bytes: int, hint: str) -> str:
+    data = text.encode("utf-8")
+    if len(data) <= max_bytes:
+        return text
+    return data[:max_bytes].decode("utf-8", errors="ignore") + f"\n... [truncated at {max_bytes} bytes; {hint}]"
+
 
 class FileTools(Toolkit):
     def __init__(
@@ -46,31 +128,136 @@ class FileTools(Toolkit):
             logger.error(f"Error saving to file: {e}")
             return f"Error saving to file: {e}"
 
-    def read_file(self, file_name: str) -> str:
-        """Reads the contents of the file `file_name` and returns the contents if successful.
+    def read_file(
+        self,
+        file_name: str,
+        mode: str = "auto",
+        start: Optional[int] = None,
+        count: int = 100,
+        pattern: Optional[str] = None,
+        max_bytes: int = MAX_READ_BYTES,
+    ) -> str:
+        """Reads part of the file `file_name` without loading the whole file into memory.
+
+        Modes:
+        - "auto": the whole file if it is small, otherwise its first `count` lines and its size.
+        - "head" / "tail": the first / last `count` lines.
+        - "lines": `count` lines starting at line `start` (1-based), for paging through large files.
+        - "bytes": `count` bytes starting at byte offset `start` (0-based).
+        - "grep": up to `count` lines matching the regular expression `pattern`, with line numbers.
+        Compressed (.gz) files support "auto", "head", "lines" and "grep".
 
         :param file_name: The name of the file to read.
-        :return: The contents of the file if successful, otherwise returns an error message.
+        :param mode: One of "auto", "head", "tail", "lines", "bytes" or "grep".
+        :param start: First line (mode "lines", default 1) or byte offset (mode "bytes", default 0).
+        :param count: Number of lines, bytes or matches to return.
+        :param pattern: Regular expression for mode "grep".
+        :param max_bytes: Maximum size of the returned text; the result is truncated beyond it.
+        :return: The requested contents if successful, otherwise returns an error message.
         """
         try:
-            logger.info(f"Reading file: {file_name}")
+            logger.info(f"Reading file: {file_name} ({mode})")
+            if start is None:
+                start = 0 if mode == "bytes" else 1
             file_path = self.base_dir.joinpath(file_name)
-            contents = file_path.read_text(encoding='utf-8')
-            return str(contents)
+            max_bytes = min(max_bytes, MAX_READ_BYTES)
+            size = file_path.stat().st_size
+            if file_path.suffix == ".gz":
+                return _cap(self._read_gzip(file_path, mode, start, count, pattern), max_bytes, "use mode 'lines' to page")
+            if size == 0:
+                return ""
+            if mode == "auto":
+                if size <= max_bytes:
+                    return file_path.read_text(encoding="utf-8", errors="replace")
+                mode = "head"
+                prefix = f"[{file_name} is {size} bytes; showing the first {count} lines, use mode 'lines', 'tail' or 'grep' for more]\n"
+            else:
+                prefix = ""
+
+            with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if mode in ("head", "lines"):
+                    begin = _line_index(file_path).seek_line(mm, start if mode == "lines" else 1)
+                    if begin is None:
+                        return f"Line {start} is past the end of {file_name}"
+                    end = begin
+                    for _ in range(count):
+                        end = mm.find(b"\n", end)
+                        if end == -1 or end - begin > max_bytes:
+                            end = len(mm) if end == -1 else end
+                            break
+                        end += 1
+                    text = prefix + mm[begin:min(end, begin + max_bytes + 1)].decode("utf-8", errors="replace")
+                    return _cap(text, max_bytes, "use mode 'lines' to page")
+                if mode == "tail":
+                    begin = len(mm) - 1 if mm[-1:] == b"\n" else len(mm)
+                    for _ in range(count):
+                        begin = mm.rfind(b"\n", max(0, len(mm) - max_bytes - 1), begin)
+                        if begin == -1:
+                            break
+                    begin = begin + 1 if begin != -1 else max(0, len(mm) - max_bytes)
+                    return mm[begin:].decode("utf-8", errors="replace")
+                if mode == "bytes":
+                    return mm[max(0, start):max(0, start) + min(count, max_bytes)].decode("utf-8", errors="replace")
+                if mode == "grep":
+                    if not pattern:
+                        return "Error reading file: mode 'grep' needs a pattern"
+                    matches = []
+                    line_no, position = 1, 0
+                    for match in re.finditer(pattern.encode("utf-8"), mm, re.MULTILINE):
+                        line_start = mm.rfind(b"\n", 0, match.start()) + 1
+                        if matches and line_start <= position:
+                            continue
+                        line_no += _count_newlines(mm, position, line_start)
+                        line_end = mm.find(b"\n", match.end())
+                        line_end = len(mm) if line_end == -1 else line_end
+                        # 单行文件（如不换行的 FASTA）只截取匹配附近的 max_bytes 字节
+                        begin = max(line_start, match.start() - max_bytes // 2)
+                        end = min(line_end, begin + max_bytes)
+                        matches.append(f"{line_no}: {mm[begin:end].decode('utf-8', errors='replace')}")
+                        position = line_start
+                        if len(matches) >= count:
+                            break
+                    if not matches:
+                        return f"No lines in {file_name} match {pattern}"
+                    return _cap("\n".join(matches), max_bytes, "narrow the pattern")
+            return f"Error reading file: unknown mode {mode}"
         except Exception as e:
             logger.error(f"Error reading file: {e}")
             return f"Error reading file: {e}"
 
-    def list_files(self, file_extension: Optional[str] = None) -> str:
-        """Returns a list of files in the base directory, optionally filtered by file extension.
+    @staticmethod
+    def _read_gzip(file_path: Path, mode: str, start: int, count: int, pattern: Optional[str]) -> str:
+        with gzip.open(file_path, "rt", encoding="utf-8", errors="replace") as f:
+            if mode in ("auto", "head"):
+                return "".join(islice(f, count))
+            if mode == "lines":
+                return "".join(islice(f, max(0, start - 1), max(0, start - 1) + count))
+            if mode == "grep":
+                if not pattern:
+                    return "Error reading file: mode 'grep' needs a pattern"
+                regex = re.compile(pattern)
+                matches = (f"{line_no}: {line.rstrip()}" for line_no, line in enumerate(f, 1) if regex.search(line))
+                return "\n".join(islice(matches, count)) or f"No lines in {file_path.name} match {pattern}"
+        return f"Error reading file: mode {mode} is not supported for compressed files"
+
+    def list_files(self, file_extension: Optional[str] = None, summary: bool = False, limit: int = 500) -> str:
+        """Returns the files below the base directory (recursively), optionally filtered by file extension.
 
-        :param file_extension: The file extension to filter by (e.g., '.txt'). If None, lists all files.
+        :param file_extension: The file extension to filter by (e.g., '.txt' or '.vcf.gz'). If None, lists all files.
+        :param summary: Return a compact summary grouped by name pattern (e.g. 'sample_*.vcf.gz (240 files, 18 GB)') instead.
+        :param limit: The maximum number of files to list.
         :return: A JSON string of the list of files if successful, otherwise returns an error message.
         """
         try:
             logger.info(f"Reading files in: {self.base_dir}")
-            files = [str(file_path) for file_path in self.base_dir.iterdir() if file_extension is None or file_path.suffix == file_extension]
-            return json.dumps(files, indent=4)
+            manifest = get_manifest(str(self.base_dir))
+            if summary:
+                return manifest.summary()
+            files = [entry for entry in manifest.refresh() if file_extension is None or entry.path.endswith(file_extension)]
+            listing = [{"path": entry.path, "size": entry.size, "format": entry.format} for entry in files[:limit]]
+            if len(files) > limit:
+                listing.append({"truncated": f"{len(files) - limit} more files, use summary=True or a file_extension filter"})
+            return json.dumps(listing, indent=1)
         except Exception as e:
             logger.error(f"Error reading files: {e}")
-            return f"Error reading files: {e}"
\ No newline at end of file
+            return f"Error reading files: {e}"
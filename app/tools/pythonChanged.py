@@ -0,0 +1,153 @@
+import shlex
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Optional, Union
+
+from phi.tools import Toolkit
+from phi.utils.log import logger
+
+from tools.shellChanged import run_command_streaming
+from pythonKernel import KernelError
+from metrics import record_tool
+
+# 在子进程中运行脚本，并按需打印指定变量的值
+_RUNNER = """
+import runpy, sys
+result = runpy.run_path(sys.argv[1], run_name="__main__")
+if len(sys.argv) > 2:
+    print("__VARIABLE__" + repr(result.get(sys.argv[2])))
+"""
+
+
+def _tail_lines(path: Path, lines: int, max_bytes: int = 256 * 1024) -> str:
+    """Returns the last `lines` lines of `path`, reading at most `max_bytes` from its end."""
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, 2)
+            size = f.tell()
+            f.seek(max(0, size - max_bytes))
+            data = f.read()
+    except FileNotFoundError:
+        return ""
+    text = data.decode("utf-8", errors="replace")
+    return "".join(text.splitlines(keepends=True)[-lines:])
+
+
+class PythonTools(Toolkit):
+    def __init__(
+        self,
+        base_dir: Optional[Union[Path, str]] = None,
+        timeout: Optional[float] = 3600,
+        max_output_bytes: Optional[int] = 64 * 1024 * 1024,
+        kernel_pool=None,
+        tail: int = 100,
+    ):
+        super().__init__(name="python_tools")
+
+        self.base_dir: Path = Path(base_dir) if base_dir is not None else Path.cwd()
+        self.timeout = timeout
+        self.max_output_bytes = max_output_bytes
+        # 提供 kernel_pool 时脚本在本会话的常驻解释器中运行，变量在任务之间保留
+        self.kernel_pool = kernel_pool
+        self.tail = tail
+
+        self.register(self.save_to_file_and_run, sanitize_arguments=False)
+        if kernel_pool is not None:
+            self.register(self.restart_python_kernel)
+
+    def restart_python_kernel(self) -> str:
+        """Discards all variables kept in memory by previous runs and starts a fresh Python interpreter.
+
+        :return: A message saying whether a kernel was stopped.
+        """
+        if self.kernel_pool.reset(str(self.base_dir)):
+            return "Python kernel restarted, previous variables were discarded"
+        return "No Python kernel was running"
+
+    def _run_in_kernel(self, file_name: str, file_path: Path, log_file: Path, variable_to_return: Optional[str]) -> str:
+        log_file.parent.mkdir(parents=True, exist_ok=True)
+        started = time.monotonic()
+        try:
+            reply = self.kernel_pool.run(
+                str(self.base_dir),
+                str(file_path),
+                cwd=str(self.base_dir),
+                log_file=str(log_file),
+                variable=variable_to_return,
+                timeout=self.timeout,
+                max_output_bytes=self.max_output_bytes,
+            )
+        except KernelError as e:
+            record_tool("python", "kernel", time.monotonic() - started, "killed")
+            return f"Error running {file_name}: {e}. Full output: {log_file}"
+        record_tool("python", "kernel", time.monotonic() - started, 0 if reply["ok"] else "error")
+        output = _tail_lines(log_file, self.tail)
+        if not reply["ok"]:
+            return f"Error running {file_name}:\n{output}{reply['error']}"
+        if variable_to_return:
+            if reply.get("variable") in (None, "None"):
+                return f"Variable {variable_to_return} not found"
+            return reply["variable"]
+        return output or f"successfully ran {str(file_path)}"
+
+    def save_to_file_and_run(
+        self, file_name: str, code: str, variable_to_return: Optional[str] = None, overwrite: bool = True
+    ) -> str:
+        """This function saves Python code to a file called `file_name` and then runs it.
+        If successful, returns the value of `variable_to_return` if provided otherwise returns the output of the run.
+        If failed, returns an error message.
+
+        Make sure the file_name ends with `.py`
+
+        :param file_name: The name of the file the code will be saved to.
+        :param code: The code to save and run.
+        :param variable_to_return: The variable to return.
+        :param overwrite: Overwrite the file if it already exists.
+        :return: if run is successful, the value of `variable_to_return` if provided else the output of the run.
+        """
+        try:
+            file_path = self.base_dir.joinpath(file_name)
+            logger.debug(f"Saving code to {file_path}")
+            if not file_path.parent.exists():
+                file_path.parent.mkdir(parents=True, exist_ok=True)
+            if file_path.exists() and not overwrite:
+                return f"File {file_name} already exists"
+            file_path.write_text(code, encoding="utf-8")
+            logger.info(f"Running {file_path}")
+
+            log_file = self.base_dir.joinpath(".shell_logs", f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.log")
+            if self.kernel_pool is not None:
+                return self._run_in_kernel(file_name, file_path, log_file, variable_to_return)
+
+            # 在工作目录中以独立进程运行，相对路径不依赖服务进程的 CWD
+            command = [sys.executable, "-c", _RUNNER, str(file_path)]
+            if variable_to_return:
+                command.append(variable_to_return)
+            started = time.monotonic()
+            result = run_command_streaming(
+                shlex.join(command),
+                cwd=self.base_dir,
+                log_file=log_file,
+                timeout=self.timeout,
+                max_output_bytes=self.max_output_bytes,
+            )
+            record_tool("python", "subprocess", time.monotonic() - started,
+                        (result["killed"] or "").replace(" ", "_") or result["returncode"])
+            if result["killed"]:
+                return f"Error running {file_name}: killed ({result['killed']}). Full output: {log_file}"
+            if result["returncode"] != 0:
+                return f"Error running {file_name}:\n{result['stderr']}"
+
+            output = result["stdout"]
+            if variable_to_return:
+                marker = output.rfind("__VARIABLE__")
+                if marker == -1 or output[marker + len("__VARIABLE__"):].strip() == "None":
+                    return f"Variable {variable_to_return} not found"
+                return output[marker + len("__VARIABLE__"):].strip()
+            return output or f"successfully ran {str(file_path)}"
+        except Exception as e:
+            logger.error(f"Error saving and running code: {e}")
+            return f"Error saving and running code: {e}"
+
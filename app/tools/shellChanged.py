@@ -1,17 +1,193 @@
+import os
+import re
+import shlex
+import signal
+import subprocess
+import threading
+import time
+import uuid
+from collections import deque
 from pathlib import Path
-from typing import List, Optional, Union
+from typing import Callable, Iterable, List, Optional, Union
 
 from phi.tools import Toolkit
 from phi.utils.log import logger
 
+from metrics import record_tool
+
+
+def run_command_streaming(
+    command: str,
+    cwd: Optional[Union[Path, str]] = None,
+    log_file: Optional[Union[Path, str]] = None,
+    tail: int = 100,
+    timeout: Optional[float] = None,
+    max_output_bytes: Optional[int] = None,
+    on_start: Optional[Callable[[subprocess.Popen], None]] = None,
+) -> dict:
+    """Runs a shell command while reading its pipes incrementally.
+
+    Only the last `tail` lines of stdout and stderr are kept in memory; the full output is
+    written to `log_file` when given. The process group is killed when it runs longer than
+    `timeout` seconds or writes more than `max_output_bytes` bytes in total. `on_start` is
+    called with the Popen object right after the process starts.
+
+    Returns a dict with `returncode`, `stdout` and `stderr` (the tails), `output_bytes`,
+    `log_file` and `killed` (None, "timeout" or "output limit").
+    """
+    stdout_tail: deque = deque(maxlen=tail)
+    stderr_tail: deque = deque(maxlen=tail)
+    state = {"output_bytes": 0, "killed": None}
+    lock = threading.Lock()
+
+    log_handle = None
+    if log_file is not None:
+        Path(log_file).parent.mkdir(parents=True, exist_ok=True)
+        log_handle = open(log_file, "wb")
+
+    process = subprocess.Popen(
+        command,
+        shell=True,
+        cwd=str(cwd) if cwd is not None else None,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=True,
+    )
+    if on_start is not None:
+        on_start(process)
+
+    def kill(reason: str) -> None:
+        if state["killed"] is None:
+            state["killed"] = reason
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def reader(pipe, lines: deque) -> None:
+        partial = b""
+        for chunk in iter(lambda: pipe.read1(65536), b""):
+            with lock:
+                state["output_bytes"] += len(chunk)
+                if log_handle is not None:
+                    log_handle.write(chunk)
+                    log_handle.flush()
+                over_limit = max_output_bytes is not None and state["output_bytes"] > max_output_bytes
+            parts = (partial + chunk).split(b"\n")
+            # 未结束的行只保留末尾部分，避免超长行占用内存
+            partial = parts.pop()[-65536:]
+            for part in parts[-tail:] if tail > 0 else []:
+                lines.append(part.decode("utf-8", errors="replace"))
+            if over_limit:
+                kill("output limit")
+        if partial:
+            lines.append(partial.decode("utf-8", errors="replace"))
+        pipe.close()
+
+    readers = [
+        threading.Thread(target=reader, args=(process.stdout, stdout_tail), daemon=True),
+        threading.Thread(target=reader, args=(process.stderr, stderr_tail), daemon=True),
+    ]
+    for thread in readers:
+        thread.start()
+
+    started = time.monotonic()
+    try:
+        process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        kill("timeout")
+        process.wait()
+    for thread in readers:
+        thread.join()
+    if log_handle is not None:
+        log_handle.close()
+    logger.debug(f"Command finished in {time.monotonic() - started:.1f}s with code {process.returncode}")
+
+    return {
+        "returncode": process.returncode,
+        "stdout": "\n".join(stdout_tail),
+        "stderr": "\n".join(stderr_tail),
+        "output_bytes": state["output_bytes"],
+        "log_file": str(log_file) if log_file is not None else None,
+        "killed": state["killed"],
+    }
+
+
+# 这些前缀之后的单词才是真正执行的程序
+COMMAND_PREFIXES = {"sudo", "nohup", "time", "nice", "exec"}
+
+
+def _shell_tokens(command: str) -> List[str]:
+    # 换行和分号一样分隔命令
+    lexer = shlex.shlex(re.sub(r"[\r\n]", ";", command), posix=True, punctuation_chars=True)
+    lexer.whitespace_split = True
+    # shell 只在单词开头识别 #，shlex 会把单词中间的 # 也当作注释
+    lexer.commenters = ""
+    return list(lexer)
+
+
+def command_programs(command: str) -> List[str]:
+    """Returns the program names invoked by a shell command line, e.g. ['bwa', 'samtools'].
+
+    Quotes and escapes are resolved the way the shell resolves them, and line breaks separate
+    commands. Raises ValueError when a quote is not closed.
+    """
+    programs = []
+    expect_program, skip_file = True, False
+    for token in _shell_tokens(command):
+        if token and all(char in "();<>|&" for char in token):
+            if ("<" in token or ">" in token) and not token.endswith("("):
+                # 重定向的目标是文件名，重定向也可以写在程序名之前
+                skip_file = True
+            else:
+                expect_program = True
+            continue
+        if skip_file:
+            skip_file = False
+        elif expect_program and token not in COMMAND_PREFIXES:
+            programs.append(os.path.basename(token))
+            expect_program = False
+    return programs
+
+
+def is_allowed_command(command: str, allowed: Iterable[str]) -> bool:
+    """True when every program `command` runs is in `allowed`.
+
+    Command substitution and line breaks are rejected outright, as are commands that cannot
+    be tokenized.
+    """
+    if any(marker in command for marker in ("`", "$(", "\n", "\r")):
+        return False
+    try:
+        programs = command_programs(command)
+    except ValueError:
+        return False
+    return bool(programs) and set(programs) <= set(allowed)
+
 
 class ShellTools(Toolkit):
-    def __init__(self, base_dir: Optional[Union[Path, str]] = None):
+    def __init__(
+        self,
+        base_dir: Optional[Union[Path, str]] = None,
+        timeout: Optional[float] = 3600,
+        max_output_bytes: Optional[int] = 512 * 1024 * 1024,
+        log_dir: Optional[Union[Path, str]] = None,
+        job_queue=None,
+        background_programs: Optional[List[str]] = None,
+    ):
         super().__init__(name="shell_tools")
 
         self.base_dir: Optional[Path] = None
         if base_dir is not None:
             self.base_dir = Path(base_dir) if isinstance(base_dir, str) else base_dir
+        # 运行时间与输出大小上限，None 表示不限制
+        self.timeout = timeout
+        self.max_output_bytes = max_output_bytes
+        # 完整输出写入日志目录，默认为工作目录下的 .shell_logs
+        self.log_dir: Optional[Path] = Path(log_dir) if log_dir is not None else None
+        # 调用这些程序的命令交给后台任务队列执行，立即返回任务编号
+        self.job_queue = job_queue
+        self.background_programs = set(background_programs or [])
 
         self.register(self.run_shell_command)
 
@@ -24,24 +200,39 @@ class ShellTools(Toolkit):
         Returns:
             str: The output of the command.
         """
-        import subprocess
-
         try:
             logger.info(f"Running shell command: {args}")
             # 拼接命令字符串
-            if self.base_dir:
-                command = f"cd {str(self.base_dir)} && " + " ".join(args)
-            else:
-                command = " ".join(args)
-            
-            # 使用 shell=True 执行命令
-            result = subprocess.run(command, shell=True, capture_output=True, text=True)
+            command = " ".join(args)
+            if self.job_queue is not None and self.background_programs.intersection(command_programs(command)):
+                cwd = str(self.base_dir or Path.cwd())
+                job_id = self.job_queue.submit(command, cwd=cwd)
+                return f"Submitted background job {job_id}. Check its progress at /jobs/{job_id} and /jobs/{job_id}/log."
+            log_dir = self.log_dir or (self.base_dir or Path.cwd()).joinpath(".shell_logs")
+            log_file = log_dir.joinpath(f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.log")
+
+            started = time.monotonic()
+            result = run_command_streaming(
+                command,
+                cwd=self.base_dir,
+                log_file=log_file,
+                tail=tail,
+                timeout=self.timeout,
+                max_output_bytes=self.max_output_bytes,
+            )
+            programs = command_programs(command)
+            record_tool("shell", programs[0] if programs else "sh", time.monotonic() - started,
+                        (result["killed"] or "").replace(" ", "_") or result["returncode"])
             logger.debug(f"Result: {result}")
-            logger.debug(f"Return code: {result.returncode}")
-            if result.returncode != 0:
-                return f"Error: {result.stderr}"
+            logger.debug(f"Return code: {result['returncode']}")
+            if result["killed"] == "timeout":
+                return f"Error: command killed after {self.timeout} seconds. Full output: {log_file}\n{result['stderr']}"
+            if result["killed"] == "output limit":
+                return f"Error: command killed after writing more than {self.max_output_bytes} bytes. Full output: {log_file}\n{result['stdout']}"
+            if result["returncode"] != 0:
+                return f"Error: {result['stderr']}"
             # 返回输出的最后 n 行
-            return "\n".join(result.stdout.split("\n")[-tail:])
+            return result["stdout"]
         except Exception as e:
             logger.warning(f"Failed to run shell command: {e}")
-            return f"Error: {e}"
\ No newline at end of file
+            return f"Error: {e}"
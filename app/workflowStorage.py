@@ -0,0 +1,246 @@
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from phi.storage.workflow.base import WorkflowStorage
+from phi.utils.log import logger
+from phi.workflow.session import WorkflowSession
+
+_COLUMNS = ("session_id", "workflow_id", "user_id", "memory", "workflow_data", "user_data", "session_data",
+            "created_at", "updated_at")
+_JSON_COLUMNS = ("memory", "workflow_data", "user_data", "session_data")
+
+
+class WorkflowStore:
+    """One SQLite table for the sessions of every workflow, shared by all requests.
+
+    Sessions are keyed by (workflow, session_id), so the table does not change between
+    restarts. The database runs in WAL mode so reads never wait for writes; connections come
+    from a small pool; `upsert` only buffers the session and a background thread writes all
+    buffered sessions in one transaction every `flush_interval` seconds. The same thread
+    deletes sessions not updated for `retention_days` and compacts the file.
+    """
+
+    def __init__(self, db_file: str, pool_size: int = 4, flush_interval: float = 0.5,
+                 retention_days: Optional[float] = 90, maintenance_interval: float = 3600):
+        self.db_file = db_file
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.maintenance_interval = maintenance_interval
+        self._pool: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        # (workflow, session_id) -> 已序列化的数据行
+        self._pending: Dict[Tuple[str, str], tuple] = {}
+        self._inflight: Dict[Tuple[str, str], tuple] = {}
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_file)), exist_ok=True)
+        for _ in range(pool_size):
+            conn = sqlite3.connect(db_file, timeout=30, check_same_thread=False)
+            # 增量 VACUUM 只能在新建数据库、切换到 WAL 之前设置，之后可以分批归还空闲页
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._pool.put(conn)
+        self.create()
+
+        threading.Thread(target=self._writer, name="workflow-storage", daemon=True).start()
+        atexit.register(self.flush)
+
+    @contextmanager
+    def connection(self):
+        conn = self._pool.get()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._pool.put(conn)
+
+    def create(self) -> None:
+        with self.connection() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS workflow_sessions (
+                    workflow TEXT NOT NULL,
+                    session_id TEXT NOT NULL,
+                    workflow_id TEXT,
+                    user_id TEXT,
+                    memory TEXT,
+                    workflow_data TEXT,
+                    user_data TEXT,
+                    session_data TEXT,
+                    created_at INTEGER,
+                    updated_at INTEGER,
+                    PRIMARY KEY (workflow, session_id)
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_workflow_sessions_updated ON workflow_sessions (updated_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_workflow_sessions_user ON workflow_sessions (workflow, user_id)")
+
+    def storage(self, workflow: str) -> "ConsolidatedWorkflowStorage":
+        return ConsolidatedWorkflowStorage(self, workflow)
+
+    def read(self, workflow: str, session_id: str, user_id: Optional[str] = None) -> Optional[WorkflowSession]:
+        with self._pending_lock:
+            row = self._pending.get((workflow, session_id)) or self._inflight.get((workflow, session_id))
+        if row is not None:
+            row = row[1:]
+        else:
+            with self.connection() as conn:
+                row = conn.execute(
+                    f"SELECT {', '.join(_COLUMNS)} FROM workflow_sessions WHERE workflow = ? AND session_id = ?",
+                    (workflow, session_id),
+                ).fetchone()
+        session = _to_session(row) if row else None
+        if session is not None and user_id is not None and session.user_id != user_id:
+            return None
+        return session
+
+    def list_sessions(self, workflow: str, user_id: Optional[str] = None,
+                      workflow_id: Optional[str] = None) -> List[WorkflowSession]:
+        self.flush()
+        query = f"SELECT {', '.join(_COLUMNS)} FROM workflow_sessions WHERE workflow = ?"
+        params: list = [workflow]
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        if workflow_id is not None:
+            query += " AND workflow_id = ?"
+            params.append(workflow_id)
+        with self.connection() as conn:
+            rows = conn.execute(query + " ORDER BY created_at DESC", params).fetchall()
+        return [_to_session(row) for row in rows]
+
+    def upsert(self, workflow: str, session: WorkflowSession) -> WorkflowSession:
+        now = int(time.time())
+        key = (workflow, session.session_id)
+        with self._pending_lock:
+            previous = self._pending.get(key) or self._inflight.get(key)
+        if previous is not None:
+            created_at = previous[_COLUMNS.index("created_at") + 1]
+        else:
+            stored = self.read(workflow, session.session_id)
+            created_at = stored.created_at if stored else None
+        # 立即序列化，缓冲区中保存的是此刻的快照，之后对会话对象的修改不会影响它
+        row = (workflow, session.session_id, session.workflow_id, session.user_id,
+               *(json.dumps(getattr(session, column), ensure_ascii=False, default=str) for column in _JSON_COLUMNS),
+               created_at or now, now)
+        with self._pending_lock:
+            self._pending[key] = row
+        self._wakeup.set()
+        return _to_session(row[1:])
+
+    def delete(self, workflow: str, session_id: Optional[str] = None) -> None:
+        with self._pending_lock:
+            for key in [key for key in self._pending if key[0] == workflow and session_id in (None, key[1])]:
+                del self._pending[key]
+        with self._flush_lock, self.connection() as conn:
+            if session_id is None:
+                conn.execute("DELETE FROM workflow_sessions WHERE workflow = ?", (workflow,))
+            else:
+                conn.execute("DELETE FROM workflow_sessions WHERE workflow = ? AND session_id = ?", (workflow, session_id))
+
+    def flush(self) -> int:
+        """Writes every buffered session in one transaction and returns how many were written."""
+        with self._flush_lock:
+            with self._pending_lock:
+                pending, self._pending = self._pending, {}
+                self._inflight = pending
+            if not pending:
+                return 0
+            rows = list(pending.values())
+            try:
+                with self.connection() as conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO workflow_sessions (workflow, " + ", ".join(_COLUMNS) + ") "
+                        "VALUES (" + ", ".join("?" * (len(_COLUMNS) + 1)) + ")",
+                        rows,
+                    )
+            except sqlite3.Error:
+                # 写入失败时放回缓冲区，除非期间已有更新的版本
+                with self._pending_lock:
+                    for key, row in pending.items():
+                        self._pending.setdefault(key, row)
+                raise
+            finally:
+                with self._pending_lock:
+                    self._inflight = {}
+            return len(rows)
+
+    def maintain(self) -> int:
+        """Deletes sessions older than the retention period and returns freed pages to the file system."""
+        removed = 0
+        if self.retention_days:
+            cutoff = int(time.time() - self.retention_days * 86400)
+            with self._flush_lock, self.connection() as conn:
+                removed = conn.execute("DELETE FROM workflow_sessions WHERE updated_at < ?", (cutoff,)).rowcount
+        with self.connection() as conn:
+            conn.execute("PRAGMA incremental_vacuum")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        if removed:
+            logger.info(f"Removed {removed} workflow sessions older than {self.retention_days} days")
+        return removed
+
+    def _writer(self) -> None:
+        last_maintenance = 0.0
+        while True:
+            self._wakeup.wait(self.maintenance_interval)
+            time.sleep(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+                if time.time() - last_maintenance > self.maintenance_interval:
+                    last_maintenance = time.time()
+                    self.maintain()
+            except Exception as e:
+                logger.error(f"Workflow storage error: {e}")
+
+
+def _to_session(row) -> WorkflowSession:
+    data = dict(zip(_COLUMNS, row))
+    for column in _JSON_COLUMNS:
+        data[column] = json.loads(data[column]) if data[column] else None
+    return WorkflowSession(**data)
+
+
+class ConsolidatedWorkflowStorage(WorkflowStorage):
+    """The WorkflowStorage of one workflow type, backed by a shared WorkflowStore."""
+
+    def __init__(self, store: WorkflowStore, workflow: str):
+        self.store = store
+        self.workflow = workflow
+
+    def create(self) -> None:
+        self.store.create()
+
+    def read(self, session_id: str, user_id: Optional[str] = None) -> Optional[WorkflowSession]:
+        return self.store.read(self.workflow, session_id, user_id)
+
+    def get_all_session_ids(self, user_id: Optional[str] = None, workflow_id: Optional[str] = None) -> List[str]:
+        return [session.session_id for session in self.store.list_sessions(self.workflow, user_id, workflow_id)]
+
+    def get_all_sessions(self, user_id: Optional[str] = None, workflow_id: Optional[str] = None) -> List[WorkflowSession]:
+        return self.store.list_sessions(self.workflow, user_id, workflow_id)
+
+    def upsert(self, session: WorkflowSession) -> Optional[WorkflowSession]:
+        return self.store.upsert(self.workflow, session)
+
+    def delete_session(self, session_id: Optional[str] = None):
+        if session_id is not None:
+            self.store.delete(self.workflow, session_id)
+
+    def drop(self) -> None:
+        self.store.delete(self.workflow)
+
+    def upgrade_schema(self) -> None:
+        pass
+
+    def __deepcopy__(self, memo):
+        # 连接池与写缓冲区由所有副本共享
+        return ConsolidatedWorkflowStorage(self.store, self.workflow)
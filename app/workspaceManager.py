@@ -0,0 +1,57 @@
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable
+
+
+class WorkspaceManager:
+    """Gives every browser session its own directory under `root`.
+
+    Nothing here changes the process working directory: callers get an absolute path and
+    pass it on explicitly (e.g. as `base_dir` of FileTools/ShellTools), so several sessions
+    can be served by one threaded process. Per-session objects such as workflows can be kept
+    with `get_state`, which evicts the least recently used sessions beyond `max_sessions`.
+    """
+
+    _SESSION_ID = re.compile(r"^[A-Za-z0-9-]{8,64}$")
+
+    def __init__(self, root: str, max_sessions: int = 256):
+        self.root = Path(root).resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_sessions = max_sessions
+        self._states: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def new_session_id() -> str:
+        return str(uuid.uuid4())
+
+    def path(self, session_id: str) -> Path:
+        """Returns the workspace directory of `session_id`, creating it if needed."""
+        if not self._SESSION_ID.match(session_id or ""):
+            raise ValueError(f"Invalid session id: {session_id!r}")
+        workspace = self.root.joinpath(session_id)
+        workspace.mkdir(parents=True, exist_ok=True)
+        return workspace
+
+    def resolve(self, session_id: str, relative_path: str) -> Path:
+        """Resolves a path inside the session workspace, refusing paths that escape it."""
+        workspace = self.path(session_id)
+        target = workspace.joinpath(relative_path).resolve()
+        if target != workspace and workspace not in target.parents:
+            raise ValueError(f"Path outside of workspace: {relative_path}")
+        return target
+
+    def get_state(self, session_id: str, factory: Callable[[str, Path], Any]) -> Any:
+        """Returns the per-session object built by `factory(session_id, workspace)`."""
+        with self._lock:
+            if session_id in self._states:
+                self._states.move_to_end(session_id)
+                return self._states[session_id]
+            state = factory(session_id, self.path(session_id))
+            self._states[session_id] = state
+            while len(self._states) > self.max_sessions:
+                self._states.popitem(last=False)
+            return state
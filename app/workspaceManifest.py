@@ -0,0 +1,165 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# 工具自身产生的目录不计入清单
+DEFAULT_EXCLUDE_DIRS = {".shell_logs", ".jobs", ".uploads", "__pycache__", ".git", ".ipynb_checkpoints"}
+
+_FORMATS = {
+    ".fa": "fasta", ".fasta": "fasta", ".fna": "fasta", ".faa": "fasta", ".fas": "fasta",
+    ".fq": "fastq", ".fastq": "fastq",
+    ".vcf": "vcf", ".bcf": "bcf", ".bam": "bam", ".sam": "sam", ".cram": "cram",
+    ".bai": "index", ".csi": "index", ".tbi": "index", ".fai": "index", ".crai": "index",
+    ".bed": "bed", ".gff": "gff", ".gff3": "gff", ".gtf": "gtf", ".gb": "genbank", ".gbk": "genbank",
+    ".phy": "phylip", ".nwk": "newick", ".tre": "newick", ".aln": "alignment",
+    ".csv": "csv", ".tsv": "tsv", ".txt": "text", ".log": "text", ".md": "text", ".json": "json",
+    ".py": "python", ".sh": "shell", ".r": "r",
+    ".png": "image", ".jpg": "image", ".jpeg": "image", ".svg": "image", ".pdf": "pdf",
+}
+_COMPRESSION = {".gz", ".bgz", ".bz2", ".xz", ".zst"}
+# fileStats 写在数据文件旁边的统计文件，不单独列出
+HIDDEN_SUFFIXES = (".stats.json",)
+
+
+class FileEntry(NamedTuple):
+    path: str  # relative to the workspace root
+    size: int
+    mtime: float
+    format: str
+
+
+def detect_format(name: str) -> str:
+    """Guesses the file format from its extensions, e.g. `x.vcf.gz` -> `vcf.gz`."""
+    stem, ext = os.path.splitext(name.lower())
+    if ext in _COMPRESSION:
+        inner = os.path.splitext(stem)[1]
+        return f"{_FORMATS.get(inner, 'unknown')}{ext}" if inner in _FORMATS else ext[1:]
+    return _FORMATS.get(ext, "unknown")
+
+
+def human_size(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if size < 1024 or unit == "TB":
+            return f"{size:.0f} {unit}" if unit == "B" or size >= 10 else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+class WorkspaceManifest:
+    """Cached, incrementally refreshed listing of every file below `root`.
+
+    A directory is only re-listed when its mtime changed (a file was created, removed or
+    renamed in it) or its cached file sizes are older than `stat_ttl` seconds, so refreshing a
+    large, mostly unchanged workspace costs one stat per directory.
+    """
+
+    def __init__(self, root: str, exclude_dirs: Iterable[str] = DEFAULT_EXCLUDE_DIRS, stat_ttl: float = 30):
+        self.root = os.path.abspath(root)
+        self.exclude_dirs = set(exclude_dirs)
+        self.stat_ttl = stat_ttl
+        # relative dir -> (dir mtime_ns, listed at, files, subdirs)
+        self._dirs: Dict[str, Tuple[int, float, List[FileEntry], List[str]]] = {}
+        self._lock = threading.Lock()
+
+    def refresh(self) -> List[FileEntry]:
+        with self._lock:
+            now = time.time()
+            seen = set()
+            files: List[FileEntry] = []
+            stack = [""]
+            while stack:
+                rel_dir = stack.pop()
+                abs_dir = os.path.join(self.root, rel_dir)
+                try:
+                    mtime_ns = os.stat(abs_dir).st_mtime_ns
+                except OSError:
+                    continue
+                seen.add(rel_dir)
+                cached = self._dirs.get(rel_dir)
+                if cached is None or cached[0] != mtime_ns or now - cached[1] > self.stat_ttl:
+                    cached = self._list_dir(rel_dir, abs_dir, mtime_ns, now)
+                    self._dirs[rel_dir] = cached
+                files.extend(cached[2])
+                stack.extend(cached[3])
+            for rel_dir in set(self._dirs) - seen:
+                del self._dirs[rel_dir]
+        return sorted(files)
+
+    def _list_dir(self, rel_dir: str, abs_dir: str, mtime_ns: int, now: float):
+        files, subdirs = [], []
+        try:
+            with os.scandir(abs_dir) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in self.exclude_dirs:
+                                subdirs.append(os.path.join(rel_dir, entry.name))
+                        elif entry.is_file() and not entry.name.endswith(HIDDEN_SUFFIXES):
+                            stat = entry.stat()
+                            files.append(FileEntry(os.path.join(rel_dir, entry.name), stat.st_size, stat.st_mtime,
+                                                   detect_format(entry.name)))
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        return mtime_ns, now, files, subdirs
+
+    def summary(self, budget: int = 2000) -> str:
+        """A compact listing for prompts, e.g. `calls/sample_*.vcf.gz (240 files, 18 GB)`.
+
+        Names that only differ in numbers are grouped; when the listing is still longer than
+        `budget` characters, groups are merged per directory and format, largest first, then cut off.
+        """
+        files = self.refresh()
+        if not files:
+            return "(empty workspace)"
+        total = f"{len(files)} files, {human_size(sum(f.size for f in files))} in total"
+
+        groups = defaultdict(list)
+        for entry in files:
+            directory, name = os.path.split(entry.path)
+            groups[os.path.join(directory, re.sub(r"\d+", "*", name))].append(entry)
+        lines = [_group_line(pattern, entries) for pattern, entries in sorted(groups.items())]
+
+        if sum(len(line) + 1 for line in lines) > budget:
+            by_format = defaultdict(list)
+            for entry in files:
+                by_format[os.path.join(os.path.dirname(entry.path), f"*.{entry.format}")].append(entry)
+            # 放不下时优先列出占用空间最大的分组
+            ranked = sorted(by_format.items(), key=lambda item: -sum(entry.size for entry in item[1]))
+            lines = [_group_line(pattern, entries) for pattern, entries in ranked]
+
+        shown, used = [], len(total)
+        for line in lines:
+            if used + len(line) + 1 > budget:
+                shown.append(f"... {len(lines) - len(shown)} more groups")
+                break
+            shown.append(line)
+            used += len(line) + 1
+        return "\n".join([total] + shown)
+
+
+def _group_line(pattern: str, entries: List[FileEntry]) -> str:
+    size = human_size(sum(entry.size for entry in entries))
+    if len(entries) == 1:
+        return f"{entries[0].path} ({size})"
+    return f"{pattern} ({len(entries)} files, {size})"
+
+
+_manifests: "OrderedDict[str, WorkspaceManifest]" = OrderedDict()
+_manifests_lock = threading.Lock()
+
+
+def get_manifest(root: Optional[str] = None) -> WorkspaceManifest:
+    """Returns the shared manifest of `root`, so its cache survives between requests."""
+    root = os.path.abspath(root or ".")
+    with _manifests_lock:
+        manifest = _manifests.get(root)
+        if manifest is None:
+            manifest = _manifests[root] = WorkspaceManifest(root)
+            while len(_manifests) > 256:
+                _manifests.popitem(last=False)
+        _manifests.move_to_end(root)
+        return manifest
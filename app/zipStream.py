@@ -0,0 +1,88 @@
+import io
+import os
+import zipfile
+from typing import Iterable, Iterator, Tuple
+
+from workspaceManifest import DEFAULT_EXCLUDE_DIRS
+
+# 已压缩的格式直接存储，重复压缩只会浪费 CPU
+STORED_EXTENSIONS = {
+    ".gz", ".bgz", ".bz2", ".xz", ".zst", ".zip", ".7z",
+    ".bam", ".cram", ".bcf",
+    ".png", ".jpg", ".jpeg", ".gif", ".pdf",
+}
+
+
+class _ChunkSink(io.RawIOBase):
+    """A write-only, non-seekable file that collects what zipfile writes until drained."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def compress_type_for(path: str) -> int:
+    name = path.lower()
+    if any(name.endswith(ext) for ext in STORED_EXTENSIONS):
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def collect_files(root: str, paths: Iterable[str] = None,
+                  exclude_dirs: Iterable[str] = DEFAULT_EXCLUDE_DIRS) -> Iterator[Tuple[str, str]]:
+    """Yields (file path, archive name) for `paths` (files or directories) below `root`.
+
+    All files below `root` are yielded when `paths` is empty. Directories named in
+    `exclude_dirs` are skipped; by default these are the directories the app itself creates
+    in a workspace (uploads in progress, shell and job logs).
+    """
+    exclude_dirs = set(exclude_dirs)
+    for path in paths or [root]:
+        if os.path.isdir(path):
+            for dirpath, dirnames, files in os.walk(path):
+                dirnames[:] = [name for name in dirnames if name not in exclude_dirs]
+                for file in sorted(files):
+                    file_path = os.path.join(dirpath, file)
+                    yield file_path, os.path.relpath(file_path, start=root)
+        elif os.path.isfile(path):
+            yield path, os.path.relpath(path, start=root)
+
+
+def iter_zip(files: Iterable[Tuple[str, str]], chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+    """Streams a ZIP archive of `files` chunk by chunk, so memory use does not grow with it."""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", allowZip64=True) as zip_file:
+        for file_path, arcname in files:
+            zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+            zinfo.compress_type = compress_type_for(file_path)
+            with open(file_path, "rb") as src, zip_file.open(
+                zinfo, "w", force_zip64=zinfo.file_size > zipfile.ZIP64_LIMIT
+            ) as dst:
+                while True:
+                    chunk = src.read(chunk_size)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            data = sink.drain()
+            if data:
+                yield data
+    yield sink.drain()
@@ -0,0 +1,310 @@
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+
+class ScriptedResponder:
+    """Picks the reply of the mock LLM by matching substrings of the request's messages.
+
+    `rules` are (pattern, reply) pairs tried in order against the text of all messages;
+    the first match wins. A reply may be a string or a callable
+    receiving the request body. `from_file` loads recorded replies from a JSONL file with
+    `{"match": ..., "response": ...}` lines.
+    """
+
+    def __init__(self, rules: List[Tuple[str, object]], default: str = "OK"):
+        self.rules = list(rules)
+        self.default = default
+
+    @classmethod
+    def from_file(cls, path: str, default: str = "OK") -> "ScriptedResponder":
+        rules = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    rules.append((record["match"], record["response"]))
+        return cls(rules, default)
+
+    def agent(self, body: dict) -> str:
+        """A short label of the calling agent for the statistics: the matched pattern."""
+        for pattern, _ in self.rules:
+            if pattern in _text(body):
+                return pattern[:40]
+        return "default"
+
+    def __call__(self, body: dict) -> str:
+        text = _text(body)
+        for pattern, reply in self.rules:
+            if pattern in text:
+                return reply(body) if callable(reply) else reply
+        return self.default
+
+
+def _text(body: dict) -> str:
+    parts = []
+    for message in body.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        parts.append(str(content or ""))
+    return "\n".join(parts)
+
+
+class _Server:
+    def __init__(self, handler, host: str = "127.0.0.1", port: int = 0):
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.httpd.owner = self
+        self.host, self.port = self.httpd.server_address[:2]
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self) -> "_Server":
+        threading.Thread(target=self.httpd.serve_forever, name=type(self).__name__, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _LLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_POST(self) -> None:
+        server: MockLLMServer = self.server.owner
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        started = time.perf_counter()
+        reply = server.responder(body)
+        time.sleep(server.latency)
+        if body.get("stream"):
+            self._stream(server, body, reply)
+        else:
+            self._complete(body, reply)
+        server.record(server.responder.agent(body) if isinstance(server.responder, ScriptedResponder) else "default",
+                      time.perf_counter() - started, len(reply))
+
+    def _complete(self, body: dict, reply: str) -> None:
+        payload = json.dumps({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+            "usage": _usage(body, reply),
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _stream(self, server: "MockLLMServer", body: dict, reply: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+        def send(choices, usage=None):
+            event = {"id": chunk_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": body.get("model", "mock"), "choices": choices}
+            if usage is not None:
+                event["usage"] = usage
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+            self.wfile.flush()
+
+        # 按词切分后逐块发送，token_latency 模拟生成速度
+        for token in re.findall(r"\S+\s*|\s+", reply):
+            send([{"index": 0, "delta": {"role": "assistant", "content": token}, "finish_reason": None}])
+            if server.token_latency:
+                time.sleep(server.token_latency)
+        send([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if (body.get("stream_options") or {}).get("include_usage"):
+            send([], usage=_usage(body, reply))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+def _usage(body: dict, reply: str) -> dict:
+    # 约 4 个字符一个 token，只用于统计
+    prompt_tokens = len(_text(body)) // 4
+    completion_tokens = len(reply) // 4
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+class MockLLMServer(_Server):
+    """A local OpenAI-compatible `/chat/completions` endpoint with scripted replies.
+
+    Every call waits `latency` seconds before answering; streamed replies additionally wait
+    `token_latency` seconds per word. Calls and the time spent answering them are counted
+    per agent, so a benchmark can subtract the simulated model time from its measurements.
+    """
+
+    def __init__(self, responder: Callable[[dict], str], latency: float = 0.2, token_latency: float = 0.0,
+                 host: str = "127.0.0.1", port: int = 0):
+        super().__init__(_LLMHandler, host, port)
+        self.responder = responder
+        self.latency = latency
+        self.token_latency = token_latency
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, agent: str, seconds: float, characters: int) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(agent, {"calls": 0, "seconds": 0.0, "characters": 0})
+            stats["calls"] += 1
+            stats["seconds"] += seconds
+            stats["characters"] += characters
+
+    def stats(self, reset: bool = False) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            stats = {agent: dict(values) for agent, values in self._stats.items()}
+            if reset:
+                self._stats = {}
+        return stats
+
+
+def synthetic_papers(query: str, count: int) -> List[dict]:
+    """Deterministic fake papers whose titles and abstracts mention the query words."""
+    words = re.findall(r"\w+", query.lower()) or ["topic"]
+    return [
+        {
+            "id": f"{2400 + index // 100}.{index % 100:05d}",
+            "title": f"{' '.join(words).title()} study {index}",
+            "summary": f"We investigate {' '.join(words)} with method {index}. " * 8,
+            "doi": f"10.5555/mock.{index}",
+        }
+        for index in range(count)
+    ]
+
+
+class _LiteratureHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        server: MockLiteratureServer = self.server.owner
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        time.sleep(server.latency)
+        if url.path.startswith("/arxiv"):
+            body, content_type = self._arxiv(server, params), "application/atom+xml"
+        elif url.path.endswith("/esearch.fcgi"):
+            count = min(int(params.get("retmax", 10)), server.papers)
+            server.last_query = params.get("term", "topic")
+            ids = [str(1000 + index) for index in range(count)]
+            body, content_type = json.dumps({"esearchresult": {"idlist": ids}}), "application/json"
+        elif url.path.endswith("/efetch.fcgi"):
+            body, content_type = self._pubmed(server, params), "text/xml"
+        else:
+            self.send_error(404)
+            return
+        data = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    @staticmethod
+    def _arxiv(server: "MockLiteratureServer", params: dict) -> str:
+        query = " ".join(re.findall(r"all:(\S+)", params.get("search_query", "")))
+        papers = synthetic_papers(query, min(int(params.get("max_results", 10)), server.papers))
+        entries = "".join(
+            f"<entry><id>http://arxiv.org/abs/{paper['id']}v1</id><published>2024-01-01T00:00:00Z</published>"
+            f"<title>{paper['title']}</title><summary>{paper['summary']}</summary>"
+            f"<arxiv:doi>{paper['doi']}</arxiv:doi></entry>"
+            for paper in papers
+        )
+        return ('<feed xmlns="http://www.w3.org/2005/Atom" xmlns:arxiv="http://arxiv.org/schemas/atom">'
+                f"{entries}</feed>")
+
+    @staticmethod
+    def _pubmed(server: "MockLiteratureServer", params: dict) -> str:
+        ids = [pmid for pmid in params.get("id", "").split(",") if pmid]
+        # 与 arXiv 错开半数，约一半记录两边都有
+        shift = len(ids) // 2
+        papers = synthetic_papers(server.last_query, shift + len(ids))[shift:]
+        articles = "".join(
+            f"<PubmedArticle><MedlineCitation><PMID>{pmid}</PMID><Article><ArticleTitle>{paper['title']} (PubMed)"
+            f"</ArticleTitle><Abstract><AbstractText>{paper['summary']}</AbstractText></Abstract></Article>"
+            f"</MedlineCitation><PubmedData><ArticleIdList><ArticleId IdType=\"doi\">{paper['doi']}</ArticleId>"
+            f"</ArticleIdList></PubmedData></PubmedArticle>"
+            for pmid, paper in zip(ids, papers)
+        )
+        return f"<PubmedArticleSet>{articles}</PubmedArticleSet>"
+
+
+class MockLiteratureServer(_Server):
+    """Stub arXiv (`/arxiv`) and PubMed E-utilities (`/pubmed/esearch.fcgi`, `/pubmed/efetch.fcgi`).
+
+    Both return up to `papers` synthetic records after `latency` seconds. About half of the
+    DOIs appear in both sources, as with the real services, so merging is exercised.
+    """
+
+    def __init__(self, papers: int = 20, latency: float = 0.3, host: str = "127.0.0.1", port: int = 0):
+        super().__init__(_LiteratureHandler, host, port)
+        self.papers = papers
+        self.latency = latency
+        # efetch 只带 ID，沿用最近一次检索的主题生成标题
+        self.last_query = "topic"
+
+    @property
+    def arxiv_url(self) -> str:
+        return f"{self.url}/arxiv"
+
+    @property
+    def pubmed_url(self) -> str:
+        return f"{self.url}/pubmed"
+
+
+def start_servers(responder: Callable[[dict], str], llm_latency: float = 0.2, token_latency: float = 0.0,
+                  search_latency: float = 0.3, papers: int = 20) -> Tuple[MockLLMServer, MockLiteratureServer]:
+    return (MockLLMServer(responder, llm_latency, token_latency).start(),
+            MockLiteratureServer(papers, search_latency).start())
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Runs the mock servers in the foreground, e.g. to point a development server at them."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--llm-port", type=int, default=8700)
+    parser.add_argument("--search-port", type=int, default=8701)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before every LLM reply")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="seconds per streamed word")
+    parser.add_argument("--search-latency", type=float, default=0.3)
+    parser.add_argument("--responses", help="JSONL file of recorded {\"match\", \"response\"} pairs")
+    args = parser.parse_args(argv)
+
+    responder = ScriptedResponder.from_file(args.responses) if args.responses else ScriptedResponder([])
+    llm = MockLLMServer(responder, args.latency, args.token_latency, port=args.llm_port).start()
+    literature = MockLiteratureServer(latency=args.search_latency, port=args.search_port).start()
+    print(f"DEEPSEEK_BASE_URL={llm.url}")
+    print(f"ARXIV_API_URL={literature.arxiv_url}")
+    print(f"PUBMED_API_URL={literature.pubmed_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""Offline end-to-end benchmarks of the orchestration layer.
+
+DeepSeek, arXiv and PubMed are replaced by the local stubs in mockServers.py, so the numbers
+measure our own overhead (planning glue, task scheduling, search, storage, uploads) with a
+fixed, configurable model latency instead of network noise. Every scenario runs in a fresh
+temporary Database/ProcessingSpace and reports per-stage latency, throughput and peak memory.
+
+    python benchmarks/runBenchmarks.py
+    python benchmarks/runBenchmarks.py --scenarios code_multi_task --tasks 16 --repeat 5 --json out.json
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from typing import Callable, Dict, List
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(os.path.dirname(BENCHMARK_DIR), "app")
+sys.path.insert(0, BENCHMARK_DIR)
+
+from mockServers import ScriptedResponder, start_servers  # noqa: E402
+
+PLAN = "1. Inspect the input files.\n2. Compute summary statistics.\n3. Write the results to the workspace."
+
+
+def task_plan(count: int) -> str:
+    """A task splitter reply with `count` tasks: alternating Python and shell, every third one dependent."""
+    tasks = []
+    for index in range(1, count + 1):
+        if index % 2:
+            code = f"values = list(range(200000))\nwith open('result_{index}.txt', 'w') as f:\n    f.write(str(sum(values)))"
+            executor = "pythonExecutor"
+        else:
+            code = f"ls -la > listing_{index}.txt && wc -l listing_{index}.txt"
+            executor = "shellExecutor"
+        tasks.append({
+            "id": str(index),
+            "description": f"Benchmark task {index}",
+            "code_snippet": code,
+            "dependencies": executor,
+            "depends_on": [str(index - 1)] if index % 3 == 0 else [],
+            "separator": "|",
+        })
+    return json.dumps({"tasks": tasks})
+
+
+def responder(args) -> ScriptedResponder:
+    words = " ".join(f"finding{index}" for index in range(args.summary_words))
+    return ScriptedResponder([
+        ("converts user requests into the execute task list", PLAN),
+        ("converts user requests into executable tasks", task_plan(args.tasks)),
+        ("summarize its question, method and main findings", "Question, method and findings. " * 20),
+        ("combine them into one review", f"## Summary\n{words}\n"),
+        ("scrape the article", f"## Summary\n{words}\n"),
+    ])
+
+
+def timed_stream(responses, logs, markers: Dict[str, str]) -> Dict[str, float]:
+    """Consumes a workflow stream and returns the time at which each marker text first appeared.
+
+    Markers are looked up in the streamed content and in the log records written meanwhile,
+    the same way the /stream endpoint forwards them.
+    """
+    started = time.perf_counter()
+    seen = {"first_chunk": None}
+    cursor = 0
+    for response in responses:
+        now = time.perf_counter() - started
+        text = getattr(response, "content", None) or ""
+        if seen["first_chunk"] is None and text:
+            seen["first_chunk"] = now
+        records, cursor = logs.store.since(logs.session_id, cursor)
+        texts = [text] + [record["message"] for record in records]
+        for name, marker in markers.items():
+            if name not in seen and any(marker in item for item in texts):
+                seen[name] = now
+    seen["end"] = time.perf_counter() - started
+    return seen
+
+
+def stages_between(times: Dict[str, float], order: List[str]) -> Dict[str, float]:
+    """Turns marker times into stage durations; stages whose marker never appeared are skipped."""
+    stages, previous = {}, 0.0
+    for name in order:
+        if times.get(name) is not None:
+            stages[name] = times[name] - previous
+            previous = times[name]
+    return stages
+
+
+def paper_summary(ctx) -> dict:
+    from logStore import LogStore
+    from paperAI import PaperSummaryGenerator
+
+    workflow = PaperSummaryGenerator(session_id=str(uuid.uuid4()))
+    logs = LogStore().session_log("benchmark", "paperai")
+    # 每次使用新主题，避免命中摘要缓存
+    topic = f"crispr screens in cancer {uuid.uuid4().hex[:8]}"
+    # 日志 "Summarizing N papers..." 标志检索结束，最终摘要以 "##" 开头
+    times = timed_stream(workflow.run(logs, topic, use_cache=True, stream=True), logs,
+                         {"search": "Summarizing", "map": "##"})
+    stages = stages_between(times, ["search", "map", "end"])
+    stages["reduce"] = stages.pop("end")
+    return {
+        "stages": stages,
+        "metrics": {"first_summary_token_s": times.get("map") or times["first_chunk"]},
+    }
+
+
+def code_multi_task(ctx) -> dict:
+    from codeAI import CodeAIWorkflow
+    from logStore import LogStore
+
+    workspace = tempfile.mkdtemp(dir=ctx["tmp"])
+    workflow = CodeAIWorkflow(session_id=str(uuid.uuid4()), working_dir=workspace)
+    logs = LogStore().session_log("benchmark", "codeai")
+    times = timed_stream(
+        workflow.run(logs, "Compute statistics for every file", stream=True), logs,
+        {"plan": "Planning tasks", "split": "Executing"},
+    )
+    stages = stages_between(times, ["plan", "split", "end"])
+    stages["execute"] = stages.pop("end")
+    return {"stages": stages, "metrics": {"tasks_per_s": ctx["args"].tasks / stages["execute"]}}
+
+
+def large_workspace(ctx) -> dict:
+    from tools.fileChanged import FileTools
+    from workspaceManifest import WorkspaceManifest
+
+    args = ctx["args"]
+    root = tempfile.mkdtemp(dir=ctx["tmp"])
+    started = time.perf_counter()
+    for index in range(args.files):
+        directory = os.path.join(root, f"batch_{index % 50}")
+        os.makedirs(directory, exist_ok=True)
+        suffix = (".vcf.gz", ".fastq", ".bam", ".csv")[index % 4]
+        with open(os.path.join(directory, f"sample_{index}{suffix}"), "wb") as f:
+            f.write(b"x" * (index % 1024))
+    stages = {"create_files": time.perf_counter() - started}
+
+    manifest = WorkspaceManifest(root)
+    for stage, action in (
+        ("cold_refresh", manifest.refresh),
+        ("warm_refresh", manifest.refresh),
+        ("summary", manifest.summary),
+        ("list_files", lambda: FileTools(base_dir=root).list_files(summary=True)),
+    ):
+        started = time.perf_counter()
+        action()
+        stages[stage] = time.perf_counter() - started
+    return {"stages": stages, "metrics": {"files_per_s_cold": args.files / stages["cold_refresh"]}}
+
+
+def upload_download(ctx) -> dict:
+    import app as web
+
+    args = ctx["args"]
+    client = web.app.test_client()
+    client.get("/logs")
+    size = args.upload_mb * 1024 * 1024
+    chunk = os.urandom(1024 * 1024)
+
+    started = time.perf_counter()
+    upload = client.post("/upload/init", json={"filename": "reads.fastq", "size": size}).get_json()
+    chunk_size = upload["chunk_size"]
+    for index in range(upload["total_chunks"]):
+        length = min(chunk_size, size - index * chunk_size)
+        data = (chunk * (chunk_size // len(chunk) + 1))[:length]
+        response = client.put(f"/upload/{upload['upload_id']}/chunk/{index}", data=data)
+        assert response.status_code == 200, response.get_json()
+    assert client.post(f"/upload/{upload['upload_id']}/complete").status_code == 200
+    upload_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    response = client.get("/download", buffered=False)
+    downloaded = sum(len(block) for block in response.response)
+    download_seconds = time.perf_counter() - started
+    return {
+        "stages": {"upload": upload_seconds, "download": download_seconds},
+        "metrics": {
+            "upload_mb_per_s": args.upload_mb / upload_seconds,
+            "download_mb_per_s": downloaded / 1024 / 1024 / download_seconds,
+        },
+    }
+
+
+SCENARIOS: Dict[str, Callable[[dict], dict]] = {
+    "paper_summary": paper_summary,
+    "code_multi_task": code_multi_task,
+    "large_workspace": large_workspace,
+    "upload_download": upload_download,
+}
+
+
+def run_scenario(name: str, ctx: dict) -> dict:
+    llm = ctx["llm"]
+    llm.stats(reset=True)
+    if ctx["args"].trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    result = SCENARIOS[name](ctx)
+    result["total_s"] = time.perf_counter() - started
+    if ctx["args"].trace_memory:
+        result["peak_mb"] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+    llm_stats = llm.stats()
+    result["llm_calls"] = sum(stats["calls"] for stats in llm_stats.values())
+    result["llm_seconds"] = sum(stats["seconds"] for stats in llm_stats.values())
+    return result
+
+
+def aggregate(runs: List[dict]) -> dict:
+    def describe(values):
+        return {"median": statistics.median(values), "min": min(values), "max": max(values)}
+
+    summary = {"runs": len(runs), "total_s": describe([run["total_s"] for run in runs])}
+    for key in ("stages", "metrics"):
+        names = list(dict.fromkeys(name for run in runs for name in run[key]))
+        summary[key] = {name: describe([run[key][name] for run in runs if run[key].get(name) is not None])
+                        for name in names}
+    for key in ("peak_mb", "llm_calls", "llm_seconds"):
+        if key in runs[0]:
+            summary[key] = describe([run[key] for run in runs])
+    return summary
+
+
+def print_report(results: Dict[str, dict]) -> None:
+    for name, summary in results.items():
+        total = summary["total_s"]
+        print(f"\n{name} ({summary['runs']} runs)  total {total['median']:.3f}s "
+              f"[{total['min']:.3f}-{total['max']:.3f}]")
+        for stage, values in summary["stages"].items():
+            print(f"  {stage:<24} {values['median']:>9.3f}s  [{values['min']:.3f}-{values['max']:.3f}]")
+        for metric, values in summary["metrics"].items():
+            print(f"  {metric:<24} {values['median']:>10.2f}")
+        if "peak_mb" in summary:
+            print(f"  {'peak python memory':<24} {summary['peak_mb']['median']:>8.1f} MB")
+        print(f"  {'mock llm calls':<24} {summary['llm_calls']['median']:>10.0f}  "
+              f"({summary['llm_seconds']['median']:.2f}s simulated)")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds before every mock LLM reply")
+    parser.add_argument("--token-latency", type=float, default=0.002, help="seconds per streamed word")
+    parser.add_argument("--search-latency", type=float, default=0.3, help="seconds per arXiv/PubMed request")
+    parser.add_argument("--papers", type=int, default=20, help="papers returned by each literature stub")
+    parser.add_argument("--summary-words", type=int, default=400, help="length of the final summary")
+    parser.add_argument("--tasks", type=int, default=8, help="tasks in the multi-task plan")
+    parser.add_argument("--files", type=int, default=20000, help="files in the large workspace")
+    parser.add_argument("--upload-mb", type=int, default=256, help="size of the uploaded file")
+    parser.add_argument("--no-trace-memory", dest="trace_memory", action="store_false",
+                        help="skip tracemalloc, which slows Python-heavy stages down")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary directory")
+    args = parser.parse_args(argv)
+
+    tmp = tempfile.mkdtemp(prefix="infinity-bench-")
+    llm, literature = start_servers(responder(args), args.llm_latency, args.token_latency,
+                                    args.search_latency, args.papers)
+    # config.py 在导入时读取环境变量，必须在导入 app 模块之前设置
+    os.environ.update({
+        "DEEPSEEK_API_KEY": "benchmark",
+        "DEEPSEEK_BASE_URL": llm.url,
+        "ARXIV_API_URL": literature.arxiv_url,
+        "PUBMED_API_URL": literature.pubmed_url,
+        "DATABASE_DIR": os.path.join(tmp, "Database"),
+        "PROCESSING_SPACE_DIR": os.path.join(tmp, "ProcessingSpace"),
+        "AUTO_INDEX": "0",
+    })
+    sys.path.insert(0, APP_DIR)
+    # 先导入一次，模块加载与全局对象的初始化不计入第一轮
+    import app  # noqa: F401
+    from phi.utils.log import logger
+    logger.setLevel(logging.WARNING)
+    ctx = {"args": args, "llm": llm, "literature": literature, "tmp": tmp}
+
+    results = {}
+    try:
+        for name in args.scenarios:
+            runs = []
+            for attempt in range(args.repeat):
+                runs.append(run_scenario(name, ctx))
+                print(f"{name} run {attempt + 1}/{args.repeat}: {runs[-1]['total_s']:.3f}s", file=sys.stderr)
+            results[name] = aggregate(runs)
+    finally:
+        llm.stop()
+        literature.stop()
+        if not args.keep:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    print_report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"settings": vars(args), "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
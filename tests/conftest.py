@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# 应用模块之间以顶层模块名互相导入（如 from config import ...），测试时同样把 app/ 加入路径
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+# config 在导入时读取这些目录，测试产生的数据库和工作目录不能写进仓库
+_TEST_ROOT = tempfile.mkdtemp(prefix="infinity-tests-")
+os.environ.setdefault("DATABASE_DIR", os.path.join(_TEST_ROOT, "Database"))
+os.environ.setdefault("PROCESSING_SPACE_DIR", os.path.join(_TEST_ROOT, "ProcessingSpace"))
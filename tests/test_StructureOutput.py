@@ -0,0 +1,23 @@
+from StructureOutput import build_task_graph, task
+
+
+def make_task(task_id, depends_on=()):
+    return task(id=task_id, description=f"task {task_id}", depends_on=list(depends_on), separator="|")
+
+
+def test_tasks_without_dependencies_run_in_order():
+    assert build_task_graph([make_task("1"), make_task("2"), make_task("3")]) == [[], [0], [1]]
+
+
+def test_declared_dependencies():
+    tasks = [make_task("1"), make_task("2"), make_task("3", ["1", "2"]), make_task("4", ["1"])]
+    assert build_task_graph(tasks) == [[], [], [0, 1], [0]]
+
+
+def test_unknown_and_later_dependencies_are_ignored():
+    tasks = [make_task("1", ["2"]), make_task("2", ["1", "missing"]), make_task("3", ["3"])]
+    assert build_task_graph(tasks) == [[], [0], []]
+
+
+def test_plain_string_tasks_run_in_order():
+    assert build_task_graph(["ls", make_task("2", ["1"]), "pwd"]) == [[], [], [1]]
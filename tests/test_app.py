@@ -0,0 +1,44 @@
+import pytest
+
+
+@pytest.fixture
+def client(monkeypatch):
+    import app as webapp
+
+    submitted = []
+
+    def submit(command, cwd=None):
+        submitted.append(command)
+        return "job-1"
+
+    # 不真正运行后台任务，只检查哪些命令会被提交
+    monkeypatch.setattr(webapp.jobQueue, "submit", submit)
+    monkeypatch.setattr(webapp, "BACKGROUND_PROGRAMS", ["bwa", "samtools"])
+    webapp.app.config["TESTING"] = True
+    with webapp.app.test_client() as client:
+        client.submitted = submitted
+        yield client
+
+
+def test_submit_allowed_job(client):
+    response = client.post("/jobs", json={"command": "bwa index ref.fa && samtools faidx ref.fa"})
+    assert response.status_code == 202
+    assert response.get_json() == {"job_id": "job-1"}
+    assert client.submitted == ["bwa index ref.fa && samtools faidx ref.fa"]
+
+
+@pytest.mark.parametrize("command", [
+    "bwa index ref.fa\nrm -rf ~",
+    "bwa index ref.fa; rm -rf ~",
+    "bwa index $(rm -rf ~)",
+    "bwa index `rm -rf ~`",
+    "rm -rf ~",
+])
+def test_reject_disallowed_job(client, command):
+    response = client.post("/jobs", json={"command": command})
+    assert response.status_code == 403
+    assert client.submitted == []
+
+
+def test_submit_job_without_command(client):
+    assert client.post("/jobs", json={}).status_code == 400
@@ -0,0 +1,66 @@
+import hashlib
+import io
+
+import pytest
+
+from chunkUpload import ChunkedUploadStore, UploadError
+
+DATA = bytes(range(256)) * 40  # 10240 bytes, three chunks of 4096
+
+
+@pytest.fixture
+def store():
+    return ChunkedUploadStore(default_chunk_size=4096)
+
+
+def upload(store, workspace, chunks=None, **kwargs):
+    meta = store.create(workspace, "reads.fastq", len(DATA), **kwargs)
+    for index in range(meta["total_chunks"]) if chunks is None else chunks:
+        piece = DATA[index * 4096:(index + 1) * 4096]
+        store.write_chunk(workspace, meta["upload_id"], index, io.BytesIO(piece), hashlib.sha256(piece).hexdigest())
+    return meta["upload_id"]
+
+
+def test_complete_moves_file_in_place(store, tmp_path):
+    upload_id = upload(store, tmp_path)
+    result = store.complete(tmp_path, upload_id, sha256=hashlib.sha256(DATA).hexdigest())
+    assert result["sha256"] == hashlib.sha256(DATA).hexdigest()
+    assert tmp_path.joinpath("reads.fastq").read_bytes() == DATA
+
+
+def test_complete_reports_missing_chunks(store, tmp_path):
+    upload_id = upload(store, tmp_path, chunks=[0, 2])
+    with pytest.raises(UploadError, match=r"Missing chunks: \[1\]"):
+        store.complete(tmp_path, upload_id)
+
+
+def test_write_chunk_rejects_bad_checksum(store, tmp_path):
+    meta = store.create(tmp_path, "reads.fastq", len(DATA))
+    with pytest.raises(UploadError, match="Checksum mismatch"):
+        store.write_chunk(tmp_path, meta["upload_id"], 0, io.BytesIO(DATA[:4096]), "0" * 64)
+    assert store.status(tmp_path, meta["upload_id"])["received"] == []
+
+
+def test_complete_detects_damaged_chunk(store, tmp_path):
+    upload_id = upload(store, tmp_path)
+    part = tmp_path.joinpath(".uploads", upload_id, "data.part")
+    with open(part, "r+b") as f:
+        f.seek(4096 + 10)
+        f.write(b"\xff\xff")
+    with pytest.raises(UploadError, match=r"Damaged chunks: \[1\]"):
+        store.complete(tmp_path, upload_id)
+    # 损坏分片的记录被删除，续传时会重新发送
+    assert store.status(tmp_path, upload_id)["received"] == [0, 2]
+
+
+def test_complete_checks_file_checksum(store, tmp_path):
+    upload_id = upload(store, tmp_path, sha256="0" * 64)
+    with pytest.raises(UploadError, match="File checksum mismatch"):
+        store.complete(tmp_path, upload_id)
+    assert not tmp_path.joinpath("reads.fastq").exists()
+
+
+@pytest.mark.parametrize("size, chunk_size", [(-1, None), (10, -5), (2 * 1024 ** 4, None)])
+def test_create_rejects_invalid_sizes(store, tmp_path, size, chunk_size):
+    with pytest.raises(UploadError):
+        store.create(tmp_path, "reads.fastq", size, chunk_size=chunk_size)
@@ -0,0 +1,54 @@
+from logStore import LogStore
+
+
+def messages(records):
+    return [record["message"] for record in records]
+
+
+def test_since_returns_only_newer_records_of_the_session():
+    store = LogStore()
+    first = store.add("a", "one")
+    store.add("b", "other session")
+    store.add("a", "two")
+
+    records, cursor = store.since("a", 0)
+    assert messages(records) == ["one", "two"]
+    assert messages(store.since("a", first["cursor"])[0]) == ["two"]
+    # 游标已是最新时不返回记录，游标保持不变
+    assert store.since("a", cursor) == ([], cursor)
+
+
+def test_since_pages_with_limit():
+    store = LogStore()
+    for index in range(5):
+        store.add("a", str(index))
+    records, cursor = store.since("a", 0, limit=2)
+    assert messages(records) == ["0", "1"]
+    records, cursor = store.since("a", cursor, limit=2)
+    assert messages(records) == ["2", "3"]
+    assert messages(store.since("a", cursor)[0]) == ["4"]
+
+
+def test_since_reads_spilled_records(tmp_path):
+    store = LogStore(max_entries=2, spill_db=str(tmp_path / "logs.db"), spill_batch=1)
+    for index in range(5):
+        store.add("a", str(index))
+    assert messages(store.since("a", 0)[0]) == ["0", "1", "2", "3", "4"]
+
+
+def test_since_without_spill_drops_old_records():
+    store = LogStore(max_entries=2)
+    for index in range(5):
+        store.add("a", str(index))
+    assert messages(store.since("a", 0)[0]) == ["3", "4"]
+
+
+def test_cursor_continues_after_restart(tmp_path):
+    spill_db = str(tmp_path / "logs.db")
+    store = LogStore(max_entries=1, spill_db=spill_db, spill_batch=1)
+    spilled = store.add("a", "spilled")
+    store.add("a", "only in memory")
+    restarted = LogStore(spill_db=spill_db)
+    record = restarted.add("a", "after restart")
+    assert record["cursor"] == spilled["cursor"] + 1
+    assert messages(restarted.since("a", 0)[0]) == ["spilled", "after restart"]
@@ -0,0 +1,48 @@
+import pytest
+
+from tools.shellChanged import command_programs, is_allowed_command
+
+ALLOWED = ["bwa", "gatk", "samtools"]
+
+
+@pytest.mark.parametrize("command, programs", [
+    ("bwa index ref.fa", ["bwa"]),
+    ("bwa mem ref.fa r1.fq > out.sam 2>&1 && samtools sort out.sam", ["bwa", "samtools"]),
+    ("gatk HaplotypeCaller -I in.bam | bwa x; samtools index y &", ["gatk", "bwa", "samtools"]),
+    ("sudo nohup /usr/bin/bwa index ref.fa", ["bwa"]),
+    ("bwa index ref.fa\nrm -rf ~", ["bwa", "rm"]),
+    ("bwa index ref.fa\r\nrm -rf ~", ["bwa", "rm"]),
+    ("> out.txt rm -rf ~", ["rm"]),
+    ("'r'm -rf ~", ["rm"]),
+    ("bwa mem ref.fa <(rm -rf ~)", ["bwa", "rm"]),
+    ("bwa a#b; rm -rf ~", ["bwa", "rm"]),
+])
+def test_command_programs(command, programs):
+    assert command_programs(command) == programs
+
+
+def test_command_programs_unbalanced_quote():
+    with pytest.raises(ValueError):
+        command_programs("bwa index 'ref.fa")
+
+
+@pytest.mark.parametrize("command", [
+    "bwa index ref.fa",
+    "bwa mem ref.fa r1.fq > out.sam && samtools sort -o sorted.bam out.sam",
+])
+def test_allowed_commands(command):
+    assert is_allowed_command(command, ALLOWED)
+
+
+@pytest.mark.parametrize("command", [
+    "bwa index ref.fa\nrm -rf ~",
+    "bwa index ref.fa\rrm -rf ~",
+    "bwa index `rm -rf ~`",
+    "bwa index $(rm -rf ~)",
+    "bwa index ref.fa; rm -rf ~",
+    "> out.txt rm -rf ~",
+    "bwa index 'ref.fa",
+    "",
+])
+def test_rejected_commands(command):
+    assert not is_allowed_command(command, ALLOWED)